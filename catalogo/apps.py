@@ -20,3 +20,9 @@ from django.apps import AppConfig
 class CatalogoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalogo'
+
+    def ready(self):
+        # Registra las señales que mantienen la versión del catálogo
+        import catalogo.signals
+        # Aviso si la caché no se comparte entre procesos
+        import catalogo.checks
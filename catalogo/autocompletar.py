@@ -0,0 +1,294 @@
+"""
+Autocompletado (typeahead) de título, autor y editorial.
+
+Índice en memoria por proceso: para cada tipo una lista ordenada de claves
+plegadas (catalogo/normalizacion.plegar_texto) y se busca el prefijo con
+bisect, sin tocar la BD. Cada título/autor se indexa completo y desde cada
+palabra ("García Márquez" -> "garcia marquez", "marquez").
+
+Además de la lista de todo el catálogo (ADMIN / CONSULTOR) hay una por
+editorial, con las mismas claves: la búsqueda de un editor recorre solo las
+de sus editoriales y no tiene que saltarse las entradas de las demás.
+
+Actualización:
+- El índice nunca se construye dentro de un request: la primera vez se
+  lanza en un hilo al llegar el primer request del proceso (request_started,
+  ver catalogo/signals.py) y mientras tanto las consultas responden vacío.
+- Los cambios hechos en este proceso se aplican al momento (señales en
+  catalogo/signals.py -> aplicar_ficha / aplicar_editorial) y el índice
+  adopta la versión que dejó su bump_version(), así que no se reconstruye
+  por ellos. Si llegan durante una reconstrucción se repiten sobre el índice
+  nuevo antes de reemplazar el anterior.
+- Los de otros procesos y las operaciones masivas (bulk_create/bulk_update,
+  que no emiten post_save) se detectan por la versión del catálogo
+  (catalogo/versiones.py): si cambió, se reconstruye en un hilo aparte y
+  mientras tanto se sigue respondiendo con el índice anterior. Como mucho una
+  reconstrucción cada AUTOCOMPLETAR_REFRESCO segundos.
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .normalizacion import plegar_texto
+from .versiones import get_version
+
+log = logging.getLogger(__name__)
+
+TITULO = "titulo"
+AUTOR = "autor"
+EDITORIAL = "editorial"
+TIPOS = (TITULO, AUTOR, EDITORIAL)
+
+MIN_PALABRA = 3    # palabras más cortas no generan entrada propia
+
+
+def _claves(texto: str) -> list[str]:
+    """Clave completa + una por cada palabra siguiente (sin repetir)."""
+    plegado = plegar_texto(texto)
+    if not plegado:
+        return []
+    claves = [plegado]
+    palabras = plegado.split(" ")
+    for i in range(1, len(palabras)):
+        if len(palabras[i]) >= MIN_PALABRA:
+            claves.append(" ".join(palabras[i:]))
+    return list(dict.fromkeys(claves))
+
+
+class _Lista:
+    """Claves ordenadas + datos paralelos (valor mostrado, editorial_id)."""
+
+    def __init__(self, entradas=()):
+        entradas = sorted(entradas)
+        self.claves = [e[0] for e in entradas]
+        self.datos = [(e[1], e[2]) for e in entradas]
+
+    def agregar(self, valor: str, editorial_id) -> None:
+        for clave in _claves(valor):
+            i = bisect.bisect_right(self.claves, clave)
+            self.claves.insert(i, clave)
+            self.datos.insert(i, (valor, editorial_id))
+
+    def quitar(self, valor: str, editorial_id) -> None:
+        for clave in _claves(valor):
+            i = bisect.bisect_left(self.claves, clave)
+            while i < len(self.claves) and self.claves[i] == clave:
+                if self.datos[i] == (valor, editorial_id):
+                    del self.claves[i]
+                    del self.datos[i]
+                    break
+                i += 1
+
+    def recorrer(self, prefijo: str):
+        """(clave, valor) de las entradas que empiezan con `prefijo`, en orden."""
+        i = bisect.bisect_left(self.claves, prefijo)
+        while i < len(self.claves) and self.claves[i].startswith(prefijo):
+            yield self.claves[i], self.datos[i][0]
+            i += 1
+
+
+def _primeros(entradas, limite: int) -> list[str]:
+    """Hasta `limite` valores distintos de un iterable de (clave, valor)."""
+    vistos = {}
+    for _, valor in entradas:
+        vistos.setdefault(valor, None)
+        if len(vistos) >= limite:
+            break
+    return list(vistos)
+
+
+class IndiceAutocompletar:
+
+    def __init__(self, fichas=(), editoriales=()):
+        """fichas: (id, titulo, autor, editorial_id); editoriales: (id, nombre)."""
+        self.fichas = {}
+        entradas = {tipo: {} for tipo in TIPOS}  # tipo -> {editorial_id: [(clave, valor, editorial_id)]}
+        for ficha_id, titulo, autor, ed_id in fichas:
+            self.fichas[ficha_id] = (titulo, autor, ed_id)
+            entradas[TITULO].setdefault(ed_id, []).extend((c, titulo, ed_id) for c in _claves(titulo))
+            entradas[AUTOR].setdefault(ed_id, []).extend((c, autor, ed_id) for c in _claves(autor))
+        self.editoriales = {}
+        for ed_id, nombre in editoriales:
+            self.editoriales[ed_id] = nombre
+            entradas[EDITORIAL].setdefault(ed_id, []).extend((c, nombre, ed_id) for c in _claves(nombre))
+        # La lista global y las por editorial comparten las claves (mismos str)
+        self.listas = {tipo: _Lista(e for lista in por_ed.values() for e in lista) for tipo, por_ed in entradas.items()}
+        self.por_editorial = {tipo: {ed_id: _Lista(lista) for ed_id, lista in por_ed.items()}
+                              for tipo, por_ed in entradas.items()}
+        self.lock = threading.Lock()
+
+    def _agregar(self, tipo: str, valor: str, ed_id) -> None:
+        self.listas[tipo].agregar(valor, ed_id)
+        self.por_editorial[tipo].setdefault(ed_id, _Lista()).agregar(valor, ed_id)
+
+    def _quitar(self, tipo: str, valor: str, ed_id) -> None:
+        self.listas[tipo].quitar(valor, ed_id)
+        lista = self.por_editorial[tipo].get(ed_id)
+        if lista is not None:
+            lista.quitar(valor, ed_id)
+
+    @classmethod
+    def desde_bd(cls):
+        from roles.models import Editorial
+        from .models import LibroFicha
+
+        fichas = LibroFicha.objects.order_by().values_list("id", "titulo", "autor", "editorial_id").iterator(chunk_size=5000)
+        editoriales = Editorial.objects.order_by().values_list("id", "nombre")
+        return cls(fichas, editoriales)
+
+    def aplicar_ficha(self, ficha_id, datos) -> None:
+        """datos = (titulo, autor, editorial_id), o None si la ficha se borró."""
+        with self.lock:
+            anterior = self.fichas.pop(ficha_id, None)
+            if anterior:
+                titulo, autor, ed_id = anterior
+                self._quitar(TITULO, titulo, ed_id)
+                self._quitar(AUTOR, autor, ed_id)
+            if datos:
+                titulo, autor, ed_id = datos
+                self.fichas[ficha_id] = datos
+                self._agregar(TITULO, titulo, ed_id)
+                self._agregar(AUTOR, autor, ed_id)
+
+    def aplicar_editorial(self, ed_id, nombre) -> None:
+        """nombre = None si la editorial se borró."""
+        with self.lock:
+            anterior = self.editoriales.pop(ed_id, None)
+            if anterior:
+                self._quitar(EDITORIAL, anterior, ed_id)
+            if nombre:
+                self.editoriales[ed_id] = nombre
+                self._agregar(EDITORIAL, nombre, ed_id)
+
+    def buscar(self, texto: str, tipos=TIPOS, editoriales=None, limite: int = 10) -> list[dict]:
+        """
+        Hasta `limite` sugerencias por tipo cuyo texto (o alguna palabra)
+        empieza con `texto`. editoriales=None -> sin restricción de scope;
+        si no, se mezclan (en orden de clave) las listas de esas editoriales.
+        """
+        prefijo = plegar_texto(texto)
+        if not prefijo:
+            return []
+        resultados = []
+        with self.lock:
+            for tipo in tipos:
+                if editoriales is None:
+                    entradas = self.listas[tipo].recorrer(prefijo)
+                else:
+                    listas = [self.por_editorial[tipo].get(ed_id) for ed_id in editoriales]
+                    entradas = heapq.merge(*(lista.recorrer(prefijo) for lista in listas if lista is not None))
+                for valor in _primeros(entradas, limite):
+                    resultados.append({"tipo": tipo, "valor": valor})
+        return resultados
+
+
+# -----------------------------------------------
+# Índice del proceso
+# -----------------------------------------------
+
+_indice: IndiceAutocompletar | None = None
+_version = None        # versión del catálogo que refleja el índice (con los cambios locales)
+_construido_en = 0.0   # time.monotonic() de la última reconstrucción
+_construyendo = threading.Lock()
+_estado = threading.Lock()  # protege _indice, _version y _pendientes
+_pendientes = None     # cambios locales aplicados durante una reconstrucción
+
+
+def _reconstruir() -> None:
+    """
+    Lee el catálogo y reemplaza el índice. Los cambios locales que llegan
+    mientras tanto se anotan en _pendientes y se vuelven a aplicar sobre el
+    índice nuevo antes del reemplazo (aplicarlos dos veces no cambia nada).
+    """
+    global _indice, _version, _construido_en, _pendientes
+    with _estado:
+        _pendientes = []
+    try:
+        version = get_version()
+        nuevo = IndiceAutocompletar.desde_bd()
+        actual = get_version()
+        with _estado:
+            fichas = 0
+            for metodo, args in _pendientes:
+                getattr(nuevo, metodo)(*args)
+                fichas += metodo == "aplicar_ficha"
+            # Si los únicos incrementos desde la lectura son los de esos
+            # cambios, el índice nuevo ya está al día con `actual`
+            _indice = nuevo
+            _version = actual if actual == version + fichas else version
+            _construido_en = time.monotonic()
+    finally:
+        with _estado:
+            _pendientes = None
+
+
+def _reconstruir_en_hilo() -> None:
+    try:
+        _reconstruir()
+    except Exception:
+        log.exception("No se pudo reconstruir el índice de autocompletado")
+    finally:
+        connection.close()  # el hilo abrió su propia conexión
+        _construyendo.release()
+
+
+def _lanzar() -> None:
+    """Reconstruye en un hilo, salvo que ya haya uno trabajando."""
+    if _construyendo.acquire(blocking=False):
+        threading.Thread(target=_reconstruir_en_hilo, daemon=True).start()
+
+
+def precalentar(**kwargs) -> None:
+    """Receptor de request_started: lanza la primera construcción del proceso."""
+    if _indice is None:
+        _lanzar()
+
+
+def get_indice() -> IndiceAutocompletar | None:
+    """
+    Índice actual, o None mientras se construye el primero (en un hilo).
+    Si cambió la versión del catálogo se reconstruye en segundo plano.
+    """
+    if _indice is None:
+        _lanzar()
+        return None
+
+    refresco = getattr(settings, "AUTOCOMPLETAR_REFRESCO", 60)
+    if _version != get_version() and time.monotonic() - _construido_en >= refresco:
+        _lanzar()
+    return _indice
+
+
+def _aplicar(metodo: str, args, version=None) -> None:
+    global _version
+    with _estado:
+        if _pendientes is not None:
+            _pendientes.append((metodo, args))
+        if _indice is None:
+            return
+        getattr(_indice, metodo)(*args)
+        # El cambio ya está en el índice: su incremento de versión no debe
+        # provocar una reconstrucción (sí los de otros procesos o masivos)
+        if version is not None and _version is not None and version == _version + 1:
+            _version = version
+
+
+def aplicar_ficha(ficha_id, datos) -> None:
+    """
+    Alta/edición (datos) o baja (None) confirmada en este proceso. Se llama
+    después del bump_version() del mismo cambio (catalogo/signals.py).
+    """
+    if _indice is None and _pendientes is None:
+        return
+    _aplicar("aplicar_ficha", (ficha_id, datos), get_version())
+
+
+def aplicar_editorial(ed_id, nombre) -> None:
+    if _indice is None and _pendientes is None:
+        return
+    _aplicar("aplicar_editorial", (ed_id, nombre))
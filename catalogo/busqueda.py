@@ -0,0 +1,229 @@
+"""
+Búsqueda de texto completo sobre LibroFicha (titulo, subtitulo, autor, resumen_libro).
+
+`icontains` se traduce en LIKE '%texto%', que recorre toda la tabla aunque
+titulo/autor tengan índice. Aquí se usa el motor de texto completo de la base:
+
+- MySQL (producción): índice FULLTEXT + MATCH ... AGAINST en modo booleano.
+- SQLite (local / tests): tabla virtual FTS5 external-content, con bm25().
+- Otros motores (o si FTS5 no está compilado): OR de icontains, sin ranking.
+
+En ambos motores el índice se mantiene solo: InnoDB actualiza el FULLTEXT en
+cada INSERT/UPDATE/DELETE y en SQLite lo hacen triggers sobre la tabla, así que
+save(), bulk_create() y los update() masivos quedan sincronizados sin código
+extra. Las estructuras se crean en post_migrate (ver catalogo/signals.py).
+
+El backend se elige por vendor o con settings.CATALOGO_BUSQUEDA_BACKEND
+(ruta a una clase con la misma interfaz).
+
+Con la búsqueda por subcadena (trigramas) los dos conjuntos de candidatos se
+calculan por separado y se juntan con UNION: un OR entre MATCH y el
+`id IN (...)` de los trigramas impide que el motor use cualquiera de los dos
+índices y termina recorriendo la tabla.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Q, FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .normalizacion import plegar_texto
+
+log = logging.getLogger(__name__)
+
+TABLA = "catalogo_libroficha"
+COLUMNAS = ("titulo", "subtitulo", "autor", "resumen_libro")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokens(texto: str) -> list[str]:
+    """Palabras del texto, sin operadores del lenguaje de consulta."""
+    return _TOKEN_RE.findall(texto or "")
+
+
+# alias de BD -> ¿existe el índice? (se consulta una vez por proceso)
+_DISPONIBLE: dict[str, bool] = {}
+
+
+class BusquedaBase:
+    """
+    Fallback sin índice: substring sobre las mismas columnas, relevancia 0.
+    Título y autor se comparan contra sus claves plegadas (sin tildes).
+    """
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    def instalar(self) -> None:
+        pass
+
+    def existe(self) -> bool:
+        return True
+
+    def disponible(self) -> bool:
+        if self.alias not in _DISPONIBLE:
+            try:
+                _DISPONIBLE[self.alias] = self.existe()
+            except DatabaseError:
+                _DISPONIBLE[self.alias] = False
+        return _DISPONIBLE[self.alias]
+
+    @staticmethod
+    def _candidatos(qs, sql: str, params, ademas: Q):
+        """
+        qs filtrado a los ids que devuelve `sql` (la búsqueda de texto) o que
+        cumplen `ademas`: cada conjunto en su propio SELECT, unidos con UNION.
+        """
+        params = tuple(params)
+        if ademas:
+            otros = qs.model._base_manager.using(qs.db).order_by().filter(ademas).values("id")
+            sql_otros, params_otros = otros.query.get_compiler(using=qs.db).as_sql()
+            sql, params = f"{sql} UNION {sql_otros}", params + tuple(params_otros)
+        return qs.filter(id__in=RawSQL(sql, params))
+
+    def filtrar(self, qs, texto: str, ademas: Q = Q()):
+        """
+        Filtra por texto y anota 'relevancia'. `ademas` es una condición
+        que también basta para incluir la fila (p. ej. la búsqueda por subcadena).
+        """
+        plegado = plegar_texto(texto)
+        cond = (Q(titulo_busqueda__contains=plegado) | Q(autor_busqueda__contains=plegado)
+                | Q(subtitulo__icontains=texto) | Q(resumen_libro__icontains=texto))
+        if ademas:
+            texto_ids = qs.model._base_manager.using(qs.db).order_by().filter(cond).values("id")
+            qs = self._candidatos(qs, *texto_ids.query.get_compiler(using=qs.db).as_sql(), ademas)
+        else:
+            qs = qs.filter(cond)
+        return qs.annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+
+class BusquedaMySQL(BusquedaBase):
+    INDICE = "ft_libroficha_texto"
+    MIN_TOKEN = 3  # innodb_ft_min_token_size por defecto
+
+    def existe(self) -> bool:
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+                [TABLA, self.INDICE],
+            )
+            return bool(cursor.fetchone()[0])
+
+    def instalar(self) -> None:
+        if self.existe():
+            return
+        with connections[self.alias].cursor() as cursor:
+            cols = ", ".join(COLUMNAS)
+            cursor.execute(f"ALTER TABLE {TABLA} ADD FULLTEXT INDEX {self.INDICE} ({cols})")
+
+    def filtrar(self, qs, texto: str, ademas: Q = Q()):
+        tokens = [t for t in _tokens(texto) if len(t) >= self.MIN_TOKEN]
+        if not tokens:
+            # Palabras demasiado cortas para el índice: búsqueda clásica
+            return super().filtrar(qs, texto, ademas)
+        # Todas las palabras obligatorias (+) y como prefijo (*)
+        consulta = " ".join(f"+{t}*" for t in tokens)
+        cols = ", ".join(f"{TABLA}.{c}" for c in COLUMNAS)
+        match = RawSQL(f"MATCH ({cols}) AGAINST (%s IN BOOLEAN MODE)", [consulta], output_field=FloatField())
+        if not ademas:
+            return qs.annotate(relevancia=match).filter(relevancia__gt=0)
+        # MATCH en su propio SELECT usa el FULLTEXT; la relevancia se calcula
+        # solo para las filas que quedan (0 si entraron por `ademas`)
+        sql = f"SELECT id FROM {TABLA} WHERE MATCH ({cols}) AGAINST (%s IN BOOLEAN MODE)"
+        return self._candidatos(qs, sql, [consulta], ademas).annotate(relevancia=match)
+
+
+class BusquedaSQLite(BusquedaBase):
+    FTS = f"{TABLA}_fts"
+
+    def existe(self) -> bool:
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.FTS])
+            return cursor.fetchone() is not None
+
+    def instalar(self) -> None:
+        if self.existe():
+            return
+        fts, cols = self.FTS, ", ".join(COLUMNAS)
+        nuevos = ", ".join(f"new.{c}" for c in COLUMNAS)
+        viejos = ", ".join(f"old.{c}" for c in COLUMNAS)
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{TABLA}', "
+                f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {TABLA} BEGIN "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {nuevos}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {TABLA} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {viejos}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {TABLA} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {viejos}); "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {nuevos}); END"
+            )
+            # Indexa lo que ya existía en la tabla
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def filtrar(self, qs, texto: str, ademas: Q = Q()):
+        tokens = _tokens(texto)
+        if not tokens:
+            return super().filtrar(qs, texto, ademas)
+        # Cada palabra como prefijo; FTS5 las combina con AND
+        consulta = " ".join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+        fts = self.FTS
+        sql = f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s"
+        # bm25 es menor mientras más relevante: lo invierto para ordenar DESC.
+        # Filas que entran solo por `ademas` quedan con relevancia 0.
+        rank = RawSQL(
+            f"COALESCE((SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND rowid = {TABLA}.id), 0)",
+            [consulta], output_field=FloatField(),
+        )
+        return self._candidatos(qs, sql, [consulta], ademas).annotate(relevancia=rank)
+
+
+def get_backend(alias="default") -> BusquedaBase:
+    ruta = getattr(settings, "CATALOGO_BUSQUEDA_BACKEND", None)
+    if ruta:
+        return import_string(ruta)(alias)
+    vendor = connections[alias].vendor
+    if vendor == "mysql":
+        return BusquedaMySQL(alias)
+    if vendor == "sqlite":
+        return BusquedaSQLite(alias)
+    return BusquedaBase(alias)
+
+
+def instalar_indice(alias="default") -> None:
+    """Crea el índice de texto completo si no existe (idempotente)."""
+    _DISPONIBLE.pop(alias, None)
+    try:
+        get_backend(alias).instalar()
+    except DatabaseError as e:
+        # p. ej. SQLite compilado sin FTS5: se sigue usando el fallback
+        log.warning("No se pudo crear el índice de texto completo: %s", e)
+
+
+def buscar_texto(qs, texto: str, subcadena: bool = False):
+    """
+    Filtra qs por texto completo y anota 'relevancia' (mayor = mejor).
+    Si el índice no está disponible cae al OR de icontains.
+    Con subcadena=True también entran las fichas cuyo título/autor/ISBN
+    contiene el texto (índice de trigramas, ver catalogo/trigramas.py).
+    """
+    backend = get_backend(qs.db)
+    if not backend.disponible():
+        backend = BusquedaBase(qs.db)
+    ademas = Q()
+    if subcadena:
+        from .trigramas import condicion_subcadena
+        ademas = condicion_subcadena(texto)
+    return backend.filtrar(qs, texto, ademas)
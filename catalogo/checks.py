@@ -0,0 +1,27 @@
+"""
+Chequeos de sistema del catálogo (se ejecutan al arrancar runserver y los
+comandos de manage.py, incluidos los workers).
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCMEM = "django.core.cache.backends.locmem.LocMemCache"
+
+
+@register()
+def cache_compartida(app_configs, **kwargs):
+    """
+    Con LocMemCache cada proceso (workers web, procesar_importaciones,
+    importar_fichas, actualizar_tc...) tiene su propia caché. Las versiones del
+    catálogo viven en la BD, pero el contexto de autorización invalidado en un
+    proceso sigue cacheado en los demás hasta su TTL, y cada proceso recalcula
+    sus propios conteos y fichas.
+    """
+    if settings.DEBUG or settings.CACHES["default"]["BACKEND"] != LOCMEM:
+        return []
+    return [Warning(
+        "La caché por defecto es LocMemCache: no se comparte entre procesos.",
+        hint="Con varios workers configure CACHE_BACKEND (p. ej. FileBasedCache o Redis) "
+             "y CACHE_LOCATION en una ubicación común a todos los procesos.",
+        id="catalogo.W001",
+    )]
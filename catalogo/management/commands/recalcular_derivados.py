@@ -0,0 +1,40 @@
+# catalogo/management/commands/recalcular_derivados.py
+from django.core.management.base import BaseCommand
+
+from catalogo.models import LibroFicha
+from catalogo.normalizacion import plegar_texto
+from roles.models import Editorial
+
+
+class Command(BaseCommand):
+    help = ("Recalcula las columnas derivadas de LibroFicha (isbn_normalizado, claves de búsqueda, ...), "
+            "su índice de trigramas y Editorial.nombre_busqueda para registros existentes")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Fichas por lote (default 1000)")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        campos = LibroFicha.CAMPOS_DERIVADOS
+        total = 0
+        ultimo_id = 0
+
+        # Recorro por rangos de id para no cargar toda la tabla en memoria
+        while True:
+            lote = list(LibroFicha.objects.filter(id__gt=ultimo_id).order_by("id")[:batch_size])
+            if not lote:
+                break
+            # bulk_update del queryset también regenera los trigramas del lote
+            LibroFicha.objects.bulk_update(lote, campos, batch_size=batch_size)
+            ultimo_id = lote[-1].id
+            total += len(lote)
+            self.stdout.write(f"  {total} fichas procesadas…")
+
+        self.stdout.write(self.style.SUCCESS(f"Listo: {total} fichas actualizadas ({', '.join(campos)})"))
+
+        # Editoriales: tabla chica, va en un solo bulk_update
+        editoriales = list(Editorial.objects.all())
+        for ed in editoriales:
+            ed.nombre_busqueda = plegar_texto(ed.nombre, 150)
+        Editorial.objects.bulk_update(editoriales, ["nombre_busqueda"], batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Listo: {len(editoriales)} editoriales actualizadas (nombre_busqueda)"))
@@ -0,0 +1,31 @@
+# catalogo/management/commands/recalcular_precios.py
+from django.core.management.base import BaseCommand
+
+from catalogo.models import LibroFicha
+from catalogo.precios import recalcular_precios
+from catalogo.versiones import PRECIOS, bump_version
+
+
+class Command(BaseCommand):
+    help = "Recalcula el precio final sugerido materializado (PrecioFicha) de todas las fichas"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Fichas por lote (default 5000)")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        total = 0
+        ultimo_id = 0
+
+        # Por rangos de id: cada lote es un INSERT + UPDATE cortos, sin bloquear toda la tabla
+        while True:
+            ids = list(LibroFicha.objects.filter(id__gt=ultimo_id).order_by("id")
+                       .values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            total += recalcular_precios(LibroFicha.objects.filter(id__gte=ids[0], id__lte=ids[-1]))
+            ultimo_id = ids[-1]
+            self.stdout.write(f"  {total} fichas procesadas…")
+
+        bump_version(PRECIOS)
+        self.stdout.write(self.style.SUCCESS(f"Listo: {total} precios recalculados"))
@@ -1,10 +1,14 @@
 
+import hashlib
+
 from django.db import models
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from decimal import Decimal
 from datetime import date
 from roles.models import Editorial  # FK existente en app Roles
+from catalogo.versiones import bump_version
+from catalogo.normalizacion import normalizar_isbn, plegar_texto
 
 # ============================
 # Catálogos 
@@ -86,9 +90,80 @@ class Idioma(models.Model): # Modelo de idioma con código ISO 639-1
 # FICHA DEL LIBRO
 # ============================
 
+class LibroFichaQuerySet(models.QuerySet):
+    """
+    bulk_create/bulk_update/update no disparan post_save, así que aquí
+    se incrementa la versión del catálogo para invalidar las cachés derivadas
+    (conteos del panel, etc.), se reindexan los trigramas y se recalcula el
+    precio final (PrecioFicha) de las fichas tocadas. save()/delete() lo
+    hacen vía catalogo.signals.
+    """
+
+    def por_isbn(self, raw):
+        """
+        Fichas del ISBN escrito por el usuario (con o sin guiones, ISBN-10 o
+        ISBN-13) por igualdad sobre isbn_normalizado. Sin dígitos no hay
+        ficha: isbn_normalizado="" son justamente las filas aún sin backfill
+        (recalcular_derivados), que se buscan por el isbn tal cual.
+        """
+        clave = normalizar_isbn(raw)
+        if not clave:
+            return self.none()
+        return self.filter(models.Q(isbn_normalizado=clave)
+                           | models.Q(isbn_normalizado="", isbn__in={str(raw).strip(), clave}))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from catalogo.precios import precios_fichas
+        from catalogo.trigramas import indexar_fichas
+
+        objs = list(objs)
+        for obj in objs:
+            obj.actualizar_derivados()
+        objs = super().bulk_create(objs, *args, **kwargs)
+        indexar_fichas(objs, using=self.db)
+        precios_fichas(self.model.objects.using(self.db), "isbn", [obj.isbn for obj in objs])
+        bump_version()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from catalogo.precios import CAMPOS_PRECIO, precios_fichas
+        from catalogo.trigramas import CAMPOS_INDEXADOS, indexar_fichas
+
+        objs = list(objs)
+        for obj in objs:
+            obj.actualizar_derivados()
+        reindexar = bool(set(fields) & CAMPOS_INDEXADOS)
+        fields = list(dict.fromkeys([*fields, *LibroFicha.CAMPOS_DERIVADOS]))
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if reindexar:
+            indexar_fichas(objs, using=self.db)
+        if set(fields) & CAMPOS_PRECIO:
+            precios_fichas(self.model.objects.using(self.db), "pk", [obj.pk for obj in objs])
+        bump_version()
+        return rows
+
+    def update(self, **kwargs):
+        from catalogo.precios import CAMPOS_PRECIO, precios_fichas
+
+        # Un UPDATE masivo no puede recalcular la huella: se vacía para que
+        # la próxima carga en modo actualizar no dé la fila por igual
+        if set(kwargs) & set(LibroFicha.campos_contenido()) and "huella" not in kwargs:
+            kwargs["huella"] = ""
+        # Los ids se toman antes: el UPDATE puede sacar filas del filtro
+        ids = list(self.values_list("pk", flat=True)) if set(kwargs) & CAMPOS_PRECIO else []
+        rows = super().update(**kwargs)
+        if ids:
+            precios_fichas(self.model.objects.using(self.db), "pk", ids)
+        bump_version()
+        return rows
+
+
 class LibroFicha(models.Model):
     # Identificadores
     isbn  = models.CharField(max_length=16, unique=True, db_index=True)   # usado en panel/búsquedas (Largo 16, por si tienes guiones)
+    # Derivado de isbn: solo dígitos/X y siempre ISBN-13 (ver catalogo/normalizacion.py).
+    # Es la columna por la que se resuelven detalle/edición/borrado y la búsqueda por prefijo.
+    isbn_normalizado = models.CharField(max_length=13, blank=True, default="", editable=False, db_index=True)
     ean   = models.CharField(max_length=16, blank=True, null=True)
 
     editorial = models.ForeignKey(
@@ -101,6 +176,9 @@ class LibroFicha(models.Model):
     titulo        = models.CharField(max_length=100, db_index=True)  # usado en panel/búsquedas
     subtitulo     = models.CharField(max_length=100, blank=True, null=True)
     autor         = models.CharField(max_length=100, db_index=True)  # 120 por autores múltiples
+    # Claves de búsqueda sin tildes/mayúsculas (derivadas, ver catalogo/normalizacion.py)
+    titulo_busqueda = models.CharField(max_length=100, blank=True, default="", editable=False, db_index=True)
+    autor_busqueda  = models.CharField(max_length=100, blank=True, default="", editable=False, db_index=True)
     autor_prologo = models.CharField(max_length=40, blank=True, null=True)
     traductor     = models.CharField(max_length=40, blank=True, null=True)
     ilustrador    = models.CharField(max_length=60, blank=True, null=True)
@@ -148,6 +226,16 @@ class LibroFicha(models.Model):
     codigo_imagen = models.CharField(max_length=120, blank=True, null=True) #lo he dejado nuleable 
     rango_etario  = models.CharField(max_length=30, blank=True, null=True)
 
+    # sha1 del contenido (campos_contenido): la carga masiva en modo actualizar
+    # compara contra esto y no escribe las fichas que vienen sin cambios
+    huella = models.CharField(max_length=40, blank=True, default="", editable=False)
+
+    objects = LibroFichaQuerySet.as_manager()
+
+    # Columnas calculadas a partir de otras; se recalculan en save() y en las
+    # operaciones masivas (y con `manage.py recalcular_derivados` para backfill)
+    CAMPOS_DERIVADOS = ["isbn_normalizado", "titulo_busqueda", "autor_busqueda", "huella"]
+
     class Meta:
         ordering = ["titulo"]
         indexes = [
@@ -162,6 +250,124 @@ class LibroFicha(models.Model):
     def __str__(self) -> str:
         return f"{self.isbn} · {self.titulo}"
 
+    @classmethod
+    def campos_contenido(cls) -> list[str]:
+        """Campos que se cargan/editan (todos menos el id y los derivados)."""
+        return [f.name for f in cls._meta.concrete_fields if f.editable and not f.primary_key]
+
+    def calcular_huella(self) -> str:
+        partes = []
+        for nombre in self.campos_contenido():
+            campo = self._meta.get_field(nombre)
+            valor = getattr(self, campo.attname)
+            try:
+                valor = campo.to_python(valor)  # "120" (carga) y 120 (BD) deben coincidir
+            except ValidationError:
+                pass
+            if valor is None:
+                valor = ""
+            elif isinstance(valor, (Decimal, float)):
+                # 9990.5 (Excel) y Decimal("9990.50") (BD) son el mismo precio
+                valor = format(Decimal(str(valor)).normalize(), "f")
+            elif isinstance(valor, date):
+                valor = valor.isoformat()
+            partes.append(str(valor))
+        return hashlib.sha1("\x1f".join(partes).encode()).hexdigest()
+
+    def actualizar_derivados(self) -> None:
+        """Recalcula las columnas de CAMPOS_DERIVADOS desde los datos de la ficha."""
+        self.isbn_normalizado = normalizar_isbn(self.isbn)
+        self.titulo_busqueda = plegar_texto(self.titulo, 100)
+        self.autor_busqueda = plegar_texto(self.autor, 100)
+        self.huella = self.calcular_huella()
+
+    @property
+    def precio_final_sugerido(self):
+        """Precio final sugerido en la moneda de la ficha (PrecioFicha); None si aún no se calcula."""
+        try:
+            return self.precio_final.monto
+        except ObjectDoesNotExist:
+            return None
+
+    @property
+    def precio_final_clp(self):
+        """Precio final sugerido en CLP; None sin tipo de cambio para la moneda."""
+        try:
+            return self.precio_final.monto_clp
+        except ObjectDoesNotExist:
+            return None
+
+    def save(self, *args, **kwargs):
+        self.actualizar_derivados()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = list(dict.fromkeys([*update_fields, *self.CAMPOS_DERIVADOS]))
+        super().save(*args, **kwargs)
+
+
+class TrigramaFicha(models.Model):
+    """
+    Índice invertido de trigramas para búsqueda por subcadena (ver
+    catalogo/trigramas.py). Una fila por (trigrama, ficha, campo); se
+    mantiene solo al guardar/crear/actualizar fichas y se borra en cascada.
+    """
+    CAMPO_TITULO = "t"
+    CAMPO_AUTOR = "a"
+    CAMPO_ISBN = "i"
+    CAMPO_CHOICES = [
+        (CAMPO_TITULO, "Título"),
+        (CAMPO_AUTOR, "Autor"),
+        (CAMPO_ISBN, "ISBN"),
+    ]
+
+    trigrama = models.CharField(max_length=3)
+    ficha = models.ForeignKey(LibroFicha, on_delete=models.CASCADE, related_name="trigramas")
+    campo = models.CharField(max_length=1, choices=CAMPO_CHOICES)
+
+    class Meta:
+        indexes = [
+            # posting list: trigrama -> fichas (cubre el GROUP BY del planificador)
+            models.Index(fields=["trigrama", "campo", "ficha"]),
+        ]
+
+    def __str__(self):
+        return f"{self.trigrama!r} · {self.ficha_id} ({self.campo})"
+
+
+class PrecioFicha(models.Model):
+    """
+    Precio final sugerido de cada ficha, materializado (ver catalogo/precios.py):
+    el precio con los recargos de la editorial, en la moneda de la ficha y en
+    CLP según el tipo de cambio. Se recalcula por conjuntos al cambiar la
+    ficha, los porcentajes de la editorial o el TC de la moneda.
+    """
+    ficha = models.OneToOneField(LibroFicha, on_delete=models.CASCADE, primary_key=True, related_name="precio_final")
+    monto = models.DecimalField(max_digits=14, decimal_places=2)
+    # NULL si la moneda de la ficha no tiene tipo de cambio (VariableExterna TC)
+    monto_clp = models.DecimalField(max_digits=16, decimal_places=0, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # orden/filtro por precio del panel y cursor keyset (monto_clp, id)
+            models.Index(fields=["monto_clp", "ficha"]),
+        ]
+
+    def __str__(self):
+        return f"{self.ficha_id}: {self.monto} ({self.monto_clp} CLP)"
+
+
+class VersionCache(models.Model):
+    """
+    Versión vigente de cada espacio de caché (ver catalogo/versiones.py).
+    Vive en la BD y no en la caché para que los incrementos hechos por los
+    workers (importaciones, actualizar_tc...) los vean todos los procesos web.
+    """
+    nombre = models.CharField(max_length=20, primary_key=True)
+    valor = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.nombre} = {self.valor}"
+
 
 # ============================
 # VARIABLES EXTERNAS
@@ -0,0 +1,63 @@
+"""
+Normalización de datos del catálogo para búsquedas indexables.
+
+Las columnas derivadas de LibroFicha/Editorial (isbn_normalizado,
+titulo_busqueda, nombre_busqueda, ...) se calculan con estas funciones al
+guardar y en las cargas masivas; las vistas usan las mismas funciones sobre lo
+que escribe el usuario, así que la comparación no depende de la collation ni
+de LOWER()/iexact sobre la columna original.
+"""
+import re
+import unicodedata
+
+_NO_ISBN_RE = re.compile(r"[^0-9X]")
+_ISBN10_RE = re.compile(r"^\d{9}[\dX]$")
+
+
+def _digito_ean13(doce: str) -> str:
+    """Dígito verificador EAN-13 (módulo 10, pesos 1/3) para 12 dígitos."""
+    total = sum(int(d) if i % 2 == 0 else int(d) * 3 for i, d in enumerate(doce))
+    return str((10 - total % 10) % 10)
+
+
+def isbn10_a_isbn13(code: str) -> str:
+    """ISBN-10 -> ISBN-13 con prefijo 978 y dígito verificador recalculado."""
+    base = "978" + code[:9]
+    return base + _digito_ean13(base)
+
+
+def normalizar_isbn(raw) -> str:
+    """
+    Deja solo dígitos y 'X' (sin guiones/espacios, en mayúsculas) y convierte
+    los ISBN-10 a ISBN-13. Es el valor guardado en LibroFicha.isbn_normalizado.
+    """
+    code = _NO_ISBN_RE.sub("", str(raw or "").upper())
+    if _ISBN10_RE.match(code):
+        return isbn10_a_isbn13(code)
+    return code
+
+
+def prefijos_isbn(raw) -> list[str]:
+    """
+    Prefijos a buscar en isbn_normalizado para lo que escribe el usuario.
+    Un fragmento inicial de ISBN-10 ("84-376...") solo existe en la columna
+    como "978" + fragmento, así que se prueban ambos (dos rangos del índice).
+    """
+    code = normalizar_isbn(raw)
+    if not code:
+        return []
+    if len(code) == 13 or code.startswith(("978", "979")):
+        return [code]
+    return [code, "978" + code]
+
+
+def plegar_texto(raw, max_length: int | None = None) -> str:
+    """
+    Clave de búsqueda sin tildes ni mayúsculas: "Pérez" -> "perez",
+    "EDUCACIÓN" -> "educacion", "Ñandú" -> "nandu". Colapsa espacios.
+    Con max_length se recorta al largo de la columna donde se guarda.
+    """
+    texto = unicodedata.normalize("NFKD", str(raw or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = " ".join(texto.casefold().split())
+    return texto[:max_length] if max_length else texto
@@ -0,0 +1,90 @@
+"""
+Precio final sugerido materializado (PrecioFicha).
+
+    precio * (1 + (cargo_origen + recargo_fletes + gastos_indirectos + margen_comercializacion) / 100)
+
+en la moneda de la ficha y en CLP con el tipo de cambio de esa moneda
+(VariableExterna TC; las fichas en CLP quedan igual). Se guarda una fila por
+ficha para que el panel, las exportaciones y las listas de precios ordenen y
+filtren por el índice de monto_clp en vez de calcularlo en cada consulta.
+
+recalcular_precios() trabaja por conjuntos y sin traer fichas a Python: un
+INSERT de las filas que faltan y un UPDATE cuyas subconsultas calculan los
+montos en la BD. Se recalcula solo lo afectado:
+- fichas creadas o con cambios de precio/moneda/editorial (LibroFichaQuerySet
+  y el post_save de catalogo/signals.py);
+- las fichas de una editorial cuando cambian sus porcentajes (EditarEditorialView);
+- las fichas de una moneda cuando cambia su TC (catalogo/signals.py; cubre
+  la vista y el comando actualizar_tc).
+Para fichas ya existentes: `manage.py recalcular_precios`.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Round
+
+from .models import LibroFicha, PrecioFicha, VariableExterna
+
+RECARGOS = ("cargo_origen", "recargo_fletes", "gastos_indirectos", "margen_comercializacion")
+
+# Campos de la ficha cuyo cambio obliga a recalcular su precio final
+CAMPOS_PRECIO = {"precio", "moneda", "moneda_id", "editorial", "editorial_id"}
+
+LOTE = 1000
+
+
+def precio_sugerido():
+    """Expresión SQL (sobre LibroFicha) del precio final en la moneda de la ficha."""
+    cero = Value(Decimal("0"))
+    recargo = sum((Coalesce(F(f"editorial__{campo}"), cero) for campo in RECARGOS[1:]),
+                  Coalesce(F(f"editorial__{RECARGOS[0]}"), cero))
+    return Round(
+        # * 0.01 y no / 100: en SQLite NUMERIC enteros, 15 / 100 daría 0
+        F("precio") * (Value(Decimal("1")) + recargo * Value(Decimal("0.01"))),
+        2,
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def precio_clp():
+    """Expresión SQL (sobre LibroFicha) del precio final en CLP; NULL si la moneda no tiene TC."""
+    tc = (VariableExterna.objects
+          .filter(tipo=VariableExterna.TIPO_TC, moneda_id=OuterRef("moneda_id"))
+          .order_by().values("valor")[:1])
+    salida = DecimalField(max_digits=16, decimal_places=0)
+    return Case(
+        When(moneda__code__iexact="CLP", then=Round(precio_sugerido(), 0, output_field=salida)),
+        default=Round(precio_sugerido() * Subquery(tc), 0, output_field=salida),
+        output_field=salida,
+    )
+
+
+def recalcular_precios(fichas) -> int:
+    """
+    Recalcula PrecioFicha para el queryset `fichas` (de LibroFicha): crea las
+    filas que falten y actualiza todas en un UPDATE. Devuelve cuántas filas
+    se actualizaron.
+    """
+    db = fichas.db
+    faltan = fichas.filter(precio_final__isnull=True).order_by("pk").values_list("pk", flat=True)
+    # Una pasada por pk (keyset): no depende de que cada INSERT haga desaparecer
+    # sus filas de `faltan` (ignore_conflicts puede no insertar nada)
+    ultimo = 0
+    while ids := list(faltan.filter(pk__gt=ultimo)[:LOTE]):
+        # monto provisorio: el UPDATE de abajo lo calcula
+        PrecioFicha.objects.using(db).bulk_create([PrecioFicha(ficha_id=pk, monto=0) for pk in ids],
+                                                  ignore_conflicts=True)
+        ultimo = ids[-1]
+
+    ficha = LibroFicha.objects.filter(pk=OuterRef("ficha_id")).order_by()
+    return (PrecioFicha.objects.using(db)
+            .filter(ficha__in=fichas.order_by().values("pk"))
+            .update(monto=Subquery(ficha.annotate(v=precio_sugerido()).values("v")[:1]),
+                    monto_clp=Subquery(ficha.annotate(v=precio_clp()).values("v")[:1])))
+
+
+def precios_fichas(fichas, campo: str, valores) -> None:
+    """recalcular_precios() de las fichas con `campo` en `valores`, de a LOTE (operaciones masivas)."""
+    valores = [v for v in valores if v is not None]
+    for i in range(0, len(valores), LOTE):
+        recalcular_precios(fichas.filter(**{f"{campo}__in": valores[i:i + LOTE]}))
@@ -0,0 +1,111 @@
+# -------------------------------------------------------------------------------
+# Señales del catálogo:
+# - Cualquier alta/edición/baja de LibroFicha incrementa la versión del catálogo
+#   (ver catalogo/versiones.py) para invalidar las cachés que dependen de él.
+#   Las operaciones masivas se cubren en LibroFichaQuerySet.
+# - Al guardar una ficha se regeneran sus trigramas (catalogo/trigramas.py);
+#   al borrarla se van en cascada.
+# - Altas/ediciones/bajas de fichas y editoriales se aplican al índice de
+#   autocompletado de este proceso al confirmar la transacción; el primer
+#   request del proceso lanza su construcción en segundo plano.
+# - Cambios en Editorial (porcentajes) o VariableExterna (TC/IVA) incrementan
+#   la versión "precios", de la que dependen las fichas de detalle cacheadas.
+# - El precio final materializado (catalogo/precios.py) se recalcula al guardar
+#   una ficha que cambia de precio/moneda/editorial y, para todas las fichas de
+#   la moneda, al cambiar un tipo de cambio.
+# - Después de migrar se crea el índice de texto completo (catalogo/busqueda.py).
+# -------------------------------------------------------------------------------
+
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from roles.models import Editorial
+
+from . import autocompletar
+from .busqueda import instalar_indice
+from .models import LibroFicha, VariableExterna
+from .precios import CAMPOS_PRECIO, recalcular_precios
+from .trigramas import CAMPOS_INDEXADOS, indexar_fichas
+from .versiones import PRECIOS, bump_version
+
+
+@receiver(post_save, sender=LibroFicha)
+@receiver(post_delete, sender=LibroFicha)
+def invalidar_catalogo(sender, instance, **kwargs):
+    bump_version()
+
+
+@receiver(post_save, sender=Editorial)
+@receiver(post_delete, sender=Editorial)
+@receiver(post_save, sender=VariableExterna)
+@receiver(post_delete, sender=VariableExterna)
+def invalidar_precios(sender, instance, **kwargs):
+    bump_version(PRECIOS)
+
+
+@receiver(post_save, sender=LibroFicha)
+def reindexar_trigramas(sender, instance, update_fields=None, raw=False, using="default", **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not (set(update_fields) & CAMPOS_INDEXADOS):
+        return
+    indexar_fichas([instance], using=using)
+
+
+@receiver(post_save, sender=LibroFicha)
+def recalcular_precio_ficha(sender, instance, update_fields=None, raw=False, using="default", **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not (set(update_fields) & CAMPOS_PRECIO):
+        return
+    recalcular_precios(LibroFicha.objects.using(using).filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=VariableExterna)
+@receiver(post_delete, sender=VariableExterna)
+def recalcular_precios_tc(sender, instance, raw=False, using="default", **kwargs):
+    if raw or instance.tipo != VariableExterna.TIPO_TC or instance.moneda_id is None:
+        return
+    # invalidar_precios incrementa la versión al confirmar, ya con los montos nuevos
+    recalcular_precios(LibroFicha.objects.using(using).filter(moneda_id=instance.moneda_id))
+
+
+@receiver(post_save, sender=LibroFicha)
+def autocompletar_ficha_guardada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    datos = (instance.titulo, instance.autor, instance.editorial_id)
+    transaction.on_commit(lambda: autocompletar.aplicar_ficha(instance.pk, datos))
+
+
+@receiver(post_delete, sender=LibroFicha)
+def autocompletar_ficha_borrada(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocompletar.aplicar_ficha(pk, None))
+
+
+@receiver(post_save, sender=Editorial)
+def autocompletar_editorial_guardada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    nombre = instance.nombre
+    transaction.on_commit(lambda: autocompletar.aplicar_editorial(instance.pk, nombre))
+
+
+@receiver(post_delete, sender=Editorial)
+def autocompletar_editorial_borrada(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocompletar.aplicar_editorial(pk, None))
+
+
+# El índice de autocompletado se construye en un hilo desde el primer request
+# del proceso, antes de que alguien escriba en un buscador
+request_started.connect(autocompletar.precalentar, dispatch_uid="autocompletar_precalentar")
+
+
+@receiver(post_migrate)
+def crear_indice_busqueda(sender, using="default", **kwargs):
+    if getattr(sender, "name", None) == "catalogo":
+        instalar_indice(using)
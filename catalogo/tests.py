@@ -1,3 +1,324 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from roles.models import Editorial, Profile, UsuarioEditorial
+from roles.views import _ficha_por_isbn
+
+from . import autocompletar
+from .busqueda import BusquedaBase, BusquedaSQLite, buscar_texto, get_backend
+from .models import Idioma, LibroFicha, Moneda, Pais, PrecioFicha, TipoTapa, TrigramaFicha, VariableExterna
+from .normalizacion import isbn10_a_isbn13, normalizar_isbn, plegar_texto, prefijos_isbn
+from .precios import recalcular_precios
+from .trigramas import condicion_subcadena, indexar_fichas, trigramas
+from .versiones import get_version
+
+
+class NormalizacionTests(SimpleTestCase):
+
+    def test_isbn10_a_isbn13(self):
+        self.assertEqual(isbn10_a_isbn13("0306406152"), "9780306406157")
+        self.assertEqual(isbn10_a_isbn13("080442957X"), "9780804429573")
+
+    def test_normalizar_isbn(self):
+        self.assertEqual(normalizar_isbn("978-0-306-40615-7"), "9780306406157")
+        self.assertEqual(normalizar_isbn("0-306-40615-2"), "9780306406157")
+        self.assertEqual(normalizar_isbn("0-8044-2957-x"), "9780804429573")
+        self.assertEqual(normalizar_isbn(None), "")
+
+    def test_prefijos_isbn(self):
+        self.assertEqual(prefijos_isbn("84-376"), ["84376", "97884376"])
+        self.assertEqual(prefijos_isbn("978-84"), ["97884"])
+        self.assertEqual(prefijos_isbn(""), [])
+
+    def test_plegar_texto(self):
+        self.assertEqual(plegar_texto("  EDUCACIÓN   Ñandú "), "educacion nandu")
+        self.assertEqual(plegar_texto("García Márquez", 6), "garcia")
+
+
+class _ConFicha(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ficha = LibroFicha.objects.create(
+            isbn="0-306-40615-2", editorial=Editorial.objects.create(nombre="Editorial Pérez"),
+            titulo="Cien Años de Soledad", autor="García Márquez",
+            tipo_tapa=TipoTapa.objects.create(nombre="Rústica"), numero_paginas=120,
+            idioma_original=Idioma.objects.create(code="es", nombre="Español"), numero_edicion=1,
+            fecha_edicion=date(2020, 1, 1), pais_edicion=Pais.objects.create(code="CL", nombre="Chile"),
+            precio=Decimal("9990.50"), moneda=Moneda.objects.create(code="CLP", nombre="Peso"),
+            descuento_distribuidor=Decimal("10"), resumen_libro="Resumen",
+        )
+
+
+
+class DerivadosTests(_ConFicha):
+
+    def test_columnas_derivadas(self):
+        ficha = LibroFicha.objects.get(pk=self.ficha.pk)
+        self.assertEqual(ficha.isbn_normalizado, "9780306406157")
+        self.assertEqual(ficha.titulo_busqueda, "cien anos de soledad")
+        self.assertEqual(ficha.autor_busqueda, "garcia marquez")
+
+    def test_huella_no_depende_del_tipo(self):
+        ficha = LibroFicha.objects.get(pk=self.ficha.pk)
+        huella = ficha.huella
+        ficha.precio, ficha.numero_paginas = 9990.5, "120"
+        self.assertEqual(ficha.calcular_huella(), huella)
+        ficha.precio = Decimal("9990.51")
+        self.assertNotEqual(ficha.calcular_huella(), huella)
+
+    def test_update_masivo_vacia_la_huella(self):
+        LibroFicha.objects.filter(pk=self.ficha.pk).update(titulo="Otro")
+        self.assertEqual(LibroFicha.objects.get(pk=self.ficha.pk).huella, "")
+
+
+class IsbnLookupTests(_ConFicha):
+
+    def test_formas_del_mismo_isbn(self):
+        for raw in ("9780306406157", "978-0-306-40615-7", "0-306-40615-2", " 0306406152 "):
+            with self.subTest(raw=raw):
+                self.assertEqual(list(LibroFicha.objects.por_isbn(raw)), [self.ficha])
+
+    def test_sin_digitos_no_encuentra_nada(self):
+        LibroFicha.objects.filter(pk=self.ficha.pk).update(isbn_normalizado="")  # fila sin backfill
+        for raw in ("", "---", "abc", None):
+            with self.subTest(raw=raw):
+                self.assertFalse(LibroFicha.objects.por_isbn(raw).exists())
+                with self.assertRaises(Http404):
+                    _ficha_por_isbn(raw)
+
+    def test_fila_sin_backfill_por_isbn_exacto(self):
+        LibroFicha.objects.filter(pk=self.ficha.pk).update(isbn_normalizado="")
+        self.assertEqual(list(LibroFicha.objects.por_isbn("0-306-40615-2")), [self.ficha])
+        self.assertFalse(LibroFicha.objects.por_isbn("9788437604947").exists())
+
+    @mock.patch("catalogo.autocompletar._lanzar")  # sin hilo del autocompletado
+    def test_detalle(self, _):
+        self.client.force_login(get_user_model().objects.create_user("lector", password="pw"))
+        self.assertContains(self.client.get("/catalogo/libro/978-0-306-40615-7/"), "Cien Años de Soledad")
+        self.assertEqual(self.client.get("/catalogo/libro/sin-isbn/").status_code, 404)
+
+
+class IndiceAutocompletarTests(SimpleTestCase):
+
+    def test_scope_sin_tope(self):
+        # 3000 entradas de otra editorial antes de la única del editor
+        fichas = [(i, f"aaa {i:05d}", "x", 2) for i in range(3000)] + [(9999, "aaa zz", "x", 1)]
+        indice = autocompletar.IndiceAutocompletar(fichas, [])
+        self.assertEqual(indice.buscar("aaa", tipos=["titulo"], editoriales=frozenset([1])),
+                         [{"tipo": "titulo", "valor": "aaa zz"}])
+        self.assertEqual(len(indice.buscar("aaa", tipos=["titulo"], limite=5)), 5)
+
+    def test_aplicar_cambios(self):
+        indice = autocompletar.IndiceAutocompletar([(1, "Rayuela", "Julio Cortázar", 1)], [(1, "Ñandú Libros")])
+        self.assertEqual(indice.buscar("cortaz", editoriales=frozenset([1])), [{"tipo": "autor", "valor": "Julio Cortázar"}])
+        indice.aplicar_ficha(1, ("Rayuela", "Julio Cortázar", 2))
+        self.assertEqual(indice.buscar("cortaz", editoriales=frozenset([1])), [])
+        self.assertEqual(indice.buscar("cortaz", editoriales=frozenset([2, 3])), [{"tipo": "autor", "valor": "Julio Cortázar"}])
+        indice.aplicar_ficha(1, None)
+        indice.aplicar_editorial(1, None)
+        self.assertEqual(indice.buscar("cortaz") + indice.buscar("nandu"), [])
+
+
+@override_settings(AUTOCOMPLETAR_REFRESCO=0)
+@mock.patch("catalogo.autocompletar._lanzar")
+class IndiceDelProcesoTests(_ConFicha):
+
+    def setUp(self):
+        cache.clear()  # contextos de autorización de otras pruebas
+        autocompletar._reconstruir()
+
+    def tearDown(self):
+        autocompletar._indice = autocompletar._version = None
+
+    def _guardar(self, ficha):
+        with self.captureOnCommitCallbacks(execute=True):
+            ficha.save()
+
+    def test_cambio_local_no_reconstruye(self, lanzar):
+        self.ficha.titulo = "Crónica de una muerte anunciada"
+        self._guardar(self.ficha)
+        self.assertEqual(autocompletar._version, get_version())
+        indice = autocompletar.get_indice()
+        lanzar.assert_not_called()
+        self.assertEqual(indice.buscar("cronica", tipos=["titulo"]),
+                         [{"tipo": "titulo", "valor": "Crónica de una muerte anunciada"}])
+
+    def test_cambio_masivo_reconstruye(self, lanzar):
+        with self.captureOnCommitCallbacks(execute=True):
+            LibroFicha.objects.filter(pk=self.ficha.pk).update(titulo="Otro")
+        autocompletar.get_indice()
+        lanzar.assert_called_once()
+
+    def test_cambios_durante_la_reconstruccion(self, lanzar):
+        leer = autocompletar.IndiceAutocompletar.desde_bd
+
+        def leer_y_editar():
+            indice = leer()  # ya leyó el catálogo; la edición llega antes del reemplazo
+            self.ficha.titulo = "El otoño del patriarca"
+            self._guardar(self.ficha)
+            return indice
+
+        with mock.patch.object(autocompletar.IndiceAutocompletar, "desde_bd", side_effect=leer_y_editar):
+            autocompletar._reconstruir()
+        self.assertEqual(autocompletar.get_indice().buscar("otono", tipos=["titulo"]),
+                         [{"tipo": "titulo", "valor": "El otoño del patriarca"}])
+        self.assertEqual(autocompletar._version, get_version())
+        lanzar.assert_not_called()
+
+    def test_endpoint(self, lanzar):
+        with self.captureOnCommitCallbacks(execute=True):
+            otra = Editorial.objects.create(nombre="Ñandú Libros")
+        editor = get_user_model().objects.create_user("editor", password="pw")
+        editor.profile.role = Profile.ROLE_EDITOR
+        editor.profile.save()
+        UsuarioEditorial.objects.create(user=editor, editorial=otra)
+        self.client.force_login(editor)
+        url = reverse("catalogo:autocompletar")
+
+        self.assertEqual(self.client.get(url, {"q": "c"}).json()["resultados"], [])
+        self.assertEqual(self.client.get(url, {"q": "cien"}).json()["resultados"], [])  # otra editorial
+        self.assertEqual(self.client.get(url, {"q": "nandu", "tipos": "editorial"}).json()["resultados"],
+                         [{"tipo": "editorial", "valor": "Ñandú Libros"}])
+
+        self.client.force_login(get_user_model().objects.create_user("lector", password="pw"))
+        r = self.client.get(url, {"q": "GARC", "tipos": "autor,x"})
+        self.assertEqual(r.json()["resultados"], [{"tipo": "autor", "valor": "García Márquez"}])
+        self.assertEqual(r["Cache-Control"], "private, max-age=30")
+
+        autocompletar._indice = autocompletar._version = None
+        self.assertTrue(self.client.get(url, {"q": "cien"}).json()["construyendo"])
+        lanzar.assert_called()
+
+
+@mock.patch("catalogo.autocompletar._lanzar", new=mock.Mock())
+class DetalleCacheTests(_ConFicha):
+
+    def setUp(self):
+        cache.clear()
+
+    def _cliente(self, nombre, rol):
+        usuario = get_user_model().objects.create_user(nombre, password="pw")
+        usuario.profile.role = rol
+        usuario.profile.save()
+        self.client.force_login(usuario)
+
+    def test_se_comparte_entre_roles(self):
+        self._cliente("consultor", Profile.ROLE_CONSULTOR)
+        self.assertContains(self.client.get("/catalogo/libro/9780306406157/"), "Cien Años de Soledad")
+        self._cliente("admin", Profile.ROLE_ADMIN)
+        with mock.patch("catalogo.views.render_to_string") as renderizar:
+            self.assertContains(self.client.get("/catalogo/libro/0-306-40615-2/"), "Cien Años de Soledad")
+        renderizar.assert_not_called()
+
+    def test_un_cambio_de_la_ficha_invalida(self):
+        self._cliente("consultor", Profile.ROLE_CONSULTOR)
+        self.client.get("/catalogo/libro/9780306406157/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ficha.titulo = "Cien años de soledad (edición conmemorativa)"
+            self.ficha.save()
+        self.assertContains(self.client.get("/catalogo/libro/9780306406157/"), "edición conmemorativa")
+
+
+class BusquedaTextoTests(_ConFicha):
+
+    def _buscar(self, texto, **kw):
+        return list(buscar_texto(LibroFicha.objects.all(), texto, **kw))
+
+    def test_indice_de_texto_completo(self):
+        backend = get_backend()
+        self.assertIsInstance(backend, BusquedaSQLite)
+        self.assertTrue(backend.disponible())
+        for texto in ("soledad", "garcia marquez", "Cien soled", "AÑOS"):
+            with self.subTest(texto=texto):
+                resultado = self._buscar(texto)
+                self.assertEqual(resultado, [self.ficha])
+                self.assertGreater(resultado[0].relevancia, 0)
+        self.assertEqual(self._buscar("soledad cortazar"), [])  # todas las palabras
+        self.assertEqual(self._buscar('"); DROP'), [])
+
+    def test_el_indice_sigue_a_la_tabla(self):
+        LibroFicha.objects.filter(pk=self.ficha.pk).update(resumen_libro="Macondo y los Buendía")
+        self.assertEqual(self._buscar("buendia"), [self.ficha])
+        self.assertEqual(self._buscar("resumen"), [])
+        self.ficha.delete()
+        self.assertEqual(self._buscar("macondo"), [])
+
+    def test_ordenado_por_relevancia(self):
+        otra = LibroFicha.objects.get(pk=self.ficha.pk)
+        otra.pk, otra.isbn, otra.titulo = None, "978-84-376-0494-7", "Soledad"
+        otra.resumen_libro = "soledad, soledad y más soledad"
+        otra.save()
+        self.assertEqual(list(buscar_texto(LibroFicha.objects.all(), "soledad").order_by("-relevancia")),
+                         [otra, self.ficha])
+
+    def test_subcadena_y_fallback(self):
+        self.assertEqual(self._buscar("oleda"), [])  # no es prefijo de ninguna palabra
+        self.assertEqual(self._buscar("oleda", subcadena=True), [self.ficha])
+        with mock.patch.object(BusquedaSQLite, "disponible", return_value=False):
+            resultado = self._buscar("años de sol")
+        self.assertEqual(resultado, [self.ficha])
+        self.assertEqual(resultado[0].relevancia, 0)
+        self.assertEqual(list(BusquedaBase().filtrar(LibroFicha.objects.all(), "márquez")), [self.ficha])
+
+
+class TrigramasTests(_ConFicha):
+
+    def test_indexa_todos_los_trigramas_por_lotes(self):
+        self.ficha.titulo = "Historia general de las cosas de la Nueva España " * 3
+        self.ficha.actualizar_derivados()
+        esperados = sum(len(trigramas(v)) for v in (self.ficha.titulo_busqueda, self.ficha.autor_busqueda,
+                                                    self.ficha.isbn_normalizado))
+        with mock.patch("catalogo.trigramas.LOTE_INSERT", 7):
+            indexar_fichas([self.ficha])
+        self.assertEqual(TrigramaFicha.objects.filter(ficha=self.ficha).count(), esperados)
+
+    def test_busqueda_por_subcadena(self):
+        self.assertEqual(list(LibroFicha.objects.filter(condicion_subcadena("ños de sol"))), [self.ficha])
+        self.assertEqual(list(LibroFicha.objects.filter(condicion_subcadena("0306-406"))), [self.ficha])
+        self.assertFalse(LibroFicha.objects.filter(condicion_subcadena("soledades")).exists())
+
+
+class PreciosTests(_ConFicha):
+
+    def _precio(self, ficha=None):
+        return PrecioFicha.objects.get(ficha=ficha or self.ficha)
+
+    def test_al_guardar_la_ficha(self):
+        self.assertEqual((self._precio().monto, self._precio().monto_clp), (Decimal("9990.50"), Decimal("9991")))
+        self.ficha.precio = Decimal("1000")
+        self.ficha.save()
+        self.assertEqual(self._precio().monto_clp, Decimal("1000"))
+
+    def test_porcentajes_de_la_editorial(self):
+        Editorial.objects.filter(pk=self.ficha.editorial_id).update(
+            cargo_origen=10, recargo_fletes=5, gastos_indirectos=2.5, margen_comercializacion=2.5)
+        recalcular_precios(LibroFicha.objects.filter(editorial_id=self.ficha.editorial_id))
+        self.assertEqual(self._precio().monto, Decimal("11988.60"))
+
+    def test_tipo_de_cambio(self):
+        usd = Moneda.objects.create(code="USD", nombre="Dólar")
+        LibroFicha.objects.filter(pk=self.ficha.pk).update(moneda=usd, precio=Decimal("10"))
+        self.assertEqual((self._precio().monto, self._precio().monto_clp), (Decimal("10.00"), None))
+
+        tc = VariableExterna.objects.create(tipo=VariableExterna.TIPO_TC, moneda=usd, valor=Decimal("950.5"))
+        self.assertEqual(self._precio().monto_clp, Decimal("9505"))
+        tc.valor = Decimal("900")
+        tc.save()
+        self.assertEqual(self._precio().monto_clp, Decimal("9000"))
+        tc.delete()
+        self.assertIsNone(self._precio().monto_clp)
+
+    def test_operaciones_masivas_y_filas_faltantes(self):
+        PrecioFicha.objects.all().delete()
+        self.assertEqual(recalcular_precios(LibroFicha.objects.all()), 1)
+        self.assertEqual(self._precio().monto, Decimal("9990.50"))
+        LibroFicha.objects.filter(pk=self.ficha.pk).update(precio=Decimal("500"))
+        self.assertEqual(self._precio().monto, Decimal("500.00"))
@@ -0,0 +1,137 @@
+"""
+Índice de trigramas para búsqueda por subcadena en título, autor e ISBN.
+
+`contains` se traduce en LIKE '%texto%' y recorre toda la tabla. Aquí cada
+ficha se descompone en los trigramas (ventanas de 3 caracteres) de sus claves
+plegadas (titulo_busqueda, autor_busqueda, isbn_normalizado) y se guardan en
+TrigramaFicha. Para buscar "ducaci" se toman sus trigramas {duc, uca, cac, aci}
+y se intersectan las listas de fichas de cada uno (GROUP BY ... HAVING
+COUNT = nº de trigramas); solo sobre esos candidatos se aplica el LIKE exacto.
+
+El índice se mantiene en LibroFichaQuerySet (bulk_create/bulk_update), en el
+post_save de catalogo/signals.py y por el borrado en cascada de la FK.
+Para fichas ya existentes: `manage.py recalcular_derivados`.
+"""
+import re
+from itertools import islice
+
+from django.db import connections, transaction
+from django.db.models import Count, Q
+
+from .models import LibroFicha, TrigramaFicha
+from .normalizacion import plegar_texto
+
+# Campos de la ficha cuyo cambio obliga a reindexar
+CAMPOS_INDEXADOS = {"titulo", "autor", "isbn", *LibroFicha.CAMPOS_DERIVADOS}
+
+# código de campo en TrigramaFicha -> columna plegada de LibroFicha
+COLUMNAS = {
+    TrigramaFicha.CAMPO_TITULO: "titulo_busqueda",
+    TrigramaFicha.CAMPO_AUTOR: "autor_busqueda",
+    TrigramaFicha.CAMPO_ISBN: "isbn_normalizado",
+}
+
+# Texto que parece un trozo de ISBN pegado: dígitos con guiones/espacios
+_ISBN_RE = re.compile(r"[0-9Xx][0-9Xx\s-]*")
+
+LOTE = 500           # fichas por DELETE / lectura de ids
+LOTE_INSERT = 1000   # trigramas por executemany
+
+
+def trigramas(texto: str) -> set[str]:
+    """Trigramas del texto (ya plegado). Vacío si tiene menos de 3 caracteres."""
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _valores(objs, using):
+    """
+    (id, titulo_busqueda, autor_busqueda, isbn_normalizado) de cada ficha.
+    En MySQL bulk_create no devuelve los pk: esas se leen por isbn.
+    """
+    filas, sin_pk = [], []
+    for obj in objs:
+        if obj.pk is None:
+            sin_pk.append(obj.isbn)
+        else:
+            filas.append((obj.pk, *(getattr(obj, col) for col in COLUMNAS.values())))
+    for i in range(0, len(sin_pk), LOTE):
+        filas.extend(
+            LibroFicha.objects.using(using)
+            .filter(isbn__in=sin_pk[i:i + LOTE])
+            .values_list("id", *COLUMNAS.values())
+        )
+    return filas
+
+
+@transaction.atomic
+def _reemplazar(filas, using):
+    ids = [fila[0] for fila in filas]
+    for i in range(0, len(ids), LOTE):
+        TrigramaFicha.objects.using(using).filter(ficha_id__in=ids[i:i + LOTE]).delete()
+
+    # Cada valor aporta hasta len - 2 trigramas, así que las filas por ficha
+    # crecen con el largo de título + autor + ISBN: se generan a medida y se
+    # insertan de a LOTE_INSERT con executemany (el driver arma INSERTs de
+    # varias filas), sin instanciar un modelo por fila ni armar la lista entera
+    nuevos = (
+        (t, ficha_id, campo)
+        for ficha_id, *valores in filas
+        for campo, valor in zip(COLUMNAS, valores)
+        for t in trigramas(valor or "")
+    )
+    sql = _insert_sql(using)
+    with connections[using].cursor() as cursor:
+        while lote := list(islice(nuevos, LOTE_INSERT)):
+            cursor.executemany(sql, lote)
+
+
+def _insert_sql(using) -> str:
+    qn = connections[using].ops.quote_name
+    columnas = ", ".join(qn(TrigramaFicha._meta.get_field(f).column) for f in ("trigrama", "ficha", "campo"))
+    return f"INSERT INTO {qn(TrigramaFicha._meta.db_table)} ({columnas}) VALUES (%s, %s, %s)"
+
+
+def indexar_fichas(objs, using="default") -> None:
+    """Regenera los trigramas de las fichas dadas (instancias de LibroFicha)."""
+    filas = _valores(objs, using)
+    if filas:
+        _reemplazar(filas, using)
+
+
+def _candidatos(grams: set[str], campos: list[str]):
+    """
+    ids de fichas que tienen TODOS los trigramas en un mismo campo: la
+    intersección de las listas se resuelve en la BD con GROUP BY/HAVING.
+    """
+    return (TrigramaFicha.objects
+            .filter(trigrama__in=grams, campo__in=campos)
+            .values("ficha_id", "campo")
+            .annotate(n=Count("trigrama", distinct=True))
+            .filter(n=len(grams))
+            .values("ficha_id"))
+
+
+def condicion_subcadena(texto: str) -> Q:
+    """
+    Q con la búsqueda por subcadena (título/autor y, si parece un ISBN, el
+    ISBN normalizado). Primero acota por el índice de trigramas y luego
+    confirma con el LIKE exacto sobre las columnas plegadas.
+    Textos de menos de 3 caracteres no usan el índice: devuelve Q() vacío.
+    """
+    cond = Q()
+
+    plegado = plegar_texto(texto)
+    grams = trigramas(plegado)
+    if grams:
+        cond |= Q(id__in=_candidatos(grams, [TrigramaFicha.CAMPO_TITULO, TrigramaFicha.CAMPO_AUTOR])) & (
+            Q(titulo_busqueda__contains=plegado) | Q(autor_busqueda__contains=plegado)
+        )
+
+    texto = (texto or "").strip()
+    if _ISBN_RE.fullmatch(texto):
+        digitos = re.sub(r"[^0-9X]", "", texto.upper())
+        grams = trigramas(digitos)
+        if grams:
+            cond |= Q(id__in=_candidatos(grams, [TrigramaFicha.CAMPO_ISBN])) & Q(isbn_normalizado__contains=digitos)
+
+    return cond
@@ -1,6 +1,6 @@
 # catalogo/urls.py
 from django.urls import path
-from .views import libro_detalle, actualizar_tc  # vista simple por ahora
+from .views import libro_detalle, actualizar_tc, autocompletar  # vista simple por ahora
 
 
 app_name = "catalogo"
@@ -8,4 +8,5 @@ app_name = "catalogo"
 urlpatterns = [
     path("libro/<str:isbn>/", libro_detalle, name="libro_detalle"),
     path("api/actualizar-tc/", actualizar_tc, name="actualizar_tc"),
+    path("api/autocompletar/", autocompletar, name="autocompletar"),
 ]
\ No newline at end of file
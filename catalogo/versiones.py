@@ -0,0 +1,58 @@
+"""
+Versiones de catálogo para invalidar cachés derivadas.
+
+En vez de borrar claves una por una, cada caché que depende del catálogo
+(conteos del panel, fichas renderizadas, exportaciones...) incluye la versión
+actual en su clave. Al cambiar un LibroFicha se incrementa la versión y todas
+esas entradas quedan obsoletas de una vez (expiran solas por TTL/LRU).
+
+Las versiones se guardan en la BD (VersionCache), no en la caché: con
+LocMemCache cada proceso tendría la suya y los incrementos hechos por los
+workers (procesar_importaciones, importar_fichas, actualizar_tc...) no
+llegarían a los procesos web. Leerla es una consulta por clave primaria.
+
+Los incrementos se aplican al confirmar la transacción en curso: si no, otro
+request podría cachear datos aún sin confirmar (o ya revertidos) bajo la
+versión nueva.
+
+La versión inicial es un timestamp en ms: si se borra la fila, la nueva
+versión siempre es mayor que cualquiera anterior, así que nunca se reutiliza
+una clave vieja de una caché compartida.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import F
+
+CATALOGO = "catalogo"
+PRECIOS = "precios"  # porcentajes de editoriales y variables externas (TC, IVA)
+
+
+def _inicial() -> int:
+    return int(time.time() * 1000)
+
+
+def get_version(nombre: str = CATALOGO) -> int:
+    """Versión vigente del espacio 'nombre' (se crea si no existe)."""
+    from .models import VersionCache
+
+    valor = VersionCache.objects.filter(nombre=nombre).values_list("valor", flat=True).first()
+    if valor is None:
+        valor = VersionCache.objects.get_or_create(nombre=nombre, defaults={"valor": _inicial()})[0].valor
+    return valor
+
+
+def bump_version(nombre: str = CATALOGO) -> None:
+    """
+    Incrementa la versión al confirmar la transacción (al tiro si no hay una);
+    todas las entradas que la usaban quedan obsoletas.
+    """
+    transaction.on_commit(lambda: _incrementar(nombre))
+
+
+def _incrementar(nombre: str) -> None:
+    from .models import VersionCache
+
+    if not VersionCache.objects.filter(nombre=nombre).update(valor=F("valor") + 1):
+        # No existía: parto desde un timestamp nuevo
+        VersionCache.objects.get_or_create(nombre=nombre, defaults={"valor": _inicial()})
@@ -1,8 +1,15 @@
 # catalogo/views.py
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from .models import LibroFicha
+from .normalizacion import normalizar_isbn
+from .versiones import PRECIOS, get_version
+from .autocompletar import TIPOS, get_indice
+from roles.autorizacion import get_auth_context
 
 #Actualización tipo de cambio
 from django.http import JsonResponse, HttpResponseForbidden
@@ -11,18 +18,70 @@ from catalogo.models import VariableExterna, Moneda
 from catalogo.services import obtener_tipo_cambio
 from decimal import Decimal
 
+# Todo lo que muestra la ficha de detalle, en un solo JOIN
+DETALLE_RELACIONES = ("editorial", "tipo_tapa", "idioma_original", "pais_edicion", "moneda", "precio_final")
+
+
 @login_required
 def libro_detalle(request, isbn):
-    # Normaliza ISBN (acepta con o sin guiones/espacios)
-    isbn_norm = isbn.replace("-", "").replace(" ", "").strip()
+    # Normaliza ISBN (acepta con o sin guiones/espacios, ISBN-10 o ISBN-13)
+    # y resuelve con una sola búsqueda por igualdad sobre el índice
+    isbn_norm = normalizar_isbn(isbn)
+    if not isbn_norm:
+        raise Http404("Ficha no encontrada")
+
+    # Solo se cachea el cuerpo de la ficha (base.html trae datos del usuario);
+    # el parcial no depende del usuario ni de su rol, así que se comparte.
+    # Cualquier cambio de fichas o de precios cambia la versión y por ende la clave.
+    key = f"ficha:detalle:{get_version()}:{get_version(PRECIOS)}:{isbn_norm}"
+    hit = cache.get(key)
+    if hit is None:
+        obj = (LibroFicha.objects.select_related(*DETALLE_RELACIONES)
+               .por_isbn(isbn)
+               .order_by("id")
+               .first())
+        if obj is None:
+            raise Http404("Ficha no encontrada")
+        html = render_to_string("catalogo/partials/ficha_detalle.html", {"obj": obj})
+        hit = (obj.isbn, html)
+        cache.set(key, hit, getattr(settings, "CATALOGO_DETALLE_TTL", 3600))
+
+    isbn_ficha, html = hit
+    return render(request, "catalogo/libro_detalle.html", {"isbn": isbn_ficha, "ficha_html": mark_safe(html)})
+
+
+AUTOCOMPLETAR_MAX = 20
 
-    obj = get_object_or_404(
-        LibroFicha.objects.select_related("editorial").filter(
-            Q(isbn=isbn) | Q(isbn=isbn_norm) | Q(isbn__iexact=isbn)
-        )
-    )
-    return render(request, "catalogo/libro_detalle.html", {"obj": obj})
 
+@login_required
+def autocompletar(request):
+    """
+    Sugerencias por prefijo para los buscadores del panel.
+    GET ?q=<texto>&tipos=titulo,autor,editorial&limite=10
+    El editor solo recibe sugerencias de sus editoriales.
+    """
+    q = (request.GET.get("q") or "").strip()
+    tipos = [t for t in (request.GET.get("tipos") or "").split(",") if t in TIPOS] or list(TIPOS)
+    try:
+        limite = max(1, min(int(request.GET.get("limite", 10)), AUTOCOMPLETAR_MAX))
+    except ValueError:
+        limite = 10
+
+    if len(q) < 2:
+        return JsonResponse({"q": q, "resultados": []})
+
+    indice = get_indice()
+    if indice is None:
+        # El índice del proceso aún se está construyendo (en un hilo): sin caché
+        return JsonResponse({"q": q, "resultados": [], "construyendo": True})
+
+    auth = get_auth_context(request.user)
+    editoriales = auth.editorial_ids if auth.is_editor else None
+    resultados = indice.buscar(q, tipos=tipos, editoriales=editoriales, limite=limite)
+
+    resp = JsonResponse({"q": q, "resultados": resultados})
+    resp["Cache-Control"] = "private, max-age=30"
+    return resp
 
 
 def actualizar_tc(request):
@@ -60,19 +119,3 @@ def actualizar_tc(request):
         })
 
     return JsonResponse({"ok": True, "resultados": resultados})
-
- #El método tiene que hacer que el precio del libro sea modificado por la información que tiene la editorial
-    
-def precio_final_sugerido(self) -> Decimal:
-        """
-        Calcula el precio sugerido considerando los porcentajes
-        definidos en la editorial.
-        """
-        total = (
-            (self.editorial.cargo_origen or 0) +
-            (self.editorial.recargo_fletes or 0) +
-            (self.editorial.gastos_indirectos or 0) +
-            (self.editorial.margen_comercializacion or 0)
-        )
-        return self.precio * (Decimal("1") + Decimal(total) / Decimal("100"))
-    
\ No newline at end of file
@@ -29,6 +29,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'roles.middleware.AuthContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -111,6 +112,52 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Caché (por defecto en memoria del proceso; en producción con varios workers
+# conviene una compartida, p. ej. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# y CACHE_LOCATION=/ruta/cache; con LocMemCache y DEBUG=False se avisa con catalogo.W001).
+# Las versiones del catálogo no dependen de esto: están en la BD (catalogo.VersionCache)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "liberalia"),
+    }
+}
+
+# Conteos del panel: TTL del conteo exacto y, sobre el umbral estimado de filas,
+# se muestra un total aproximado (EXPLAIN) en vez de bloquear con COUNT(*)
+PANEL_CONTEO_TTL = int(os.getenv("PANEL_CONTEO_TTL", 600))
+PANEL_CONTEO_APROX_UMBRAL = int(os.getenv("PANEL_CONTEO_APROX_UMBRAL", 50000))
+PANEL_CONTEO_APROX_TTL = int(os.getenv("PANEL_CONTEO_APROX_TTL", 60))
+
+# Autocompletado: segundos mínimos entre reconstrucciones del índice en memoria
+# cuando otro proceso modificó el catálogo (los cambios locales se ven al tiro)
+AUTOCOMPLETAR_REFRESCO = int(os.getenv("AUTOCOMPLETAR_REFRESCO", 60))
+
+# Ficha de detalle renderizada (por ISBN y rol); se invalida por versión de catálogo/precios
+CATALOGO_DETALLE_TTL = int(os.getenv("CATALOGO_DETALLE_TTL", 3600))
+
+# Exportaciones en segundo plano (manage.py procesar_exportaciones):
+# carpeta de archivos generados, vigencia del link de descarga y retención
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", BASE_DIR / "exports"))
+EXPORT_DESCARGA_TTL = int(os.getenv("EXPORT_DESCARGA_TTL", 3600))
+EXPORT_RETENCION_HORAS = int(os.getenv("EXPORT_RETENCION_HORAS", 24))
+# Caché en disco de descargas directas (EXPORT_DIR/cache), podada por tamaño total
+EXPORT_CACHE_MAX_MB = int(os.getenv("EXPORT_CACHE_MAX_MB", 512))
+# Procesos para generar las listas de precios por editorial (vacío = nº de núcleos)
+LISTAS_PRECIOS_PROCESOS = int(os.getenv("LISTAS_PRECIOS_PROCESOS", 0)) or None
+
+# Carga masiva por fragmentos: sesiones sin actividad se borran pasado este plazo
+CARGA_SESION_TTL_HORAS = int(os.getenv("CARGA_SESION_TTL_HORAS", 24))
+# Carga masiva en segundo plano (manage.py procesar_importaciones): archivos
+# recibidos a la espera del worker y retención de los registros terminados
+IMPORT_DIR = Path(os.getenv("IMPORT_DIR", BASE_DIR / "importaciones"))
+IMPORT_RETENCION_DIAS = int(os.getenv("IMPORT_RETENCION_DIAS", 30))
+# Segundos para confirmar una simulación (dry-run) antes de que se borren sus filas validadas
+IMPORT_SIMULACION_TTL = int(os.getenv("IMPORT_SIMULACION_TTL", 1800))
+# Segundos en cola tras los que el modal avisa que no hay un worker tomando las cargas
+IMPORT_SIN_WORKER_SEGUNDOS = int(os.getenv("IMPORT_SIN_WORKER_SEGUNDOS", 60))
+
+
 # Redirecciones post-login y logout
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
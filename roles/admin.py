@@ -14,7 +14,7 @@ los perfiles de usuario y sus roles en el sistema.
 
 
 from django.contrib import admin
-from .models import Profile
+from .models import Profile, TokenIntegracion
 
 
 # Registramos el modelo Profile en el admin de Django
@@ -26,3 +26,16 @@ class ProfileAdmin(admin.ModelAdmin):
     list_filter   = ("role",)
     # Habilitamos búsqueda por username y email del usuario relacionado
     search_fields = ("user__username", "user__email")
+
+
+# Tokens de la API de ingesta: se emiten con `manage.py crear_token_integracion`
+# (el token en claro no se guarda); aquí solo se revisan y se desactivan.
+@admin.register(TokenIntegracion)
+class TokenIntegracionAdmin(admin.ModelAdmin):
+    list_display  = ("nombre", "usuario", "prefijo", "activo", "creado", "ultimo_uso")
+    list_filter   = ("activo",)
+    search_fields = ("nombre", "prefijo", "usuario__username")
+    readonly_fields = ("prefijo", "creado", "ultimo_uso")
+
+    def has_add_permission(self, request):
+        return False
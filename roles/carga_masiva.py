@@ -0,0 +1,595 @@
+"""
+Carga masiva de fichas (plantilla Excel / JSON de static/js/carga_masiva.js).
+
+Validar una fila implica resolver cinco FKs (editorial, tipo de tapa, idioma,
+país y moneda). En vez de consultar la BD por cada fila, TablasReferencia lee
+cada tabla una sola vez y arma diccionarios por id, código y nombre (con
+casefold, como el __iexact de antes); después cada fila se resuelve en memoria.
+El resto de las reglas (dígito verificador del ISBN, rangos, largos) son las
+mismas de los forms del wizard y se aplican por lotes, columna a columna
+(roles/validacion.validar_lote).
+
+La plantilla .xlsx también se puede subir tal cual (vista ficha_upload): se
+lee en el servidor con openpyxl en modo read_only, fila a fila, y se valida e
+inserta por lotes, así que la memoria no depende del tamaño del archivo.
+
+Para clientes que envían filas JSON está además la carga por fragmentos
+(SesionCarga / FragmentoCarga): sesión -> fragmentos numerados, validados al
+llegar y reenviables -> finalizar (que encola la importación, como las demás
+cargas: roles/importaciones.py). Un corte solo obliga a reenviar desde el
+último fragmento confirmado.
+"""
+import hashlib
+import json
+import logging
+import re
+import zipfile
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from catalogo.models import Idioma, LibroFicha, Moneda, Pais, TipoTapa
+from catalogo.normalizacion import normalizar_isbn
+
+from .models import Editorial, FragmentoCarga, SesionCarga
+from .validacion import validar_lote
+
+log = logging.getLogger(__name__)
+
+
+def _clave(valor) -> str:
+    return str(valor).strip().casefold()
+
+
+def _indice(objs, *campos) -> dict:
+    """
+    {valor casefold -> objeto} para cada campo, en orden de prioridad: un
+    código gana sobre un nombre igual y, entre repetidos, el primero
+    (mismo resultado que filter(...__iexact).first()).
+    """
+    indice = {}
+    for campo in campos:
+        for obj in objs:
+            valor = getattr(obj, campo)
+            if valor not in (None, ""):
+                indice.setdefault(_clave(valor), obj)
+    return indice
+
+
+class TablasReferencia:
+    """Tablas de referencia de la carga masiva, leídas una vez por carga."""
+
+    def __init__(self):
+        editoriales = list(Editorial.objects.order_by("pk"))
+        self.editorial_por_id = {ed.pk: ed for ed in editoriales}
+        self.editorial_por_nombre = _indice(editoriales, "nombre")
+        self.tipos_tapa = _indice(list(TipoTapa.objects.all()), "nombre")
+        self.idiomas = _indice(list(Idioma.objects.all()), "code", "nombre")
+        self.paises = _indice(list(Pais.objects.all()), "code", "nombre")
+        self.monedas = _indice(list(Moneda.objects.all()), "code", "nombre")
+
+    def editorial(self, val):
+        if val is None:
+            return None
+        v = str(val).strip()
+        if v.isdigit():
+            return self.editorial_por_id.get(int(v))
+        return self.editorial_por_nombre.get(v.casefold())
+
+    def tipo_tapa(self, val):
+        return None if val is None else self.tipos_tapa.get(_clave(val))
+
+    def idioma(self, val):
+        return None if val is None else self.idiomas.get(_clave(val))
+
+    def pais(self, val):
+        return None if val is None else self.paises.get(_clave(val))
+
+    def moneda(self, val):
+        return None if val is None else self.monedas.get(_clave(val))
+
+
+# -----------------------------------------------
+# Plantilla .xlsx en streaming
+# -----------------------------------------------
+
+LOTE = 1000         # filas por consulta de ISBN existentes y por bulk_create
+MAX_ERRORES = 500   # detalle de errores que se devuelve (el conteo es completo)
+
+# Encabezados de la plantilla -> claves internas (igual que headerMap en carga_masiva.js)
+HEADER_MAP = {
+    'isbn': 'isbn', 'ean': 'ean', 'editorial': 'editorial', 'titulo': 'titulo', 'subtitulo': 'subtitulo',
+    'autor': 'autor', 'autor prologo': 'autor_prologo', 'traductor': 'traductor', 'ilustrador': 'ilustrador',
+    'tipo tapa': 'tipo_tapa', 'numero paginas': 'numero_paginas', 'alto cm': 'alto_cm', 'ancho cm': 'ancho_cm',
+    'grosor cm': 'grosor_cm', 'peso gr': 'peso_gr', 'idioma original': 'idioma_original',
+    'numero edicion': 'numero_edicion', 'fecha edicion': 'fecha_edicion', 'pais edicion': 'pais_edicion',
+    'numero impresion': 'numero_impresion', 'tematica': 'tematica', 'precio': 'precio', 'moneda': 'moneda',
+    'descuento distribuidor': 'descuento_distribuidor', 'resumen libro': 'resumen_libro',
+    'rango etario': 'rango_etario',
+}
+
+
+class ArchivoInvalido(ValueError):
+    pass
+
+
+def normalizar_encabezado(h) -> str:
+    key = str(h).strip().lower()
+    return HEADER_MAP.get(key) or re.sub(r"\s+", "_", key)
+
+
+def leer_xlsx(archivo):
+    """
+    (nº de fila en Excel, fila normalizada) de la primera hoja, en streaming.
+    Las filas completamente vacías se saltan.
+    """
+    try:
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError, OSError) as e:
+        raise ArchivoInvalido("El archivo no es una planilla Excel (.xlsx) válida") from e
+    try:
+        filas = wb.worksheets[0].iter_rows(values_only=True)
+        encabezado = next(filas, None) or ()
+        claves = [normalizar_encabezado(h) if h is not None else None for h in encabezado]
+        for n, valores in enumerate(filas, start=2):
+            if all(v is None or (isinstance(v, str) and not v.strip()) for v in valores):
+                continue
+            yield n, {k: v for k, v in zip(claves, valores) if k}
+    finally:
+        wb.close()
+
+
+# -----------------------------------------------
+# Importación (JSON o .xlsx)
+# -----------------------------------------------
+
+MODO_CREAR = 'crear'            # ISBN existente = error (comportamiento original)
+MODO_ACTUALIZAR = 'actualizar'  # upsert: crea los nuevos y actualiza los existentes
+MODOS = (MODO_CREAR, MODO_ACTUALIZAR)
+
+
+def _lotes(iterable, n):
+    it = iter(iterable)
+    while bloque := list(islice(it, n)):
+        yield bloque
+
+
+def _existentes(claves) -> dict:
+    """
+    {isbn normalizado: editorial_id} de los ISBN que ya están en la BD (una
+    consulta). Se compara por isbn_normalizado: un ISBN-10 de la planilla es
+    la misma ficha que su ISBN-13 ya guardado.
+    """
+    return dict(LibroFicha.objects.filter(isbn_normalizado__in=[c for c in claves if c])
+                .values_list('isbn_normalizado', 'editorial_id'))
+
+
+YA_EXISTE = 'Ese ISBN ya existe'
+DUPLICADO = 'ISBN duplicado dentro del archivo'
+
+
+def _revisar_isbn(isbns, por_fila, vistos, modo, editoriales) -> tuple[list[tuple[int, str]], dict]:
+    """
+    Revisa los ISBN ya normalizados de un bloque: repetidos en el archivo
+    (`vistos` se comparte entre bloques) y ya existentes según el modo. Los
+    errores de validación (`por_fila`) se informan después de esos.
+    Todo se compara por normalizar_isbn() (ISBN-10 y su ISBN-13 son el mismo).
+    Devuelve ([(índice en el bloque, mensaje)], {isbn normalizado existente: editorial_id}).
+    """
+    claves = [normalizar_isbn(isbn) if isbn else '' for isbn in isbns]
+    existentes = _existentes(claves)
+    errores = []
+    for i, clave in enumerate(claves):
+        if clave:
+            if clave in vistos:
+                errores.append((i, DUPLICADO))
+                continue
+            vistos.add(clave)
+            if clave in existentes:
+                if modo == MODO_CREAR:
+                    errores.append((i, YA_EXISTE))
+                    continue
+                if editoriales is not None and existentes[clave] not in editoriales:
+                    errores.append((i, 'Ese ISBN pertenece a otra editorial'))
+                    continue
+        if i in por_fila:
+            errores.append((i, por_fila[i]))
+    return errores, existentes
+
+
+def _revisar_bloque(filas, vistos, modo, editoriales, tablas) -> tuple[list[dict], list[tuple[int, str]], dict]:
+    """
+    Valida un bloque de filas por columnas (roles/validacion.validar_lote) y
+    revisa sus ISBN con _revisar_isbn().
+    Devuelve (datos limpios, [(índice en el bloque, mensaje)], {isbn normalizado existente: editorial_id}).
+    """
+    datos, por_fila = validar_lote(filas, tablas, editoriales)
+    errores, existentes = _revisar_isbn([d['isbn'] for d in datos], por_fila, vistos, modo, editoriales)
+    return datos, errores, existentes
+
+
+def importar(leer, modo: str = MODO_CREAR, editoriales=None, lote: int = LOTE, progreso=None) -> dict:
+    """
+    Valida e importa las filas que entrega leer() (un iterable nuevo de
+    (nº de fila, fila) en cada llamada: se recorre dos veces).
+
+    Si alguna fila falla no se escribe nada: una primera pasada valida todo
+    (por lotes, guardando solo los ISBN vistos) y una segunda escribe con
+    bulk_create / bulk_update por lote, cada lote en su transacción.
+
+    En MODO_ACTUALIZAR las fichas existentes se comparan por huella
+    (LibroFicha.huella): las que vienen sin cambios no se escriben. Con
+    `editoriales` (ids) solo se pueden actualizar fichas de esas editoriales.
+
+    progreso(avance) se llama después de cada lote con los contadores
+    {validadas, insertadas, fallidas, errores} (trabajos en segundo plano).
+    """
+    if modo not in MODOS:
+        raise ValueError(f'Modo de carga inválido: {modo}')
+
+    tablas = TablasReferencia()
+    errores, fallidas, validadas = [], 0, 0
+    vistos = set()
+
+    def avisar(insertadas=0):
+        if progreso is not None:
+            progreso({'validadas': validadas, 'insertadas': insertadas, 'fallidas': fallidas, 'errores': errores})
+
+    # 1) Validar sin escribir
+    for bloque in _lotes(leer(), lote):
+        _, errores_bloque, _ = _revisar_bloque([row for _, row in bloque], vistos, modo, editoriales, tablas)
+        for i, mensaje in errores_bloque:
+            fallidas += 1
+            if len(errores) < MAX_ERRORES:
+                n, row = bloque[i]
+                log.error("Carga masiva - fila %s: %s ; datos: %s", n, mensaje, row)
+                errores.append({'row': n, 'error': mensaje})
+        validadas += len(bloque)
+        avisar()
+
+    if fallidas:
+        return {'ok': False, 'created': 0, 'updated': 0, 'unchanged': 0, 'failed': fallidas, 'errors': errores}
+
+    # 2) Escribir por lotes (cada lote en su transacción, sin bloquear la tabla todo el rato)
+    def fichas():
+        for bloque in _lotes(leer(), lote):
+            datos, _ = validar_lote([row for _, row in bloque], tablas, editoriales)
+            yield [(n, LibroFicha(**d)) for (n, _), d in zip(bloque, datos)]
+
+    return _escribir(fichas(), modo, avisar)
+
+
+def _escribir(bloques, modo: str, avisar) -> dict:
+    """
+    Pasada de escritura: `bloques` entrega listas de (nº de fila, LibroFicha)
+    ya validadas. Las nuevas van con bulk_create y, en MODO_ACTUALIZAR, las
+    existentes que cambiaron (según la huella) con bulk_update. Un ISBN que
+    apareció entre la validación y la escritura (otra carga) se informa como
+    fila fallida en vez de romper el lote.
+    """
+    campos = [c for c in LibroFicha.campos_contenido() if c != 'isbn']
+    creadas = actualizadas = sin_cambios = fallidas = 0
+    errores = []
+    for bloque in bloques:
+        # Por isbn_normalizado, igual que _revisar_isbn()
+        claves = [normalizar_isbn(f.isbn) for _, f in bloque]
+        actuales = {clave: (pk, isbn, huella) for clave, pk, isbn, huella in LibroFicha.objects
+                    .filter(isbn_normalizado__in=claves).values_list('isbn_normalizado', 'id', 'isbn', 'huella')}
+
+        nuevas, cambiadas = [], []
+        for (n, ficha), clave in zip(bloque, claves):
+            actual = actuales.get(clave)
+            if actual is None:
+                nuevas.append(ficha)
+                continue
+            if modo == MODO_CREAR:
+                fallidas += 1
+                if len(errores) < MAX_ERRORES:
+                    errores.append({'row': n, 'error': YA_EXISTE})
+                continue
+            ficha.isbn = actual[1]  # se conserva el ISBN guardado (p. ej. el ISBN-13 de un ISBN-10)
+            ficha.actualizar_derivados()
+            if ficha.huella == actual[2]:
+                sin_cambios += 1
+                continue
+            ficha.pk = actual[0]
+            cambiadas.append(ficha)
+
+        with transaction.atomic():
+            if nuevas:
+                LibroFicha.objects.bulk_create(nuevas)
+            if cambiadas:
+                LibroFicha.objects.bulk_update(cambiadas, campos)
+        creadas += len(nuevas)
+        actualizadas += len(cambiadas)
+        avisar(creadas + actualizadas)
+
+    return {'ok': not fallidas, 'created': creadas, 'updated': actualizadas, 'unchanged': sin_cambios,
+            'failed': fallidas, 'errors': errores}
+
+
+def importar_xlsx(archivo, modo: str = MODO_CREAR, editoriales=None, lote: int = LOTE) -> dict:
+    """importar() sobre la plantilla .xlsx (la vuelve a abrir para la segunda pasada)."""
+    return importar(lambda: leer_xlsx(archivo), modo, editoriales, lote)
+
+
+# -----------------------------------------------
+# Ingesta por lotes independientes (API NDJSON)
+# -----------------------------------------------
+
+def ingerir(filas, modo: str = MODO_CREAR, editoriales=None, lote: int = LOTE):
+    """
+    Valida y escribe de a `lote` filas, cada lote por su cuenta: las filas
+    válidas de un lote se guardan aunque otras fallen, y se devuelve (yield)
+    el resultado de cada lote apenas termina. No guarda nada entre lotes (ni
+    siquiera los ISBN vistos: un ISBN repetido en otro lote lo detecta la BD
+    en modo "crear" o vuelve a actualizar en "actualizar"), así que la memoria
+    no depende del largo del flujo.
+
+    `filas` entrega (nº de línea, fila) o (nº de línea, ValueError) si la
+    línea no se pudo leer.
+    """
+    if modo not in MODOS:
+        raise ValueError(f'Modo de carga inválido: {modo}')
+
+    tablas = TablasReferencia()
+    for numero, bloque in enumerate(_lotes(filas, lote), start=1):
+        errores = [{'row': n, 'error': str(row)} for n, row in bloque if isinstance(row, ValueError)]
+        legibles = [(n, row) for n, row in bloque if not isinstance(row, ValueError)]
+
+        datos, errores_bloque, _ = _revisar_bloque([row for _, row in legibles], set(), modo, editoriales, tablas)
+        malas = set()
+        for i, mensaje in errores_bloque:
+            malas.add(i)
+            errores.append({'row': legibles[i][0], 'error': mensaje})
+
+        validas = [(n, LibroFicha(**d)) for i, ((n, _), d) in enumerate(zip(legibles, datos)) if i not in malas]
+        resultado = _escribir([validas], modo, lambda insertadas=0: None)
+        errores.extend(resultado['errors'])
+        errores.sort(key=lambda e: e['row'])
+        yield {
+            'lote': numero,
+            'desde': bloque[0][0],
+            'hasta': bloque[-1][0],
+            'created': resultado['created'],
+            'updated': resultado['updated'],
+            'unchanged': resultado['unchanged'],
+            'failed': len(errores),
+            'errors': errores,
+        }
+
+
+# -----------------------------------------------
+# Simulación: validar una vez, confirmar después
+# -----------------------------------------------
+
+_ATTNAMES = {f.name: f.attname for f in LibroFicha._meta.concrete_fields}
+_POR_ATTNAME = {f.attname: f for f in LibroFicha._meta.concrete_fields}
+
+
+def _serializar(datos: dict) -> dict:
+    """Fila limpia -> JSON: FKs como id (attname), fechas y decimales como texto."""
+    return {_ATTNAMES[k]: getattr(v, 'pk', v) for k, v in datos.items()}
+
+
+def _ficha_validada(datos: dict) -> LibroFicha:
+    """Inversa de _serializar, sin volver a validar ni resolver FKs."""
+    return LibroFicha(**{k: _POR_ATTNAME[k].to_python(v) for k, v in datos.items()})
+
+
+def simular(leer, destino, modo: str = MODO_CREAR, editoriales=None, lote: int = LOTE, progreso=None) -> dict:
+    """
+    Valida como la primera pasada de importar() pero no escribe en LibroFicha:
+    deja las filas válidas ya normalizadas en `destino` (NDJSON, una
+    [nº de fila, datos] por línea) para confirmarlas con importar_validadas().
+
+    El resumen separa las filas nuevas, las que ya existen (en MODO_ACTUALIZAR
+    se comparan con la ficha al confirmar), las duplicadas (repetidas en el
+    archivo o, en MODO_CREAR, ya existentes) y las inválidas.
+    """
+    if modo not in MODOS:
+        raise ValueError(f'Modo de carga inválido: {modo}')
+
+    tablas = TablasReferencia()
+    vistos, errores = set(), []
+    validadas = nuevas = existentes = duplicadas = invalidas = 0
+
+    with open(destino, 'w', encoding='utf-8') as f:
+        for bloque in _lotes(leer(), lote):
+            datos, errores_bloque, en_bd = _revisar_bloque([row for _, row in bloque], vistos, modo, editoriales, tablas)
+            malas = set()
+            for i, mensaje in errores_bloque:
+                malas.add(i)
+                if mensaje in (DUPLICADO, YA_EXISTE):
+                    duplicadas += 1
+                else:
+                    invalidas += 1
+                if len(errores) < MAX_ERRORES:
+                    errores.append({'row': bloque[i][0], 'error': mensaje})
+            for i, ((n, _), d) in enumerate(zip(bloque, datos)):
+                if i in malas:
+                    continue
+                if normalizar_isbn(d['isbn']) in en_bd:
+                    existentes += 1
+                else:
+                    nuevas += 1
+                f.write(json.dumps([n, _serializar(d)], ensure_ascii=False, default=str))
+                f.write('\n')
+            validadas += len(bloque)
+            if progreso is not None:
+                progreso({'validadas': validadas, 'insertadas': 0, 'fallidas': duplicadas + invalidas,
+                          'errores': errores})
+
+    return {'ok': not (duplicadas or invalidas), 'simulacion': True, 'nuevas': nuevas, 'existentes': existentes,
+            'duplicadas': duplicadas, 'invalidas': invalidas, 'failed': duplicadas + invalidas, 'errors': errores}
+
+
+def leer_validadas(ruta):
+    """(nº de fila, LibroFicha) desde el archivo que dejó simular()."""
+    with open(ruta, encoding='utf-8') as f:
+        for linea in f:
+            n, datos = json.loads(linea)
+            yield n, _ficha_validada(datos)
+
+
+def importar_validadas(ruta, modo: str = MODO_CREAR, lote: int = LOTE, progreso=None) -> dict:
+    """Escribe las filas que validó simular(): solo la pasada de escritura de importar()."""
+    leidas = 0
+
+    def bloques():
+        nonlocal leidas
+        for bloque in _lotes(leer_validadas(ruta), lote):
+            leidas += len(bloque)
+            yield bloque
+
+    def avisar(insertadas=0):
+        if progreso is not None:
+            progreso({'validadas': leidas, 'insertadas': insertadas, 'fallidas': 0, 'errores': []})
+
+    return _escribir(bloques(), modo, avisar)
+
+
+# -----------------------------------------------
+# Carga por fragmentos (reanudable)
+# -----------------------------------------------
+
+MAX_FILAS_FRAGMENTO = 5000
+
+
+class CargaIncompleta(ValueError):
+    pass
+
+
+def guardar_fragmento(sesion: SesionCarga, numero: int, filas: list, editoriales=None) -> FragmentoCarga:
+    """
+    Guarda (o reemplaza) el fragmento `numero` y lo valida: FKs, campos,
+    duplicados dentro del fragmento e ISBN existentes. Reenviar exactamente el
+    mismo contenido no vuelve a validar. Los duplicados entre fragmentos se
+    revisan al finalizar.
+    """
+    huella = hashlib.sha1(json.dumps(filas, sort_keys=True, default=str).encode()).hexdigest()
+    actual = sesion.fragmentos.filter(numero=numero).first()
+    if actual is not None and actual.huella == huella:
+        return actual
+
+    _, errores_fragmento, _ = _revisar_bloque(filas, set(), sesion.modo, editoriales, TablasReferencia())
+    errores = [{'row': i + 1, 'error': mensaje} for i, mensaje in errores_fragmento]
+
+    fragmento, _ = FragmentoCarga.objects.update_or_create(
+        sesion=sesion, numero=numero,
+        defaults={'filas': filas, 'n_filas': len(filas), 'valido': not errores,
+                  'errores': errores[:MAX_ERRORES], 'huella': huella},
+    )
+    SesionCarga.objects.filter(pk=sesion.pk).update(actualizado=timezone.now())
+    return fragmento
+
+
+def errores_fragmento(fragmento: FragmentoCarga) -> list[dict]:
+    """
+    Errores del fragmento con el nº de fila del archivo completo (`row`, el
+    mismo que usa la importación al finalizar) y su posición dentro del
+    fragmento (`fragmento`, `fila_fragmento`). Si aún falta algún fragmento
+    anterior no se puede saber la fila global y `row` va en None.
+    """
+    if not fragmento.errores:
+        return []
+    anteriores = (FragmentoCarga.objects.filter(sesion_id=fragmento.sesion_id, numero__lt=fragmento.numero)
+                  .aggregate(n=Count('pk'), filas=Sum('n_filas')))
+    desde = (anteriores['filas'] or 0) if anteriores['n'] == fragmento.numero - 1 else None
+    return [{'row': None if desde is None else desde + e['row'], 'fragmento': fragmento.numero,
+             'fila_fragmento': e['row'], 'error': e['error']} for e in fragmento.errores]
+
+
+def estado_sesion(sesion: SesionCarga) -> dict:
+    """
+    Estado para el cliente. `ultimo_confirmado` es el mayor N tal que los
+    fragmentos 1..N ya llegaron: para retomar se envía desde N + 1 (y se
+    reenvían los que figuren como no válidos, ya corregidos).
+    """
+    fragmentos = list(sesion.fragmentos.order_by('numero').values('numero', 'n_filas', 'valido'))
+    ultimo = 0
+    for f in fragmentos:
+        if f['numero'] != ultimo + 1:
+            break
+        ultimo += 1
+    return {
+        'id': sesion.pk,
+        'modo': sesion.modo,
+        'estado': sesion.estado,
+        'ultimo_confirmado': ultimo,
+        'filas': sum(f['n_filas'] for f in fragmentos),
+        'fragmentos': fragmentos,
+        'resultado': sesion.resultado or None,
+    }
+
+
+def filas_de_sesion(sesion: SesionCarga):
+    """(nº de fila global, fila) leyendo un fragmento a la vez."""
+    n = 0
+    for pk in sesion.fragmentos.order_by('numero').values_list('pk', flat=True):
+        for row in FragmentoCarga.objects.values_list('filas', flat=True).get(pk=pk):
+            n += 1
+            yield n, row
+
+
+def tomar_sesion(sesion: SesionCarga, total: int | None = None) -> int:
+    """
+    Deja la sesión lista para importarse en segundo plano: exige los
+    fragmentos 1..total (o 1..último), todos válidos, y la pasa a PROCESANDO
+    (solo un finalizar a la vez). Devuelve el total de filas.
+    """
+    recibidos = list(sesion.fragmentos.order_by('numero').values_list('numero', 'valido', 'n_filas'))
+    total = total or (recibidos[-1][0] if recibidos else 0)
+    numeros = {n for n, _, _ in recibidos}
+    faltan = [n for n in range(1, total + 1) if n not in numeros]
+    if not total or faltan:
+        raise CargaIncompleta(f"Faltan fragmentos: {faltan[:20] or 'todos'}")
+    if any(n > total for n in numeros):
+        raise CargaIncompleta(f"Hay fragmentos después del {total}")
+    invalidos = [n for n, valido, _ in recibidos if not valido]
+    if invalidos:
+        raise CargaIncompleta(f"Hay fragmentos con errores: {invalidos[:20]}")
+
+    tomada = (SesionCarga.objects.filter(pk=sesion.pk, estado=SesionCarga.ESTADO_ABIERTA)
+              .update(estado=SesionCarga.ESTADO_PROCESANDO))
+    if not tomada:
+        raise CargaIncompleta("La carga ya se está procesando o ya terminó")
+    sesion.estado = SesionCarga.ESTADO_PROCESANDO
+    return sum(n_filas for _, _, n_filas in recibidos)
+
+
+def importar_sesion(sesion: SesionCarga, editoriales=None, progreso=None) -> dict:
+    """
+    Importa una sesión ya tomada (tomar_sesion) con importar(): escritura por
+    lotes, cada uno en su transacción. Lo llama el worker de importaciones.
+    Si la importación encuentra errores la sesión vuelve a quedar abierta
+    para corregirlos.
+    """
+    try:
+        resultado = importar(lambda: filas_de_sesion(sesion), sesion.modo, editoriales, progreso=progreso)
+    except Exception:
+        SesionCarga.objects.filter(pk=sesion.pk).update(estado=SesionCarga.ESTADO_ABIERTA)
+        raise
+
+    sesion.resultado = resultado
+    if resultado['ok']:
+        sesion.estado = SesionCarga.ESTADO_FINALIZADA
+        sesion.fragmentos.all().delete()  # las filas ya están en LibroFicha
+    else:
+        sesion.estado = SesionCarga.ESTADO_ABIERTA
+    sesion.save(update_fields=['estado', 'resultado', 'actualizado'])
+    return resultado
+
+
+def purgar_sesiones() -> int:
+    """Borra las sesiones sin actividad hace más de CARGA_SESION_TTL_HORAS."""
+    limite = timezone.now() - timedelta(hours=getattr(settings, 'CARGA_SESION_TTL_HORAS', 24))
+    borradas, _ = (SesionCarga.objects.filter(actualizado__lt=limite)
+                   .exclude(estado=SesionCarga.ESTADO_PROCESANDO).delete())
+    return borradas
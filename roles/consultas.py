@@ -0,0 +1,208 @@
+"""
+Consultas del panel de fichas: filtros, orden y columnas.
+
+Lo usan las vistas del panel (roles/views.py) y el worker de exportaciones
+(roles/exportaciones.py), así que una exportación en segundo plano arma
+exactamente el mismo queryset que la descarga directa.
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Q
+
+from catalogo.busqueda import buscar_texto
+from catalogo.models import LibroFicha
+from catalogo.normalizacion import plegar_texto, prefijos_isbn
+
+from .autorizacion import get_auth_context
+from .models import Profile
+
+ALLOWED_SORTS = {
+    "isbn": "isbn",
+    "titulo": "titulo",
+    "autor": "autor",
+    "editorial": "editorial__nombre",
+    "fecha": "fecha_edicion",
+    # precio final en CLP materializado (catalogo/precios.py), con su índice
+    "precio": "precio_final__monto_clp",
+}
+
+# Orden sin ?sort= (el mismo de LibroFicha.Meta.ordering); lo usa el cursor keyset
+ORDEN_POR_DEFECTO = "titulo"
+
+# Columnas que muestra la tabla del panel: solo esas se leen de la BD
+# (deja fuera resumen_libro y el resto de la ficha). Deben incluir los
+# campos de ALLOWED_SORTS, que usa el cursor de la paginación keyset.
+PANEL_COLUMNAS = ("isbn", "titulo", "autor", "fecha_edicion", "editorial__nombre", "precio_final__monto_clp")
+
+# Columnas exportables: clave (encabezado del archivo) -> (ruta para values(), etiqueta).
+# Las FK se resuelven con JOIN en la misma consulta, sin una query por fila.
+EXPORT_COLUMNAS = {
+    "isbn": ("isbn", "ISBN"),
+    "ean": ("ean", "EAN"),
+    "editorial": ("editorial__nombre", "Editorial"),
+    "titulo": ("titulo", "Título"),
+    "subtitulo": ("subtitulo", "Subtítulo"),
+    "autor": ("autor", "Autor"),
+    "autor_prologo": ("autor_prologo", "Autor prólogo"),
+    "traductor": ("traductor", "Traductor"),
+    "ilustrador": ("ilustrador", "Ilustrador"),
+    "tipo_tapa": ("tipo_tapa__nombre", "Tipo de tapa"),
+    "numero_paginas": ("numero_paginas", "N° páginas"),
+    "alto_cm": ("alto_cm", "Alto (cm)"),
+    "ancho_cm": ("ancho_cm", "Ancho (cm)"),
+    "grosor_cm": ("grosor_cm", "Grosor (cm)"),
+    "peso_gr": ("peso_gr", "Peso (gr)"),
+    "idioma_original": ("idioma_original__nombre", "Idioma original"),
+    "numero_edicion": ("numero_edicion", "N° edición"),
+    "fecha_edicion": ("fecha_edicion", "Fecha edición"),
+    "pais_edicion": ("pais_edicion__nombre", "País edición"),
+    "numero_impresion": ("numero_impresion", "N° impresión"),
+    "tematica": ("tematica", "Temática"),
+    "precio": ("precio", "Precio"),
+    "moneda": ("moneda__nombre", "Moneda"),
+    "descuento_distribuidor": ("descuento_distribuidor", "Descuento distribuidor"),
+    "precio_final": ("precio_final__monto", "Precio final sugerido"),
+    "precio_final_clp": ("precio_final__monto_clp", "Precio final sugerido (CLP)"),
+    "resumen_libro": ("resumen_libro", "Resumen"),
+    "rango_etario": ("rango_etario", "Rango etario"),
+}
+
+
+def columnas_export(params) -> list[str]:
+    """
+    Columnas pedidas en ?cols= (acepta 'a,b,c' o cols repetido), en el orden
+    recibido y filtradas contra EXPORT_COLUMNAS. Sin selección: todas.
+    """
+    pedidas = [c.strip() for v in params.getlist("cols") for c in v.split(",")]
+    cols = [c for c in dict.fromkeys(pedidas) if c in EXPORT_COLUMNAS]
+    return cols or list(EXPORT_COLUMNAS)
+
+def _parse_date(s: str | None):
+    if not s:
+        return None
+    # <input type="date"> entrega 'YYYY-MM-DD'
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _parse_precio(s: str | None):
+    if not s:
+        return None
+    try:
+        valor = Decimal(s.strip().replace(",", "."))
+    except ArithmeticError:
+        return None
+    return valor if valor.is_finite() and valor >= 0 else None
+
+
+def normalizar_filtros(user, params) -> dict:
+    """
+    Reduce los parámetros del panel a los filtros que realmente aplican según
+    el rol (texto recortado, fechas parseadas, alcance de editoriales).
+    Es la única fuente de verdad para build_queryset_for_user y para la firma
+    con que se cachean los conteos, así ambos nunca difieren.
+    """
+    auth = get_auth_context(user)
+    role = auth.role
+    filtros = {"role": role}
+
+    if role == Profile.ROLE_EDITOR:
+        filtros["q_titulo"] = (params.get("q_titulo") or "").strip()
+        filtros["q_isbn"] = (params.get("q_isbn") or "").strip()
+        filtros["editoriales"] = sorted(auth.editorial_ids)
+    else:
+        filtros["q"] = (params.get("q") or "").strip()
+
+    filtros["date_from"] = _parse_date(params.get("date_from"))
+    filtros["date_to"] = _parse_date(params.get("date_to"))
+    filtros["precio_min"] = _parse_precio(params.get("precio_min"))
+    filtros["precio_max"] = _parse_precio(params.get("precio_max"))
+    return filtros
+
+
+def firma_filtros(filtros: dict) -> str:
+    """
+    Hash estable de los filtros normalizados (clave de caché). Los textos se
+    pliegan igual que en la búsqueda: "Pérez" y "perez" dan la misma firma.
+    """
+    data = {
+        k: (v.isoformat() if isinstance(v, date) else plegar_texto(v) if isinstance(v, str) else v)
+        for k, v in filtros.items()
+    }
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def build_queryset_for_user(user, params, filtros=None):
+    """
+    Construye un queryset de LibroFicha respetando:
+    - Para ADMIN/CONSULTOR: búsqueda SOLO por EDITORIAL (q)
+    - Para EDITOR: búsqueda de texto (q_titulo: título, subtítulo, autor y resumen, más
+      subcadenas de título/autor/ISBN) e ISBN (q_isbn)
+    - Rango de fechas (date_from, date_to)
+    - Rango de precio final en CLP (precio_min, precio_max)
+    - Límite por rol (editor ve solo sus editoriales)
+    - Ordenamiento (?sort=)
+    """
+    qs = LibroFicha.objects.select_related("editorial", "precio_final")
+
+    if filtros is None:
+        filtros = normalizar_filtros(user, params)
+    role = filtros["role"]
+
+    # --- filtros por texto según rol ---
+    if role == Profile.ROLE_EDITOR:
+        q_titulo = filtros["q_titulo"]
+        q_isbn   = filtros["q_isbn"]
+        if q_titulo:
+            # texto completo sobre título/subtítulo/autor/resumen (anota 'relevancia')
+            # + fragmentos de título/autor/ISBN vía índice de trigramas
+            qs = buscar_texto(qs, q_titulo, subcadena=True)
+        if q_isbn:
+            # prefijo sobre isbn_normalizado (rango del índice, sin LIKE '%..%')
+            prefijos = prefijos_isbn(q_isbn)
+            if prefijos:
+                cond = Q()
+                for p in prefijos:
+                    cond |= Q(isbn_normalizado__startswith=p)
+                qs = qs.filter(cond)
+            else:
+                qs = qs.none()  # no trae ningún dígito: no puede calzar con un ISBN
+    else:
+        q = filtros["q"]
+        if q:
+            # prefijo sin tildes/mayúsculas sobre la clave plegada de la editorial
+            # (rango del índice de nombre_busqueda, sin LIKE '%..%')
+            qs = qs.filter(editorial__nombre_busqueda__startswith=plegar_texto(q))
+
+    # --- fechas ---
+    date_from = filtros["date_from"]  # fecha inicial ya convertida desde los parámetros
+    date_to   = filtros["date_to"] # fecha final ya convertida desde los parámetros
+    if date_from:
+        qs = qs.filter(fecha_edicion__gte=date_from)  # filtra registros con fecha_edicion mayor o igual a date_from
+    if date_to:
+        qs = qs.filter(fecha_edicion__lte=date_to) # filtra registros con fecha_edicion menor o igual a date_to
+
+    # --- precio final (CLP), por el índice de PrecioFicha ---
+    if filtros["precio_min"] is not None:
+        qs = qs.filter(precio_final__monto_clp__gte=filtros["precio_min"])
+    if filtros["precio_max"] is not None:
+        qs = qs.filter(precio_final__monto_clp__lte=filtros["precio_max"])
+
+    # --- restricción por rol (EDITOR: solo sus editoriales) ---
+    if role == Profile.ROLE_EDITOR:
+        qs = qs.filter(editorial_id__in=filtros["editoriales"])
+
+    # --- orden ---
+    sort_key = params.get("sort") or ""
+    if sort_key in ALLOWED_SORTS:
+        qs = qs.order_by(ALLOWED_SORTS[sort_key])
+    elif role == Profile.ROLE_EDITOR and filtros["q_titulo"]:
+        qs = qs.order_by("-relevancia", "titulo")  # más relevantes primero
+
+    return qs
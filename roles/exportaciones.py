@@ -0,0 +1,376 @@
+"""
+Exportaciones del panel en segundo plano.
+
+Con ?segundo_plano=1 el panel no genera el archivo en el request: lo encola
+como TrabajoExportacion y responde JSON al tiro. El comando
+`manage.py procesar_exportaciones` toma los pendientes, escribe el archivo en
+EXPORT_DIR (reportando el avance) y el panel consulta el estado hasta que
+aparece un link de descarga firmado y con vencimiento.
+
+Si el mismo usuario pide la misma exportación (mismos filtros normalizados,
+orden, columnas y formato, sobre la misma versión del catálogo) mientras la
+anterior está pendiente, en curso o lista, se reutiliza ese trabajo.
+
+Las descargas directas se guardan además en una caché de archivos en disco
+(EXPORT_DIR/cache) con la misma firma como clave: el alcance del usuario
+(rol / editoriales) va dentro de los filtros normalizados y la versión del
+catálogo la invalida sola. Se poda por tamaño total (LRU por mtime) y la
+firma sirve de ETag para responder 304 a descargas repetidas.
+
+Las listas de precios por editorial (roles/listas_precios.py) usan la misma
+cola con tipo LISTAS: el worker deja el .zip en esta caché con la clave
+firma_listas() y la vista de ADMIN solo lo sirve o encola el trabajo.
+"""
+import hashlib
+import json
+import logging
+import os
+import secrets
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, QueryDict
+from django.urls import reverse
+from django.utils import timezone
+
+from catalogo.versiones import PRECIOS, get_version
+
+from .consultas import (
+    ALLOWED_SORTS, EXPORT_COLUMNAS, ORDEN_POR_DEFECTO, build_queryset_for_user, columnas_export, firma_filtros,
+    normalizar_filtros,
+)
+from .listas_precios import firma_listas, generar_listas
+from .models import TrabajoExportacion
+
+log = logging.getLogger(__name__)
+
+DESCARGA_SALT = "roles.exportacion.descarga"
+PASO_PROGRESO = 1000  # filas entre actualizaciones de 'procesadas'
+
+# Parámetros del panel que no cambian el contenido del archivo
+_IGNORAR = {"page", "after", "limit", "export", "segundo_plano", "paginacion"}
+
+
+def export_dir() -> Path:
+    ruta = Path(settings.EXPORT_DIR)
+    ruta.mkdir(parents=True, exist_ok=True)
+    return ruta
+
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "zip": "application/zip",
+}
+
+
+def respuesta_archivo(ruta: Path, formato: str) -> FileResponse:
+    return FileResponse(open(ruta, "rb"), as_attachment=True,
+                        filename=f"resultado_busqueda.{formato}", content_type=CONTENT_TYPES[formato])
+
+
+def respuesta_listas(ruta: Path, formato: str) -> FileResponse:
+    """El .zip de listas de precios (`formato` es el de las planillas de adentro)."""
+    return FileResponse(open(ruta, "rb"), as_attachment=True,
+                        filename=f"listas_precios_{formato}.zip", content_type=CONTENT_TYPES["zip"])
+
+
+def respuesta_trabajo(trabajo: TrabajoExportacion) -> FileResponse:
+    ruta = export_dir() / trabajo.archivo
+    if trabajo.tipo == TrabajoExportacion.TIPO_LISTAS:
+        return respuesta_listas(ruta, trabajo.formato)
+    return respuesta_archivo(ruta, trabajo.formato)
+
+
+def _parametros(params) -> dict:
+    """QueryDict -> dict de listas (JSON), sin los parámetros de navegación."""
+    return {k: v for k, v in params.lists() if k not in _IGNORAR}
+
+
+def _querydict(parametros: dict) -> QueryDict:
+    qd = QueryDict(mutable=True)
+    for k, valores in parametros.items():
+        qd.setlist(k, valores)
+    return qd
+
+
+def firma_exportacion(user, formato: str, params) -> str:
+    datos = {
+        "filtros": firma_filtros(normalizar_filtros(user, params)),
+        "sort": params.get("sort") or "",
+        "cols": columnas_export(params),
+        "formato": formato,
+        "version": get_version(),
+        "precios": get_version(PRECIOS),  # columnas de precio final
+    }
+    return hashlib.sha1(json.dumps(datos, sort_keys=True).encode()).hexdigest()
+
+
+def archivo_disponible(trabajo: TrabajoExportacion) -> bool:
+    return bool(trabajo.archivo) and (export_dir() / trabajo.archivo).exists()
+
+
+def _encolar(user, tipo: str, formato: str, firma: str, parametros: dict) -> TrabajoExportacion:
+    """Crea el trabajo, o devuelve uno equivalente que siga vigente."""
+    existente = (TrabajoExportacion.objects
+                 .filter(usuario=user, tipo=tipo, firma=firma)
+                 .exclude(estado=TrabajoExportacion.ESTADO_ERROR)
+                 .order_by("-creado")
+                 .first())
+    if existente and (existente.estado != TrabajoExportacion.ESTADO_LISTO or archivo_disponible(existente)):
+        return existente
+
+    return TrabajoExportacion.objects.create(
+        usuario=user,
+        tipo=tipo,
+        formato=formato,
+        parametros=parametros,
+        firma=firma,
+    )
+
+
+def encolar_exportacion(user, formato: str, params) -> TrabajoExportacion:
+    return _encolar(user, TrabajoExportacion.TIPO_PANEL, formato, firma_exportacion(user, formato, params),
+                    _parametros(params))
+
+
+def encolar_listas(user, formato: str) -> TrabajoExportacion:
+    """Listas de precios: la firma es la clave del .zip en la caché (firma_listas)."""
+    return _encolar(user, TrabajoExportacion.TIPO_LISTAS, formato, firma_listas(formato), {})
+
+
+# -----------------------------------------------
+# Descarga con link firmado
+# -----------------------------------------------
+
+def token_descarga(trabajo: TrabajoExportacion) -> str:
+    return signing.TimestampSigner(salt=DESCARGA_SALT).sign(str(trabajo.pk))
+
+
+def leer_token_descarga(token: str) -> int | None:
+    """pk del trabajo, o None si el token es inválido o ya venció."""
+    try:
+        valor = signing.TimestampSigner(salt=DESCARGA_SALT).unsign(
+            token, max_age=getattr(settings, "EXPORT_DESCARGA_TTL", 3600)
+        )
+    except signing.BadSignature:  # incluye SignatureExpired
+        return None
+    return int(valor)
+
+
+def estado_json(trabajo: TrabajoExportacion) -> dict:
+    data = {
+        "id": trabajo.pk,
+        "estado": trabajo.estado,
+        "procesadas": trabajo.procesadas,
+        "total": trabajo.total,
+        "porcentaje": trabajo.porcentaje,
+        "url_estado": reverse("roles:exportacion_estado", args=[trabajo.pk]),
+        "url_descarga": None,
+        "error": trabajo.error or None,
+    }
+    if trabajo.estado == TrabajoExportacion.ESTADO_LISTO:
+        data["url_descarga"] = reverse("roles:exportacion_descargar", args=[token_descarga(trabajo)])
+    return data
+
+
+# -----------------------------------------------
+# Worker
+# -----------------------------------------------
+
+def tomar_siguiente() -> TrabajoExportacion | None:
+    """
+    Marca como PROCESANDO el pendiente más antiguo. El UPDATE condicionado
+    al estado evita que dos workers tomen el mismo trabajo.
+    """
+    pendientes = TrabajoExportacion.objects.filter(estado=TrabajoExportacion.ESTADO_PENDIENTE)
+    for pk in pendientes.order_by("creado").values_list("pk", flat=True)[:10]:
+        tomado = (TrabajoExportacion.objects
+                  .filter(pk=pk, estado=TrabajoExportacion.ESTADO_PENDIENTE)
+                  .update(estado=TrabajoExportacion.ESTADO_PROCESANDO, iniciado=timezone.now()))
+        if tomado:
+            return TrabajoExportacion.objects.select_related("usuario").get(pk=pk)
+    return None
+
+
+def _con_progreso(trabajo, filas):
+    n = 0
+    for fila in filas:
+        yield fila
+        n += 1
+        if n % PASO_PROGRESO == 0:
+            TrabajoExportacion.objects.filter(pk=trabajo.pk).update(procesadas=n)
+    trabajo.procesadas = n
+
+
+def procesar(trabajo: TrabajoExportacion) -> None:
+    """Genera el archivo del trabajo (ya marcado como PROCESANDO)."""
+    if trabajo.tipo == TrabajoExportacion.TIPO_LISTAS:
+        return procesar_listas(trabajo)
+
+    from templates.reports.search_result import escribir_csv, escribir_xlsx
+
+    from .paginacion import recorrer_por_lotes
+
+    try:
+        params = _querydict(trabajo.parametros)
+        qs = build_queryset_for_user(trabajo.usuario, params)
+        trabajo.total = qs.count()
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(total=trabajo.total)
+
+        cols = columnas_export(params)
+        rutas = [EXPORT_COLUMNAS[c][0] for c in cols]
+        sort_field = ALLOWED_SORTS.get(params.get("sort") or "", ORDEN_POR_DEFECTO)
+        filas = _con_progreso(trabajo, recorrer_por_lotes(qs, sort_field, rutas))
+
+        nombre = f"{trabajo.pk}-{trabajo.firma[:10]}.{trabajo.formato}"
+        destino = export_dir() / nombre
+        parcial = destino.with_name(nombre + ".parcial")
+        if trabajo.formato == "csv":
+            escribir_csv(parcial, cols, filas)
+        else:
+            escribir_xlsx(parcial, cols, filas)
+        os.replace(parcial, destino)  # el link solo aparece con el archivo completo
+
+        trabajo.archivo = nombre
+        trabajo.estado = TrabajoExportacion.ESTADO_LISTO
+    except Exception as e:
+        log.exception("Falló la exportación %s", trabajo.pk)
+        trabajo.estado = TrabajoExportacion.ESTADO_ERROR
+        trabajo.error = str(e)[:1000]
+
+    trabajo.terminado = timezone.now()
+    trabajo.save(update_fields=["estado", "archivo", "error", "procesadas", "total", "terminado"])
+
+
+def generar_listas_en_cache(clave: str, formato: str, procesos: int | None = None) -> tuple[Path, int]:
+    """
+    Genera el .zip de listas de precios con la clave `clave` en la caché (si
+    no está ya). Devuelve (ruta, nº de fichas; 0 si ya estaba).
+    """
+    ruta = buscar_en_cache(clave, "zip")
+    if ruta is not None:
+        return ruta, 0
+    parcial = archivo_parcial(clave, "zip")
+    procesos = procesos or getattr(settings, "LISTAS_PRECIOS_PROCESOS", None)
+    try:
+        resumen = generar_listas(parcial, formato, procesos=procesos)
+    except BaseException:
+        parcial.unlink(missing_ok=True)
+        raise
+    return guardar_en_cache(parcial, clave, "zip"), sum(r["filas"] for r in resumen)
+
+
+def procesar_listas(trabajo: TrabajoExportacion) -> None:
+    """Trabajo TIPO_LISTAS: el .zip queda en la caché y el trabajo apunta a él."""
+    try:
+        ruta, trabajo.procesadas = generar_listas_en_cache(trabajo.firma, trabajo.formato)
+        trabajo.archivo = str(ruta.relative_to(export_dir()))
+        trabajo.estado = TrabajoExportacion.ESTADO_LISTO
+    except Exception as e:
+        log.exception("Fallaron las listas de precios %s", trabajo.pk)
+        trabajo.estado = TrabajoExportacion.ESTADO_ERROR
+        trabajo.error = str(e)[:1000]
+
+    trabajo.terminado = timezone.now()
+    trabajo.save(update_fields=["estado", "archivo", "error", "procesadas", "total", "terminado"])
+
+
+def purgar_vencidas() -> int:
+    """Borra archivos y registros más antiguos que EXPORT_RETENCION_HORAS."""
+    limite = timezone.now() - timedelta(hours=getattr(settings, "EXPORT_RETENCION_HORAS", 24))
+    viejas = TrabajoExportacion.objects.filter(creado__lt=limite).exclude(
+        estado=TrabajoExportacion.ESTADO_PROCESANDO
+    )
+    # Los de la caché (listas de precios) los poda podar_cache()
+    for nombre in viejas.exclude(archivo="").exclude(archivo__startswith="cache/").values_list("archivo", flat=True):
+        try:
+            (export_dir() / nombre).unlink()
+        except FileNotFoundError:
+            pass
+    borradas, _ = viejas.delete()
+    return borradas
+
+
+# -----------------------------------------------
+# Caché de archivos (descargas directas)
+# -----------------------------------------------
+
+_SUFIJO_PARCIAL = ".parcial"
+
+
+def cache_dir() -> Path:
+    ruta = export_dir() / "cache"
+    ruta.mkdir(parents=True, exist_ok=True)
+    return ruta
+
+
+def buscar_en_cache(clave: str, formato: str) -> Path | None:
+    ruta = cache_dir() / f"{clave}.{formato}"
+    try:
+        os.utime(ruta)  # marca de uso para el LRU
+    except FileNotFoundError:
+        return None
+    return ruta
+
+
+def archivo_parcial(clave: str, formato: str) -> Path:
+    """Temporal único dentro de la caché (dos requests iguales no se pisan)."""
+    return cache_dir() / f"{clave}.{formato}.{secrets.token_hex(4)}{_SUFIJO_PARCIAL}"
+
+
+def guardar_en_cache(parcial: Path, clave: str, formato: str) -> Path:
+    ruta = cache_dir() / f"{clave}.{formato}"
+    os.replace(parcial, ruta)
+    podar_cache(excepto=ruta)
+    return ruta
+
+
+def podar_cache(excepto: Path | None = None) -> None:
+    """
+    Borra los archivos usados hace más tiempo hasta que la caché quede bajo
+    EXPORT_CACHE_MAX_MB. También limpia temporales abandonados (> 1 hora).
+    """
+    limite = getattr(settings, "EXPORT_CACHE_MAX_MB", 512) * 1024 * 1024
+    archivos, total = [], 0
+    for entrada in os.scandir(cache_dir()):
+        if not entrada.is_file():
+            continue
+        st = entrada.stat()
+        if entrada.name.endswith(_SUFIJO_PARCIAL):
+            if time.time() - st.st_mtime > 3600:
+                Path(entrada.path).unlink(missing_ok=True)
+            continue
+        archivos.append((st.st_mtime, st.st_size, Path(entrada.path)))
+        total += st.st_size
+
+    for _, tamano, ruta in sorted(archivos):
+        if total <= limite:
+            break
+        if excepto is not None and ruta == excepto:
+            continue
+        ruta.unlink(missing_ok=True)
+        total -= tamano
+
+
+def copiar_en_cache(lineas, clave: str, formato: str = "csv"):
+    """
+    Deja pasar las líneas del CSV que se está enviando y las copia a la
+    caché; el archivo solo se publica si el envío llegó al final.
+    """
+    parcial = archivo_parcial(clave, formato)
+    completo = False
+    try:
+        with open(parcial, "w", encoding="utf-8", newline="") as f:
+            for linea in lineas:
+                f.write(linea)
+                yield linea
+        completo = True
+    finally:
+        if completo:
+            guardar_en_cache(parcial, clave, formato)
+        else:
+            parcial.unlink(missing_ok=True)
@@ -1,47 +1,23 @@
 from django import forms
 from django.core.exceptions import ValidationError
-import re
 from decimal import Decimal
 from catalogo.models import LibroFicha, TipoTapa, Moneda, Idioma, Pais
 from roles.models import UsuarioEditorial, Editorial
 
 from django.contrib.auth import get_user_model
 from .models import Profile, Editorial
+from .autorizacion import get_auth_context
+from .validacion import validar_descuento, validar_ean, validar_isbn
 
 # ===========================
-# validaciones
+# validaciones (compartidas con la carga masiva: roles/validacion.py)
 # ===========================
-_ISBN10_RE = re.compile(r"^\d{9}[\dX]$")   # 9 dígitos + dígito o X
-_DIGITS_RE = re.compile(r"^\d+$")
-
-def _normalize_code(raw: str) -> str:
-    """Quita guiones/espacios y pasa a mayúsculas."""
-    return re.sub(r"[\s-]+", "", (raw or "")).upper()
-
-def _is_valid_isbn10(code: str) -> bool:
-    """
-    ISBN-10 con dígito verificador (módulo 11). 'X' equivale a 10.
-    Regla: sum(d_i * w_i) % 11 == 0 con w_i = 10..1
-    """
-    if not _ISBN10_RE.match(code):
-        return False
-    total = 0
-    for i, ch in enumerate(code):           # i = 0..9 -> peso = 10..1
-        weight = 10 - i
-        val = 10 if ch == "X" else int(ch)
-        total += val * weight
-    return total % 11 == 0
-
-def _is_valid_ean13(code: str) -> bool:
-    """
-    EAN-13 / ISBN-13 (módulo 10). Último dígito es verificador.
-    """
-    if len(code) != 13 or not _DIGITS_RE.match(code):
-        return False
-    digits = [int(c) for c in code]
-    checksum = sum(d if (i % 2 == 0) else d * 3 for i, d in enumerate(digits[:-1]))
-    check = (10 - (checksum % 10)) % 10
-    return check == digits[-1]
+def _validar(funcion, valor):
+    """Aplica una regla de roles/validacion y pasa su ValueError a ValidationError."""
+    try:
+        return funcion(valor)
+    except ValueError as e:
+        raise ValidationError(str(e))
 
 
 # ===========================
@@ -64,10 +40,10 @@ class BaseEditorForm(forms.ModelForm):
             self.limit_editoriales(self._request_user)
 
     def limit_editoriales(self, user):
-        if hasattr(user, "profile") and getattr(user.profile, "role", None) == "EDITOR":
-            ed_ids = UsuarioEditorial.objects.filter(user=user).values_list("editorial_id", flat=True)
+        auth = get_auth_context(user)
+        if auth.is_editor:
             if "editorial" in self.fields:
-                self.fields["editorial"].queryset = Editorial.objects.filter(id__in=list(ed_ids))
+                self.fields["editorial"].queryset = Editorial.objects.filter(id__in=auth.editorial_ids)
 
 
 # ===========================
@@ -105,26 +81,13 @@ class LibroIdentForm(BaseEditorForm):
                     }                      
                 }
     def clean_isbn(self):
-        raw = self.cleaned_data.get("isbn", "")
-        code = _normalize_code(raw)
-        if len(code) == 10:
-            if not _is_valid_isbn10(code):
-                raise ValidationError("ISBN-10 inválido")
-        elif len(code) == 13:
-            if not _is_valid_ean13(code):
-                raise ValidationError("ISBN-13 inválido")
-        else:
-            raise ValidationError("El ISBN debe tener 10 o 13 caracteres")
-        return code  # se guarda normalizado
+        return _validar(validar_isbn, self.cleaned_data.get("isbn", ""))  # se guarda normalizado
 
     def clean_ean(self):
         raw = self.cleaned_data.get("ean", "")
         if not raw:
             return raw
-        code = _normalize_code(raw)
-        if not _is_valid_ean13(code):
-            raise ValidationError("EAN-13 inválido")
-        return code  # se guarda normalizado
+        return _validar(validar_ean, raw)  # se guarda normalizado
 
 
 # ===========================
@@ -172,10 +135,7 @@ class LibroComercialForm(BaseEditorForm):
         }
 
     def clean_descuento_distribuidor(self):
-        val = self.cleaned_data.get("descuento_distribuidor")
-        if val is None or not (0 <= float(val) <= 99.9):
-            raise ValidationError("El descuento debe estar entre 0.0 y 99.9%.")
-        return val
+        return _validar(validar_descuento, self.cleaned_data.get("descuento_distribuidor"))
 
 
 # ===========================
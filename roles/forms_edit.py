@@ -1,10 +1,10 @@
 # roles/forms_edit.py
 from django import forms
-from django.core.exceptions import ValidationError
 
 from catalogo.models import LibroFicha
-# Reutilizamos utilidades ya definidas en forms.py
-from roles.forms import BaseEditorForm, _normalize_code, _is_valid_isbn10, _is_valid_ean13
+# Mismas reglas que el wizard y la carga masiva (roles/validacion.py)
+from roles.forms import BaseEditorForm, _validar
+from roles.validacion import validar_descuento, validar_ean, validar_isbn
 
 
 class LibroEditForm(BaseEditorForm):
@@ -35,28 +35,13 @@ class LibroEditForm(BaseEditorForm):
         raw = self.cleaned_data.get("isbn", "")
         if not self.allow_change_isbn:
             return self.instance.isbn
-        code = _normalize_code(raw)
-        if len(code) == 10:
-            if not _is_valid_isbn10(code):
-                raise ValidationError("ISBN-10 inválido")
-        elif len(code) == 13:
-            if not _is_valid_ean13(code):
-                raise ValidationError("ISBN-13 inválido")
-        else:
-            raise ValidationError("El ISBN debe tener 10 o 13 caracteres")
-        return code
+        return _validar(validar_isbn, raw)
 
     def clean_ean(self):
         raw = self.cleaned_data.get("ean", "")
         if not raw:
             return raw
-        code = _normalize_code(raw)
-        if not _is_valid_ean13(code):
-            raise ValidationError("EAN-13 inválido")
-        return code
+        return _validar(validar_ean, raw)
 
     def clean_descuento_distribuidor(self):
-        val = self.cleaned_data.get("descuento_distribuidor")
-        if val is None or not (0 <= float(val) <= 99.9):
-            raise ValidationError("El descuento debe estar entre 0.0 y 99.9%.")
-        return val
+        return _validar(validar_descuento, self.cleaned_data.get("descuento_distribuidor"))
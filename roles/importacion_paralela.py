@@ -0,0 +1,207 @@
+"""
+Importación de catálogos completos desde archivos en el servidor.
+
+Para la carga inicial de una distribuidora (cientos de miles o millones de
+filas) sin pasar por la web: `manage.py importar_fichas archivo.xlsx|.csv|.ndjson`.
+
+- El proceso principal lee el archivo en streaming y lo corta en lotes de
+  LOTE filas (las líneas NDJSON viajan sin parsear).
+- Un pool de procesos parsea y valida cada lote por columnas
+  (roles/validacion.validar_lote, con las tablas de referencia leídas una vez
+  por proceso) y devuelve las fichas normalizadas, con las FKs como id.
+- El proceso principal es el único que escribe: revisa los ISBN repetidos o
+  ya existentes (el conjunto de ISBN vistos vive solo aquí) y guarda cada lote
+  con bulk_create / bulk_update (carga_masiva._escribir).
+
+A diferencia de importar(), cada lote se escribe aunque otras filas fallen:
+las fallidas van a un CSV de errores (archivo;fila;isbn;error) para corregirlas
+y volver a cargarlas en modo "actualizar". Hay a lo más dos lotes por proceso
+en vuelo, así que la memoria no depende del tamaño del archivo.
+"""
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.db import connections
+
+from catalogo.models import LibroFicha
+
+from .carga_masiva import (
+    LOTE, MODOS, ArchivoInvalido, TablasReferencia, _escribir, _lotes, _revisar_isbn, _serializar, leer_xlsx,
+    normalizar_encabezado,
+)
+from .validacion import validar_lote
+
+log = logging.getLogger(__name__)
+
+EXTENSIONES = {".xlsx": "xlsx", ".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+def formato_de(ruta) -> str:
+    try:
+        return EXTENSIONES[Path(ruta).suffix.lower()]
+    except KeyError:
+        raise ArchivoInvalido(f"{Path(ruta).name}: formato no soportado (use .xlsx, .csv o .ndjson)")
+
+
+# -----------------------------------------------
+# Lectura (proceso principal)
+# -----------------------------------------------
+
+def leer_csv(ruta):
+    """
+    (nº de línea, fila normalizada) de un CSV en UTF-8 con los encabezados de
+    la plantilla. El separador (',', ';' o tabulador) se detecta.
+    """
+    try:
+        with open(ruta, newline="", encoding="utf-8-sig") as f:
+            try:
+                dialecto = csv.Sniffer().sniff(f.read(64 * 1024), delimiters=",;\t")
+            except csv.Error:
+                dialecto = csv.excel  # una sola columna
+            f.seek(0)
+            lector = csv.reader(f, dialecto)
+            encabezado = next(lector, None) or []
+            claves = [normalizar_encabezado(h) if h.strip() else None for h in encabezado]
+            for valores in lector:
+                if not any(v.strip() for v in valores):
+                    continue
+                yield lector.line_num, {k: v for k, v in zip(claves, valores) if k}
+    except UnicodeDecodeError as e:
+        raise ArchivoInvalido(f"{Path(ruta).name}: el CSV debe estar en UTF-8") from e
+
+
+def leer_lineas(ruta):
+    """(nº de línea, texto) de un NDJSON; cada línea se parsea en el pool."""
+    with open(ruta, encoding="utf-8") as f:
+        for n, linea in enumerate(f, start=1):
+            if linea.strip():
+                yield n, linea
+
+
+def _leer(ruta, formato: str):
+    if formato == "xlsx":
+        return leer_xlsx(ruta)
+    if formato == "csv":
+        return leer_csv(ruta)
+    return leer_lineas(ruta)
+
+
+# -----------------------------------------------
+# Validación (procesos del pool)
+# -----------------------------------------------
+
+_tablas = None  # TablasReferencia del proceso, leída en el primer lote
+
+
+def validar_bloque(bloque) -> tuple[list[tuple], dict[int, str]]:
+    """
+    Parsea y valida un lote de (nº de línea, fila o línea NDJSON). Devuelve
+    [(nº de línea, isbn, datos serializados o None)] y {índice: primer error}.
+    No consulta la BD salvo para las tablas de referencia.
+    """
+    global _tablas
+    if _tablas is None:
+        _tablas = TablasReferencia()
+
+    filas, ilegibles = [], {}
+    for i, (_, row) in enumerate(bloque):
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except ValueError:
+                ilegibles[i] = "JSON inválido"
+            if not isinstance(row, dict):
+                ilegibles.setdefault(i, "Cada línea debe ser un objeto JSON")
+                row = {}
+        filas.append(row)
+
+    datos, por_fila = validar_lote(filas, _tablas)
+    por_fila.update(ilegibles)
+    return [
+        (n, d["isbn"], None if i in por_fila else _serializar(d))
+        for i, ((n, _), d) in enumerate(zip(bloque, datos))
+    ], por_fila
+
+
+def _validados(bloques, procesos: int):
+    """Resultado de validar_bloque() por cada lote, en orden."""
+    if procesos <= 1:
+        for bloque in bloques:
+            yield validar_bloque(bloque)
+        return
+
+    # Los hijos abren sus propias conexiones; no deben heredar las del padre
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    ) as pool:
+        en_vuelo = deque()
+        for bloque in bloques:
+            en_vuelo.append(pool.submit(validar_bloque, bloque))
+            if len(en_vuelo) >= 2 * procesos:
+                yield en_vuelo.popleft().result()
+        while en_vuelo:
+            yield en_vuelo.popleft().result()
+
+
+# -----------------------------------------------
+# Escritura (proceso principal)
+# -----------------------------------------------
+
+def importar_archivos(rutas, modo: str, ruta_errores, procesos: int | None = None, lote: int = LOTE,
+                      progreso=None) -> dict:
+    """
+    Importa los archivos en orden (un ISBN repetido entre archivos también es
+    duplicado) y deja las filas fallidas en `ruta_errores` (se borra si no
+    hubo ninguna). progreso(totales) se llama después de cada lote.
+    Devuelve los totales: filas, created, updated, unchanged, failed, segundos.
+    """
+    if modo not in MODOS:
+        raise ValueError(f"Modo de carga inválido: {modo}")
+    formatos = [(ruta, formato_de(ruta)) for ruta in rutas]
+    procesos = procesos or os.cpu_count() or 1
+
+    inicio = time.monotonic()
+    totales = {"filas": 0, "created": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    vistos = set()
+    with open(ruta_errores, "w", newline="", encoding="utf-8") as f:
+        salida = csv.writer(f, delimiter=";")
+        salida.writerow(["archivo", "fila", "isbn", "error"])
+
+        for ruta, formato in formatos:
+            nombre = Path(ruta).name
+            for resultados, por_fila in _validados(_lotes(_leer(ruta, formato), lote), procesos):
+                malas, _ = _revisar_isbn([isbn for _, isbn, _ in resultados], por_fila, vistos, modo, None)
+                descartadas = set()
+                for i, mensaje in malas:
+                    descartadas.add(i)
+                    salida.writerow([nombre, resultados[i][0], resultados[i][1] or "", mensaje])
+
+                validas = [(n, LibroFicha(**d)) for i, (n, _, d) in enumerate(resultados) if i not in descartadas]
+                escrito = _escribir([validas], modo, lambda insertadas=0: None)
+                isbns = {n: ficha.isbn for n, ficha in validas}
+                for e in escrito["errors"]:
+                    salida.writerow([nombre, e["row"], isbns.get(e["row"], ""), e["error"]])
+
+                totales["filas"] += len(resultados)
+                totales["failed"] += len(malas) + escrito["failed"]
+                for clave in ("created", "updated", "unchanged"):
+                    totales[clave] += escrito[clave]
+                if progreso is not None:
+                    progreso({**totales, "segundos": time.monotonic() - inicio})
+
+    if not totales["failed"]:
+        Path(ruta_errores).unlink(missing_ok=True)
+    totales["segundos"] = time.monotonic() - inicio
+    log.info("Importación de %s: %s", ", ".join(str(r) for r in rutas), totales)
+    return totales
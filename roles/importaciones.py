@@ -0,0 +1,282 @@
+"""
+Carga masiva en segundo plano.
+
+La vista solo guarda lo recibido en IMPORT_DIR (la plantilla .xlsx tal cual,
+o las filas JSON como NDJSON, una por línea) y crea un TrabajoImportacion.
+Una carga por fragmentos ya tiene sus filas en la BD: al finalizarla se
+encola un trabajo que las lee de la sesión.
+`manage.py procesar_importaciones` toma los pendientes y los pasa por
+roles/carga_masiva.importar, guardando después de cada lote cuántas filas van
+validadas, insertadas y fallidas junto con los errores por fila. El modal de
+carga masiva consulta ese estado hasta que el trabajo termina.
+
+Con simulación (dry-run) el worker solo valida: las filas válidas quedan
+normalizadas (FKs como id) en un archivo junto al trabajo y el estado trae un
+resumen (nuevas / existentes / duplicadas / inválidas) y un token firmado que
+vence a los IMPORT_SIMULACION_TTL segundos. Confirmar con ese token encola la
+escritura de ese archivo sin volver a leer, validar ni resolver FKs.
+"""
+import json
+import logging
+import secrets
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils import timezone
+
+from .autorizacion import get_auth_context
+from .carga_masiva import (
+    ArchivoInvalido, importar, importar_sesion, importar_validadas, leer_xlsx, simular, tomar_sesion,
+)
+from .models import TrabajoImportacion
+
+log = logging.getLogger(__name__)
+
+SIMULACION_SALT = "roles.importacion.simulacion"
+
+
+class SimulacionNoDisponible(Exception):
+    pass
+
+
+def import_dir() -> Path:
+    ruta = Path(settings.IMPORT_DIR)
+    ruta.mkdir(parents=True, exist_ok=True)
+    return ruta
+
+
+def _nombre(formato: str) -> str:
+    return f"{timezone.now():%Y%m%d%H%M%S}-{secrets.token_hex(6)}.{formato}"
+
+
+def encolar_xlsx(user, modo: str, subido, simulacion: bool = False) -> TrabajoImportacion:
+    """Guarda la plantilla subida (por trozos, sin leerla entera) y encola."""
+    nombre = _nombre("xlsx")
+    with open(import_dir() / nombre, "wb") as f:
+        for trozo in subido.chunks():
+            f.write(trozo)
+    return TrabajoImportacion.objects.create(
+        usuario=user, modo=modo, formato="xlsx", archivo=nombre, nombre_original=subido.name[:255],
+        simulacion=simulacion,
+    )
+
+
+def encolar_filas(user, modo: str, filas, simulacion: bool = False) -> TrabajoImportacion:
+    """Filas JSON ya parseadas -> NDJSON en disco, que el worker lee línea a línea."""
+    nombre = _nombre("ndjson")
+    total = 0
+    with open(import_dir() / nombre, "w", encoding="utf-8") as f:
+        for row in filas:
+            f.write(json.dumps(row, ensure_ascii=False, default=str))
+            f.write("\n")
+            total += 1
+    return TrabajoImportacion.objects.create(
+        usuario=user, modo=modo, formato="ndjson", archivo=nombre, total=total, simulacion=simulacion,
+    )
+
+
+def encolar_sesion(user, sesion, total: int | None = None) -> TrabajoImportacion:
+    """Carga por fragmentos completa -> trabajo que importa sus filas (CargaIncompleta si no lo está)."""
+    filas = tomar_sesion(sesion, total)
+    return TrabajoImportacion.objects.create(
+        usuario=user, modo=sesion.modo, formato="sesion", sesion=sesion, total=filas,
+    )
+
+
+def leer_ndjson(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        for n, linea in enumerate(f, start=1):
+            if linea.strip():
+                yield n, json.loads(linea)
+
+
+def _contar_xlsx(ruta) -> int | None:
+    """Filas según la dimensión declarada de la hoja (sin recorrerla); None si no la trae."""
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(ruta, read_only=True)
+    except Exception:
+        return None  # archivo dañado: leer_xlsx lo informa como ArchivoInvalido
+    try:
+        max_row = wb.worksheets[0].max_row
+        return max(max_row - 1, 0) if max_row else None
+    finally:
+        wb.close()
+
+
+# -----------------------------------------------
+# Simulación: token para confirmar
+# -----------------------------------------------
+
+def token_simulacion(trabajo: TrabajoImportacion) -> str:
+    return signing.TimestampSigner(salt=SIMULACION_SALT).sign(str(trabajo.pk))
+
+
+def _ttl_simulacion() -> int:
+    return getattr(settings, "IMPORT_SIMULACION_TTL", 1800)
+
+
+def confirmar_simulacion(user, token: str) -> TrabajoImportacion:
+    """
+    Encola la escritura de las filas que dejó una simulación del usuario.
+    Cada simulación se confirma una sola vez (el archivo pasa al trabajo nuevo).
+    """
+    try:
+        pk = int(signing.TimestampSigner(salt=SIMULACION_SALT).unsign(token, max_age=_ttl_simulacion()))
+    except signing.BadSignature:  # incluye SignatureExpired
+        raise SimulacionNoDisponible("La validación venció o no es válida. Vuelva a validar el archivo.")
+
+    simulacion = TrabajoImportacion.objects.filter(pk=pk, usuario=user, simulacion=True).first()
+    nombre = simulacion.archivo_validado if simulacion else ""
+    tomada = nombre and (TrabajoImportacion.objects
+                         .filter(pk=pk, archivo_validado=nombre)
+                         .update(archivo_validado=""))
+    if not tomada or not (import_dir() / nombre).exists():
+        raise SimulacionNoDisponible("Esta validación ya se confirmó o ya no está disponible.")
+
+    resumen = simulacion.resultado or {}
+    return TrabajoImportacion.objects.create(
+        usuario=user, modo=simulacion.modo, formato="validado", archivo=nombre,
+        nombre_original=simulacion.nombre_original,
+        total=resumen.get("nuevas", 0) + resumen.get("existentes", 0),
+    )
+
+
+def sin_worker(trabajo: TrabajoImportacion) -> bool:
+    """
+    Sigue PENDIENTE pasados IMPORT_SIN_WORKER_SEGUNDOS: lo más probable es que
+    `manage.py procesar_importaciones` no esté corriendo.
+    """
+    if trabajo.estado != TrabajoImportacion.ESTADO_PENDIENTE:
+        return False
+    espera = timedelta(seconds=getattr(settings, "IMPORT_SIN_WORKER_SEGUNDOS", 60))
+    return timezone.now() - trabajo.creado > espera
+
+
+def estado_json(trabajo: TrabajoImportacion) -> dict:
+    porcentaje = 100 if trabajo.estado == TrabajoImportacion.ESTADO_LISTO else 0
+    if trabajo.total and porcentaje < 100:
+        # Dos pasadas: validar y escribir (la simulación solo valida)
+        pasadas = 1 if trabajo.simulacion else 2
+        avance = trabajo.validadas + trabajo.insertadas
+        porcentaje = min(99, int(avance * 100 / (trabajo.total * pasadas)))
+    data = {
+        "id": trabajo.pk,
+        "estado": trabajo.estado,
+        "modo": trabajo.modo,
+        "total": trabajo.total,
+        "validadas": trabajo.validadas,
+        "insertadas": trabajo.insertadas,
+        "fallidas": trabajo.fallidas,
+        "porcentaje": porcentaje,
+        "errors": trabajo.errores,
+        "resultado": trabajo.resultado or None,
+        "error": trabajo.error or None,
+        "url_estado": reverse("roles:importacion_estado", args=[trabajo.pk]),
+        "simulacion": trabajo.simulacion,
+        "token": None,
+        "sin_worker": sin_worker(trabajo),
+    }
+    if trabajo.simulacion and trabajo.estado == TrabajoImportacion.ESTADO_LISTO and trabajo.archivo_validado:
+        data["token"] = token_simulacion(trabajo)
+    return data
+
+
+# -----------------------------------------------
+# Worker
+# -----------------------------------------------
+
+def tomar_siguiente() -> TrabajoImportacion | None:
+    """Marca como PROCESANDO el pendiente más antiguo (UPDATE condicionado al estado)."""
+    pendientes = TrabajoImportacion.objects.filter(estado=TrabajoImportacion.ESTADO_PENDIENTE)
+    for pk in pendientes.order_by("creado").values_list("pk", flat=True)[:10]:
+        tomado = (TrabajoImportacion.objects
+                  .filter(pk=pk, estado=TrabajoImportacion.ESTADO_PENDIENTE)
+                  .update(estado=TrabajoImportacion.ESTADO_PROCESANDO, iniciado=timezone.now()))
+        if tomado:
+            return TrabajoImportacion.objects.select_related("usuario").get(pk=pk)
+    return None
+
+
+def procesar(trabajo: TrabajoImportacion) -> None:
+    """Importa el archivo del trabajo (ya marcado como PROCESANDO) y lo borra al terminar."""
+    ruta = import_dir() / trabajo.archivo
+
+    def progreso(avance):
+        trabajo.validadas = avance["validadas"]
+        trabajo.insertadas = avance["insertadas"]
+        trabajo.fallidas = avance["fallidas"]
+        trabajo.errores = avance["errores"]
+        TrabajoImportacion.objects.filter(pk=trabajo.pk).update(
+            validadas=trabajo.validadas, insertadas=trabajo.insertadas,
+            fallidas=trabajo.fallidas, errores=trabajo.errores,
+        )
+
+    validado = None
+    try:
+        if trabajo.formato == "sesion":
+            editoriales = get_auth_context(trabajo.usuario).editorial_ids
+            trabajo.resultado = importar_sesion(trabajo.sesion, editoriales, progreso=progreso)
+        elif trabajo.formato == "validado":
+            trabajo.resultado = importar_validadas(ruta, trabajo.modo, progreso=progreso)
+        else:
+            if trabajo.formato == "xlsx":
+                if trabajo.total is None:
+                    trabajo.total = _contar_xlsx(ruta)
+                    TrabajoImportacion.objects.filter(pk=trabajo.pk).update(total=trabajo.total)
+                leer = lambda: leer_xlsx(ruta)  # noqa: E731
+            else:
+                leer = lambda: leer_ndjson(ruta)  # noqa: E731
+
+            editoriales = get_auth_context(trabajo.usuario).editorial_ids
+            if trabajo.simulacion:
+                validado = import_dir() / f"{Path(trabajo.archivo).stem}.validadas.ndjson"
+                trabajo.resultado = simular(leer, validado, trabajo.modo, editoriales, progreso=progreso)
+                if trabajo.resultado["nuevas"] or trabajo.resultado["existentes"]:
+                    trabajo.archivo_validado = validado.name
+            else:
+                trabajo.resultado = importar(leer, trabajo.modo, editoriales, progreso=progreso)
+        trabajo.estado = TrabajoImportacion.ESTADO_LISTO
+    except ArchivoInvalido as e:
+        trabajo.estado = TrabajoImportacion.ESTADO_ERROR
+        trabajo.error = str(e)
+    except Exception as e:
+        log.exception("Falló la importación %s", trabajo.pk)
+        trabajo.estado = TrabajoImportacion.ESTADO_ERROR
+        trabajo.error = "Error interno al crear registros. Contacte al administrador."
+        log.debug("Detalle: %s", e)
+    finally:
+        if trabajo.archivo:
+            ruta.unlink(missing_ok=True)  # los datos ya quedaron en LibroFicha (o no sirven)
+        if validado is not None and not trabajo.archivo_validado:
+            validado.unlink(missing_ok=True)
+
+    trabajo.terminado = timezone.now()
+    trabajo.save(update_fields=["estado", "total", "validadas", "insertadas", "fallidas",
+                                "errores", "resultado", "error", "archivo_validado", "terminado"])
+
+
+def purgar_vencidas() -> int:
+    """
+    Borra las filas validadas de simulaciones que ya no se pueden confirmar
+    (IMPORT_SIMULACION_TTL) y los registros terminados más antiguos que
+    IMPORT_RETENCION_DIAS.
+    """
+    ahora = timezone.now()
+    vencidas = (TrabajoImportacion.objects
+                .filter(simulacion=True, terminado__lt=ahora - timedelta(seconds=_ttl_simulacion()))
+                .exclude(archivo_validado=""))
+    for pk, nombre in vencidas.values_list("pk", "archivo_validado"):
+        if TrabajoImportacion.objects.filter(pk=pk, archivo_validado=nombre).update(archivo_validado=""):
+            (import_dir() / nombre).unlink(missing_ok=True)
+
+    limite = ahora - timedelta(days=getattr(settings, "IMPORT_RETENCION_DIAS", 30))
+    borradas, _ = TrabajoImportacion.objects.filter(
+        creado__lt=limite,
+        estado__in=[TrabajoImportacion.ESTADO_LISTO, TrabajoImportacion.ESTADO_ERROR],
+    ).delete()
+    return borradas
@@ -0,0 +1,103 @@
+"""
+API de ingesta NDJSON para integradores.
+
+Los sistemas de las editoriales envían sus fichas sin pasar por el modal:
+
+    POST /panel/api/fichas/ingesta/?modo=actualizar
+    Authorization: Bearer lib_...            (TokenIntegracion del usuario EDITOR)
+    Content-Type: application/x-ndjson
+    Content-Encoding: gzip                   (opcional)
+
+    {"isbn": "...", "titulo": "...", "editorial": "...", ...}
+    {"isbn": "...", ...}
+
+El cuerpo se lee del socket y se descomprime de a trozos, línea a línea, sin
+cargarlo entero (no pasa por request.body). Cada LOTE líneas se validan y
+escriben con roles/carga_masiva.ingerir y la respuesta, también NDJSON, lleva
+una línea por lote a medida que terminan y una línea final con los totales.
+"""
+import gzip
+import json
+import logging
+import zlib
+
+from django.utils import timezone
+
+from .carga_masiva import LOTE, ingerir
+from .models import TokenIntegracion
+
+log = logging.getLogger(__name__)
+
+MAX_LINEA = 1024 * 1024  # bytes por ficha; una línea más larga se descarta
+TROZO = 64 * 1024
+
+
+def autenticar(request):
+    """Usuario dueño del token 'Authorization: Bearer ...' (activo), o None."""
+    tipo, _, token = request.headers.get("Authorization", "").partition(" ")
+    if tipo.lower() != "bearer" or not token.strip():
+        return None
+    credencial = (TokenIntegracion.objects.select_related("usuario")
+                  .filter(clave=TokenIntegracion.resumen(token.strip()), activo=True, usuario__is_active=True)
+                  .first())
+    if credencial is None:
+        return None
+    TokenIntegracion.objects.filter(pk=credencial.pk).update(ultimo_uso=timezone.now())
+    return credencial.usuario
+
+
+def flujo_entrada(request):
+    """El cuerpo del request como archivo binario, descomprimido si viene en gzip."""
+    codificacion = request.headers.get("Content-Encoding", "").lower()
+    tipo = request.content_type or ""
+    if codificacion == "gzip" or tipo in ("application/gzip", "application/x-gzip"):
+        return gzip.GzipFile(fileobj=request, mode="rb")
+    return request
+
+
+def leer_lineas(flujo):
+    """
+    (nº de línea, fila) por cada línea no vacía, o (nº de línea, ValueError)
+    si no es un objeto JSON o supera MAX_LINEA. Nunca guarda más de una línea.
+    """
+    n = 0
+    while True:
+        linea = flujo.readline(MAX_LINEA + 1)
+        if not linea:
+            return
+        n += 1
+        if len(linea) > MAX_LINEA and not linea.endswith(b"\n"):
+            while linea and not linea.endswith(b"\n"):  # descarta el resto de la línea
+                linea = flujo.readline(TROZO)
+            yield n, ValueError(f"Línea de más de {MAX_LINEA} bytes")
+            continue
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            yield n, ValueError("JSON inválido")
+            continue
+        if not isinstance(fila, dict):
+            yield n, ValueError("Cada línea debe ser un objeto JSON")
+            continue
+        yield n, fila
+
+
+def respuesta_ingesta(flujo, modo: str, editoriales, lote: int = LOTE):
+    """Líneas NDJSON de la respuesta: una por lote y un resumen final."""
+    totales = {"lotes": 0, "lineas": 0, "created": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    try:
+        for resultado in ingerir(leer_lineas(flujo), modo, editoriales, lote):
+            totales["lotes"] += 1
+            totales["lineas"] = resultado["hasta"]
+            for clave in ("created", "updated", "unchanged", "failed"):
+                totales[clave] += resultado[clave]
+            yield json.dumps(resultado, ensure_ascii=False) + "\n"
+    except (OSError, EOFError, zlib.error) as e:
+        # gzip dañado o conexión cortada: lo ya informado quedó guardado
+        log.warning("Ingesta interrumpida: %s", e)
+        yield json.dumps({"fin": False, "error": "El flujo se cortó o no es gzip válido", **totales},
+                         ensure_ascii=False) + "\n"
+        return
+    yield json.dumps({"fin": True, "ok": not totales["failed"], **totales}, ensure_ascii=False) + "\n"
@@ -0,0 +1,132 @@
+"""
+Listas de precios por editorial.
+
+Una planilla (o CSV) por editorial con el precio sugerido, el descuento de
+distribuidor y la moneda de cada ficha, todas empaquetadas en un .zip.
+
+- El precio sugerido se lee de PrecioFicha (catalogo/precios.py), ya
+  materializado en la moneda de la ficha y en CLP.
+- Cada editorial se genera en un proceso del pool con su propia conexión y
+  lee sus fichas por lotes keyset (roles/paginacion.recorrer_por_lotes), así
+  que el tiempo total escala con los núcleos y la memoria queda acotada.
+
+Se usa desde `manage.py generar_listas_precios` y desde el worker de
+exportaciones (trabajos de tipo LISTAS, roles/exportaciones.py), que deja el
+.zip en la caché de exportaciones para la vista de ADMIN `listas_precios`.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import django
+from django.db import connections
+from django.db.models import Count
+from django.utils.text import slugify
+
+from catalogo.models import LibroFicha
+from catalogo.versiones import PRECIOS, get_version
+
+from .models import Editorial
+
+log = logging.getLogger(__name__)
+
+FORMATOS = ("xlsx", "csv")
+
+# encabezado -> ruta en values_list
+COLUMNAS = {
+    "isbn": "isbn",
+    "titulo": "titulo",
+    "autor": "autor",
+    "precio": "precio",
+    "precio_sugerido": "precio_final__monto",
+    "precio_sugerido_clp": "precio_final__monto_clp",
+    "descuento_distribuidor": "descuento_distribuidor",
+    "moneda": "moneda__code",
+}
+
+
+def firma_listas(formato: str) -> str:
+    """Clave del .zip: cambia con cualquier cambio de fichas o de recargos/tipos de cambio."""
+    datos = f"listas:{formato}:{get_version()}:{get_version(PRECIOS)}"
+    return hashlib.sha1(datos.encode()).hexdigest()
+
+
+def _nombre_archivo(editorial: Editorial, formato: str) -> str:
+    return f"{slugify(editorial.nombre) or 'editorial'}-{editorial.pk}.{formato}"
+
+
+def generar_lista(editorial_id: int, ruta: str, formato: str) -> int:
+    """Escribe la lista de una editorial en `ruta`. Devuelve el nº de filas."""
+    from templates.reports.search_result import escribir_csv, escribir_xlsx
+
+    from .paginacion import recorrer_por_lotes
+
+    qs = LibroFicha.objects.filter(editorial_id=editorial_id)
+    n = 0
+
+    def filas():
+        nonlocal n
+        for fila in recorrer_por_lotes(qs, "isbn", list(COLUMNAS.values())):
+            n += 1
+            yield fila
+
+    escribir = escribir_csv if formato == "csv" else escribir_xlsx
+    escribir(ruta, list(COLUMNAS), filas())
+    return n
+
+
+def generar_listas(destino, formato: str = "xlsx", editoriales=None, procesos: int | None = None) -> list[dict]:
+    """
+    Genera una lista por editorial (las que tienen fichas, o las indicadas en
+    `editoriales`) y las empaqueta en el zip `destino`.
+    procesos=1 genera en serie en el mismo proceso; por defecto, un proceso
+    por núcleo. Devuelve un resumen por editorial.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    eds = Editorial.objects.annotate(n_libros=Count("libros")).filter(n_libros__gt=0)
+    if editoriales is not None:
+        eds = eds.filter(pk__in=editoriales)
+    # Las más grandes primero: reparte mejor la carga entre procesos
+    eds = list(eds.order_by("-n_libros", "pk"))
+
+    destino = Path(destino)
+    carpeta = Path(tempfile.mkdtemp(dir=destino.parent, prefix=".listas-"))
+    try:
+        tareas = [(ed, carpeta / _nombre_archivo(ed, formato)) for ed in eds]
+        procesos = min(procesos or os.cpu_count() or 1, len(tareas))
+
+        if procesos <= 1:
+            filas = [generar_lista(ed.pk, str(ruta), formato) for ed, ruta in tareas]
+        else:
+            # Los hijos abren sus propias conexiones; no deben heredar las del padre
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=procesos,
+                mp_context=multiprocessing.get_context("spawn"),
+                # Con 'spawn' el hijo parte de cero: se carga Django antes de
+                # importar este módulo (que importa modelos)
+                initializer=django.setup,
+            ) as pool:
+                futuros = [pool.submit(generar_lista, ed.pk, str(ruta), formato) for ed, ruta in tareas]
+                filas = [f.result() for f in futuros]
+
+        # xlsx ya viene comprimido por dentro: solo se guarda
+        compresion = zipfile.ZIP_DEFLATED if formato == "csv" else zipfile.ZIP_STORED
+        with zipfile.ZipFile(destino, "w", compression=compresion) as zf:
+            for ed, ruta in sorted(tareas, key=lambda t: t[1].name):
+                zf.write(ruta, arcname=ruta.name)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    return [
+        {"editorial": ed.nombre, "archivo": ruta.name, "filas": n}
+        for (ed, ruta), n in zip(tareas, filas)
+    ]
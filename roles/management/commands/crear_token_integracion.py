@@ -0,0 +1,27 @@
+# roles/management/commands/crear_token_integracion.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from roles.autorizacion import get_auth_context
+from roles.models import TokenIntegracion
+
+
+class Command(BaseCommand):
+    help = "Emite un token para la API de ingesta NDJSON a nombre de un usuario EDITOR"
+
+    def add_arguments(self, parser):
+        parser.add_argument("usuario", help="username del EDITOR dueño del token")
+        parser.add_argument("--nombre", default="Integración", help="Para reconocer el token (p. ej. el sistema que lo usa)")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["usuario"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['usuario']}")
+        if not get_auth_context(user).is_editor:
+            raise CommandError("Solo los usuarios EDITOR pueden cargar fichas")
+
+        credencial, token = TokenIntegracion.emitir(user, options["nombre"])
+        self.stdout.write(self.style.SUCCESS(f"Token '{credencial.nombre}' para {user.username}:"))
+        self.stdout.write(token)
+        self.stdout.write("Guárdelo ahora: no se vuelve a mostrar.")
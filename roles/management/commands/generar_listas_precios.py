@@ -0,0 +1,46 @@
+# roles/management/commands/generar_listas_precios.py
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from roles.exportaciones import generar_listas_en_cache
+from roles.listas_precios import FORMATOS, firma_listas, generar_listas
+
+
+class Command(BaseCommand):
+    help = "Genera una lista de precios por editorial (en paralelo) y las empaqueta en un .zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--salida", default="listas_precios.zip", help="Ruta del .zip (default listas_precios.zip)")
+        parser.add_argument("--formato", choices=FORMATOS, default="xlsx")
+        parser.add_argument("--procesos", type=int, default=None, help="Procesos en paralelo (default: nº de núcleos)")
+        parser.add_argument("--editorial", type=int, action="append", dest="editoriales",
+                            help="Solo esta editorial (id); se puede repetir")
+        parser.add_argument("--cache", action="store_true",
+                            help="Deja el .zip en la caché de exportaciones (el que descarga la vista de ADMIN) "
+                                 "en vez de --salida; p. ej. en un cron después de actualizar_tc")
+
+    def handle(self, *args, **options):
+        if options["cache"]:
+            if options["editoriales"]:
+                raise CommandError("--cache genera las listas de todas las editoriales")
+            inicio = time.monotonic()
+            ruta, total = generar_listas_en_cache(firma_listas(options["formato"]), options["formato"],
+                                                  options["procesos"])
+            estado = f"{total} fichas" if total else "ya estaba vigente"
+            self.stdout.write(self.style.SUCCESS(f"{ruta} ({estado}) — {time.monotonic() - inicio:.1f}s"))
+            return
+
+        salida = Path(options["salida"]).resolve()
+        if not salida.parent.is_dir():
+            raise CommandError(f"No existe la carpeta {salida.parent}")
+
+        inicio = time.monotonic()
+        resumen = generar_listas(salida, options["formato"], options["editoriales"], options["procesos"])
+        for r in resumen:
+            self.stdout.write(f"{r['archivo']}: {r['filas']} fichas")
+        total = sum(r["filas"] for r in resumen)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(resumen)} listas ({total} fichas) en {salida} — {time.monotonic() - inicio:.1f}s"
+        ))
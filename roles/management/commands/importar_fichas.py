@@ -0,0 +1,58 @@
+# roles/management/commands/importar_fichas.py
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from roles.carga_masiva import LOTE, MODO_CREAR, MODOS, ArchivoInvalido
+from roles.importacion_paralela import importar_archivos
+
+
+class Command(BaseCommand):
+    help = "Importa fichas desde archivos .xlsx/.csv/.ndjson del servidor, validando en paralelo"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivos", nargs="+", help="Plantilla .xlsx, .csv (UTF-8) o .ndjson; se procesan en orden")
+        parser.add_argument("--modo", choices=MODOS, default=MODO_CREAR,
+                            help="crear: un ISBN existente es error; actualizar: upsert (default crear)")
+        parser.add_argument("--procesos", type=int, default=None, help="Procesos que validan (default: nº de núcleos)")
+        parser.add_argument("--lote", type=int, default=LOTE, help=f"Filas por lote (default {LOTE})")
+        parser.add_argument("--errores", default="importar_fichas.errores.csv",
+                            help="CSV con las filas fallidas (default importar_fichas.errores.csv)")
+
+    def handle(self, *args, **options):
+        rutas = [Path(a).resolve() for a in options["archivos"]]
+        for ruta in rutas:
+            if not ruta.is_file():
+                raise CommandError(f"No existe el archivo {ruta}")
+        errores = Path(options["errores"]).resolve()
+        if not errores.parent.is_dir():
+            raise CommandError(f"No existe la carpeta {errores.parent}")
+        if options["lote"] < 1:
+            raise CommandError("--lote debe ser mayor que 0")
+
+        ultimo = time.monotonic()
+
+        def progreso(totales):
+            nonlocal ultimo
+            if time.monotonic() - ultimo >= 5:
+                ultimo = time.monotonic()
+                self.stdout.write(f"{totales['filas']} filas, {totales['failed']} fallidas "
+                                  f"({_ritmo(totales):.0f} filas/s)")
+
+        try:
+            t = importar_archivos(rutas, options["modo"], errores, options["procesos"], options["lote"], progreso)
+        except ArchivoInvalido as e:
+            raise CommandError(str(e))
+
+        msg = (f"{t['filas']} filas en {t['segundos']:.1f}s ({_ritmo(t):.0f} filas/s): "
+               f"{t['created']} creadas, {t['updated']} actualizadas, {t['unchanged']} sin cambios, "
+               f"{t['failed']} fallidas")
+        if t["failed"]:
+            self.stderr.write(self.style.WARNING(f"{msg} — detalle en {errores}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(msg))
+
+
+def _ritmo(totales) -> float:
+    return totales["filas"] / totales["segundos"] if totales["segundos"] else 0.0
@@ -0,0 +1,50 @@
+# roles/management/commands/procesar_exportaciones.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from roles.exportaciones import procesar, purgar_vencidas, tomar_siguiente
+from roles.models import TrabajoExportacion
+
+
+class Command(BaseCommand):
+    help = "Worker local: genera las exportaciones del panel encoladas en segundo plano"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true", help="Procesa los pendientes y termina")
+        parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre revisiones de la cola (default 2)")
+
+    def handle(self, *args, **options):
+        # Worker único: lo que quedó PROCESANDO es de una ejecución anterior que se cortó
+        huerfanos = (TrabajoExportacion.objects
+                     .filter(estado=TrabajoExportacion.ESTADO_PROCESANDO)
+                     .update(estado=TrabajoExportacion.ESTADO_PENDIENTE, procesadas=0))
+        if huerfanos:
+            self.stdout.write(self.style.WARNING(f"{huerfanos} exportaciones interrumpidas vuelven a la cola"))
+
+        ultima_purga = 0.0
+        while True:
+            close_old_connections()
+
+            if time.monotonic() - ultima_purga > 600:
+                borradas = purgar_vencidas()
+                if borradas:
+                    self.stdout.write(f"Purgadas {borradas} exportaciones vencidas")
+                ultima_purga = time.monotonic()
+
+            trabajo = tomar_siguiente()
+            if trabajo is None:
+                if options["una_vez"]:
+                    break
+                time.sleep(options["intervalo"])
+                continue
+
+            inicio = time.monotonic()
+            procesar(trabajo)
+            msg = (f"Exportación {trabajo.pk} ({trabajo.formato}): {trabajo.estado}, "
+                   f"{trabajo.procesadas} filas en {time.monotonic() - inicio:.1f}s")
+            if trabajo.estado == TrabajoExportacion.ESTADO_LISTO:
+                self.stdout.write(self.style.SUCCESS(msg))
+            else:
+                self.stderr.write(self.style.ERROR(f"{msg} — {trabajo.error}"))
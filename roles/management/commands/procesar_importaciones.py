@@ -0,0 +1,70 @@
+# roles/management/commands/procesar_importaciones.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from roles.carga_masiva import MODO_ACTUALIZAR
+from roles.importaciones import import_dir, procesar, purgar_vencidas, tomar_siguiente
+from roles.models import TrabajoImportacion
+
+
+class Command(BaseCommand):
+    help = "Worker local: valida e inserta las cargas masivas encoladas en segundo plano"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--una-vez", action="store_true", help="Procesa los pendientes y termina")
+        parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre revisiones de la cola (default 2)")
+
+    def handle(self, *args, **options):
+        # Worker único: lo que quedó PROCESANDO es de una ejecución anterior que se cortó.
+        # Las simulaciones no escriben y en modo "actualizar" reintentar es seguro (lo ya
+        # escrito queda sin cambios); en "crear" los lotes ya insertados fallarían como
+        # duplicados, así que se cierran con error.
+        interrumpidas = TrabajoImportacion.objects.filter(estado=TrabajoImportacion.ESTADO_PROCESANDO)
+        seguras = Q(modo=MODO_ACTUALIZAR) | Q(simulacion=True)
+        reintentos = interrumpidas.filter(seguras).update(
+            estado=TrabajoImportacion.ESTADO_PENDIENTE, validadas=0, insertadas=0, fallidas=0, errores=[],
+        )
+        cerradas = 0
+        for trabajo in interrumpidas.exclude(seguras):
+            (import_dir() / trabajo.archivo).unlink(missing_ok=True)
+            trabajo.estado = TrabajoImportacion.ESTADO_ERROR
+            trabajo.error = ("La carga se interrumpió. Vuelva a subir el archivo marcando "
+                             "\"actualizar fichas existentes\" para completar las filas que faltan.")
+            trabajo.terminado = timezone.now()
+            trabajo.save(update_fields=["estado", "error", "terminado"])
+            cerradas += 1
+        if reintentos or cerradas:
+            self.stdout.write(self.style.WARNING(
+                f"Importaciones interrumpidas: {reintentos} vuelven a la cola, {cerradas} cerradas con error"
+            ))
+
+        ultima_purga = 0.0
+        while True:
+            close_old_connections()
+
+            if time.monotonic() - ultima_purga > 600:
+                borradas = purgar_vencidas()
+                if borradas:
+                    self.stdout.write(f"Purgadas {borradas} importaciones antiguas")
+                ultima_purga = time.monotonic()
+
+            trabajo = tomar_siguiente()
+            if trabajo is None:
+                if options["una_vez"]:
+                    break
+                time.sleep(options["intervalo"])
+                continue
+
+            inicio = time.monotonic()
+            procesar(trabajo)
+            msg = (f"Importación {trabajo.pk} ({trabajo.formato}, {trabajo.modo}): {trabajo.estado}, "
+                   f"{trabajo.insertadas} insertadas, {trabajo.fallidas} fallidas "
+                   f"en {time.monotonic() - inicio:.1f}s")
+            if trabajo.estado == TrabajoImportacion.ESTADO_LISTO:
+                self.stdout.write(self.style.SUCCESS(msg))
+            else:
+                self.stderr.write(self.style.ERROR(f"{msg} — {trabajo.error}"))
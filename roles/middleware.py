@@ -0,0 +1,18 @@
+# -------------------------------------------------------------------------------
+# Middleware que expone request.auth_context (ver roles/autorizacion.py).
+# Es perezoso: si la vista no lo usa, no se consulta nada. Debe ir después de
+# AuthenticationMiddleware en settings.MIDDLEWARE.
+# -------------------------------------------------------------------------------
+
+from django.utils.functional import SimpleLazyObject
+
+from .autorizacion import get_auth_context
+
+
+class AuthContextMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.auth_context = SimpleLazyObject(lambda: get_auth_context(request.user))
+        return self.get_response(request)
@@ -10,6 +10,10 @@ y su vínculo con las editoriales dentro del sistema. Incluye:
 - UsuarioEditorial: tabla intermedia que implementa la relación M:N entre 
   usuarios y editoriales, asegurando que un usuario pueda pertenecer a varias 
   editoriales y una editorial pueda tener múltiples usuarios.
+- TrabajoExportacion: exportaciones del panel que se generan en segundo plano
+  (ver roles/exportaciones.py).
+- TokenIntegracion: credenciales de los sistemas de las editoriales que envían
+  fichas por la API de ingesta NDJSON (ver roles/ingesta.py).
 
 De esta manera, se organiza la gestión de perfiles y permisos, facilitando 
 el control de acceso y la administración de usuarios según su rol 
@@ -23,6 +27,9 @@ y las editoriales a las que pertenecen.
 #     pertenecer a varias editoriales y viceversa)
 # -----------------------------------------------------------------------------
 
+import hashlib
+import secrets
+
 from django.conf import settings
 from django.db import models
 
@@ -30,6 +37,8 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
+from catalogo.normalizacion import plegar_texto
+
 
 
 # Definir el catálogo de editoriales para poder asociarlas a los usuarios 
@@ -37,6 +46,8 @@ from decimal import Decimal
 class Editorial(models.Model):
     # Catálogo de editoriales -- ESTÁ ACÁ PARA ASOCIAR EDITORIALES CON EL ROL DEL USUARIO
     nombre = models.CharField(max_length=150)
+    # Nombre sin tildes/mayúsculas para búsquedas (se recalcula en save)
+    nombre_busqueda = models.CharField(max_length=150, blank=True, default="", editable=False, db_index=True)
     id_fiscal = models.CharField(max_length=50, blank=True, null=True)
 
     #NUEVOS CAMPOS QUE DEBEN AGREGARSE -- ¿Se agrega acá porque dependen de la editorial y no el libro? 
@@ -76,6 +87,13 @@ class Editorial(models.Model):
     def __str__(self) -> str:        
         return self.nombre
 
+    def save(self, *args, **kwargs):
+        self.nombre_busqueda = plegar_texto(self.nombre, 150)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "nombre" in update_fields:
+            kwargs["update_fields"] = [*update_fields, "nombre_busqueda"]
+        super().save(*args, **kwargs)
+
 
 # Extender la información del usuario con un perfil asociado 1–1, 
 # donde se define el rol (editor, consultor o admin) y se agregan 
@@ -157,3 +175,207 @@ class UsuarioEditorial(models.Model):
     # Representamos la relación en formato legible
     def __str__(self) -> str:
         return f"{self.user} ↔ {self.editorial}"
+
+
+# Exportaciones del panel generadas fuera del request: el panel encola el
+# trabajo, `manage.py procesar_exportaciones` lo ejecuta y el usuario descarga
+# el archivo con un link firmado cuando está listo.
+
+class TrabajoExportacion(models.Model):
+    ESTADO_PENDIENTE = "PENDIENTE"
+    ESTADO_PROCESANDO = "PROCESANDO"
+    ESTADO_LISTO = "LISTO"
+    ESTADO_ERROR = "ERROR"
+
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, "Pendiente"),
+        (ESTADO_PROCESANDO, "Procesando"),
+        (ESTADO_LISTO, "Listo"),
+        (ESTADO_ERROR, "Error"),
+    ]
+
+    TIPO_PANEL = "PANEL"    # resultado de búsqueda del panel
+    TIPO_LISTAS = "LISTAS"  # .zip con las listas de precios por editorial (roles/listas_precios.py)
+
+    TIPO_CHOICES = [
+        (TIPO_PANEL, "Panel"),
+        (TIPO_LISTAS, "Listas de precios"),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="exportaciones")
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default=TIPO_PANEL)
+    formato = models.CharField(max_length=5)                  # csv / xlsx (en las listas, el de cada planilla del .zip)
+    parametros = models.JSONField(default=dict)               # querystring del panel (filtros, sort, cols)
+    firma = models.CharField(max_length=40, db_index=True)    # filtros normalizados + formato + versión del catálogo
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE, db_index=True)
+
+    total = models.PositiveIntegerField(null=True, blank=True)
+    procesadas = models.PositiveIntegerField(default=0)
+    archivo = models.CharField(max_length=255, blank=True, default="")  # ruta dentro de EXPORT_DIR
+    error = models.TextField(blank=True, default="")
+
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-creado"]
+        indexes = [
+            models.Index(fields=["usuario", "firma"]),
+            models.Index(fields=["estado", "creado"]),
+        ]
+        verbose_name = "Exportación"
+        verbose_name_plural = "Exportaciones"
+
+    def __str__(self) -> str:
+        return f"Exportación {self.pk} ({self.formato}, {self.estado})"
+
+    @property
+    def porcentaje(self) -> int:
+        if self.estado == self.ESTADO_LISTO:
+            return 100
+        if not self.total:
+            return 0
+        return min(99, int(self.procesadas * 100 / self.total))
+
+
+# Carga masiva por fragmentos: el cliente abre una sesión, envía los bloques
+# de filas numerados (cada uno se valida al llegar y se puede reenviar) y al
+# final la confirma. Si se corta la conexión retoma desde el último
+# fragmento confirmado (ver roles/carga_masiva.py).
+
+class SesionCarga(models.Model):
+    ESTADO_ABIERTA = "ABIERTA"
+    ESTADO_PROCESANDO = "PROCESANDO"
+    ESTADO_FINALIZADA = "FINALIZADA"
+
+    ESTADO_CHOICES = [
+        (ESTADO_ABIERTA, "Abierta"),
+        (ESTADO_PROCESANDO, "Procesando"),
+        (ESTADO_FINALIZADA, "Finalizada"),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="cargas")
+    modo = models.CharField(max_length=12, default="crear")    # crear / actualizar
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default=ESTADO_ABIERTA, db_index=True)
+    resultado = models.JSONField(default=dict, blank=True)     # resumen de la importación al finalizar
+
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-creado"]
+        verbose_name = "Sesión de carga"
+        verbose_name_plural = "Sesiones de carga"
+
+    def __str__(self) -> str:
+        return f"Carga {self.pk} ({self.modo}, {self.estado})"
+
+
+class FragmentoCarga(models.Model):
+    sesion = models.ForeignKey(SesionCarga, on_delete=models.CASCADE, related_name="fragmentos")
+    numero = models.PositiveIntegerField()                     # 1, 2, 3, ... en el orden del archivo
+    filas = models.JSONField(default=list)
+    n_filas = models.PositiveIntegerField(default=0)
+    valido = models.BooleanField(default=False)
+    errores = models.JSONField(default=list, blank=True)       # [{row (dentro del fragmento), error}]
+    huella = models.CharField(max_length=40)                   # sha1 del contenido: reenviar lo mismo no revalida
+    recibido = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["numero"]
+        constraints = [
+            models.UniqueConstraint(fields=["sesion", "numero"], name="uniq_fragmento_sesion_numero"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Fragmento {self.numero} de la carga {self.sesion_id}"
+
+
+# Carga masiva en segundo plano: el request solo guarda el archivo y encola;
+# `manage.py procesar_importaciones` valida e inserta reportando el avance,
+# que el modal de carga masiva consulta hasta que termina.
+
+class TrabajoImportacion(models.Model):
+    ESTADO_PENDIENTE = "PENDIENTE"
+    ESTADO_PROCESANDO = "PROCESANDO"
+    ESTADO_LISTO = "LISTO"
+    ESTADO_ERROR = "ERROR"
+
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, "Pendiente"),
+        (ESTADO_PROCESANDO, "Procesando"),
+        (ESTADO_LISTO, "Listo"),
+        (ESTADO_ERROR, "Error"),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="importaciones")
+    modo = models.CharField(max_length=12, default="crear")   # crear / actualizar
+    formato = models.CharField(max_length=8)                  # xlsx / ndjson / validado (confirmación de una simulación) / sesion
+    archivo = models.CharField(max_length=255, blank=True, default="")  # ruta dentro de IMPORT_DIR
+    # Carga por fragmentos: las filas se leen de los FragmentoCarga de la sesión (sin archivo)
+    sesion = models.ForeignKey(SesionCarga, null=True, blank=True, on_delete=models.SET_NULL, related_name="trabajos")
+    # Simulación (dry-run): valida sin escribir y deja las filas normalizadas en
+    # archivo_validado hasta que se confirman con el token (o vence IMPORT_SIMULACION_TTL)
+    simulacion = models.BooleanField(default=False)
+    archivo_validado = models.CharField(max_length=255, blank=True, default="")
+    nombre_original = models.CharField(max_length=255, blank=True, default="")
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE, db_index=True)
+
+    total = models.PositiveIntegerField(null=True, blank=True)  # filas (estimado en xlsx)
+    validadas = models.PositiveIntegerField(default=0)
+    insertadas = models.PositiveIntegerField(default=0)         # creadas + actualizadas
+    fallidas = models.PositiveIntegerField(default=0)
+    errores = models.JSONField(default=list, blank=True)        # [{row, error}] hasta MAX_ERRORES
+    resultado = models.JSONField(default=dict, blank=True)      # resumen final de importar()
+    error = models.TextField(blank=True, default="")            # falla inesperada del worker
+
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-creado"]
+        indexes = [
+            models.Index(fields=["estado", "creado"]),
+        ]
+        verbose_name = "Importación"
+        verbose_name_plural = "Importaciones"
+
+    def __str__(self) -> str:
+        return f"Importación {self.pk} ({self.formato}, {self.estado})"
+
+
+# Sistemas de las editoriales que envían fichas por la API de ingesta NDJSON
+# (roles/ingesta.py). Solo se guarda el sha256 del token; el token en claro se
+# muestra una sola vez al emitirlo (manage.py crear_token_integracion).
+
+class TokenIntegracion(models.Model):
+    PREFIJO = "lib_"
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="tokens_integracion")
+    nombre = models.CharField(max_length=100)                  # p. ej. "ERP Editorial Pérez"
+    prefijo = models.CharField(max_length=12, editable=False)  # inicio del token, para reconocerlo
+    clave = models.CharField(max_length=64, unique=True, editable=False)  # sha256 hex del token
+    activo = models.BooleanField(default=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    ultimo_uso = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-creado"]
+        verbose_name = "Token de integración"
+        verbose_name_plural = "Tokens de integración"
+
+    def __str__(self) -> str:
+        return f"{self.nombre} ({self.prefijo}…)"
+
+    @staticmethod
+    def resumen(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    def emitir(cls, usuario, nombre: str) -> tuple["TokenIntegracion", str]:
+        """Crea el token y lo devuelve en claro (no se puede recuperar después)."""
+        token = cls.PREFIJO + secrets.token_urlsafe(32)
+        obj = cls.objects.create(usuario=usuario, nombre=nombre, prefijo=token[:12], clave=cls.resumen(token))
+        return obj, token
@@ -0,0 +1,253 @@
+"""
+Paginación por cursor (keyset / seek) para el panel unificado.
+
+En vez de LIMIT/OFFSET + COUNT(*), cada página se pide "después de" la última
+fila vista: se ordena por (campo_de_orden, id) y se filtra con
+campo >= valor AND (campo > valor OR id > ultimo_id). Así la página 1.000
+cuesta lo mismo que la primera (un range scan sobre el índice del campo) y no
+se necesita contar el total.
+
+El token "after" es opaco y va firmado (django.core.signing), así que el
+cliente no puede fabricar cursores arbitrarios.
+
+Para el modo clásico por número de página se incluye ConteoCacheadoPaginator,
+que evita repetir el COUNT(*) mientras los filtros y el catálogo no cambien.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from catalogo.versiones import PRECIOS, get_version
+
+TOKEN_SALT = "roles.panel.after"
+
+
+def _valor_serializable(v):
+    """Convierte el valor del campo de orden a algo que acepte JSON."""
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+def _valor_de(obj, lookup: str):
+    """Resuelve 'editorial__nombre' (u otro lookup) sobre una instancia."""
+    val = obj
+    for parte in lookup.split("__"):
+        val = getattr(val, parte, None)
+        if val is None:
+            return None
+    return val
+
+
+def crear_token(sort_field: str, obj) -> str:
+    """Token opaco con el valor del campo de orden y el id (desempate)."""
+    data = {"s": sort_field, "v": _valor_serializable(_valor_de(obj, sort_field)), "id": obj.pk}
+    return signing.dumps(data, salt=TOKEN_SALT, compress=True)
+
+
+def leer_token(token: str | None, sort_field: str):
+    """
+    Devuelve (valor, id) del token o None si es inválido, está manipulado
+    o fue generado para otro orden (en ese caso se parte desde el inicio).
+    """
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get("s") != sort_field:
+        return None
+    return data.get("v"), data.get("id")
+
+
+class KeysetPage:
+    """
+    Página mínima compatible con el template del panel (iterable + flags).
+    No conoce el total ni el número de página: solo si hay más filas.
+    """
+
+    def __init__(self, object_list, has_next: bool, next_token: str | None, is_first: bool):
+        self.object_list = object_list
+        self.next_token = next_token
+        self.is_first = is_first
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return not self.is_first
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or not self.is_first
+
+
+def _despues_de(qs, sort_field: str, valor, ultimo_id):
+    """Filas posteriores a (valor, ultimo_id) en el orden (sort_field, id)."""
+    if valor is None:
+        # Campo nulo (precio sin TC): en MySQL/SQLite los NULL van primero en
+        # orden ascendente, así que siguen los NULL con id mayor y luego el resto.
+        return qs.filter(Q(**{f"{sort_field}__isnull": False}) | Q(id__gt=ultimo_id))
+    # La condición >= acota el rango del índice; el OR resuelve empates por id.
+    return qs.filter(**{f"{sort_field}__gte": valor}).filter(
+        Q(**{f"{sort_field}__gt": valor}) | Q(id__gt=ultimo_id)
+    )
+
+
+def paginar_keyset(qs, sort_field: str, after: str | None, per_page: int) -> KeysetPage:
+    """
+    Aplica el cursor 'after' sobre qs ordenado por (sort_field, id) y trae
+    per_page + 1 filas para saber si existe una página siguiente.
+    """
+    qs = qs.order_by(sort_field, "id")
+
+    cursor = leer_token(after, sort_field)
+    if cursor is not None:
+        qs = _despues_de(qs, sort_field, *cursor)
+
+    filas = list(qs[: per_page + 1])
+    has_next = len(filas) > per_page
+    filas = filas[:per_page]
+    next_token = crear_token(sort_field, filas[-1]) if has_next and filas else None
+    return KeysetPage(filas, has_next, next_token, is_first=cursor is None)
+
+
+def recorrer_por_lotes(qs, sort_field: str, campos, lote: int = 2000):
+    """
+    Genera las tuplas qs.values_list(*campos) en el orden (sort_field, id),
+    pidiendo `lote` filas por consulta con el mismo cursor keyset.
+    A diferencia de .iterator(), la memoria queda acotada también en MySQL
+    (mysqlclient trae el resultado completo de cada consulta al cliente).
+    """
+    n = len(campos)
+    qs = qs.order_by(sort_field, "id").values_list(*campos, sort_field, "id")
+    cursor = None
+    while True:
+        pagina = qs if cursor is None else _despues_de(qs, sort_field, *cursor)
+        filas = list(pagina[:lote])
+        for fila in filas:
+            yield fila[:n]
+        if len(filas) < lote:
+            return
+        cursor = filas[-1][n], filas[-1][n + 1]
+
+
+# -----------------------------------------------
+# Conteo cacheado (modo por número de página)
+# -----------------------------------------------
+
+_SELECT_EXTERIOR = {"SIMPLE", "PRIMARY"}
+
+
+def _producto_explain(cols, filas) -> float | None:
+    """
+    Producto de rows * filtered / 100 de las tablas del SELECT exterior de un
+    EXPLAIN (MySQL). Las filas de subconsultas y UNION (DEPENDENT SUBQUERY,
+    UNION, DERIVED, ...) no multiplican el resultado: un `IN (subconsulta)`
+    filtra, no agrega filas.
+    """
+    if "rows" not in cols:
+        return None
+    i_rows = cols.index("rows")
+    i_filtered = cols.index("filtered") if "filtered" in cols else None
+    i_id = cols.index("id") if "id" in cols else None
+    i_tipo = cols.index("select_type") if "select_type" in cols else None
+    if i_id is not None:
+        ids = [fila[i_id] for fila in filas if fila[i_id] is not None]
+        exterior = min(ids) if ids else None
+        filas = [fila for fila in filas if fila[i_id] == exterior]
+    if i_tipo is not None:
+        filas = [fila for fila in filas if str(fila[i_tipo]).upper() in _SELECT_EXTERIOR]
+    if not filas:
+        return None
+    total = 1.0
+    for fila in filas:
+        rows = fila[i_rows] or 1
+        filtered = (fila[i_filtered] or 100) if i_filtered is not None else 100
+        total *= float(rows) * float(filtered) / 100.0
+    return total
+
+
+def estimar_conteo(qs) -> int | None:
+    """
+    Estimación barata del número de filas según el optimizador (solo MySQL):
+    EXPLAIN entrega 'rows' y 'filtered' por tabla; el producto de las del
+    SELECT exterior (_producto_explain) aproxima el tamaño del resultado sin
+    recorrerlo, acotado por las filas de la tabla (information_schema).
+    En otros motores devuelve None.
+    """
+    if connection.vendor != "mysql":
+        return None
+    sql, params = qs.order_by().query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            cols = [c[0].lower() for c in cursor.description]
+            filas = cursor.fetchall()
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES"
+                " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [qs.model._meta.db_table],
+            )
+            tabla = cursor.fetchone()
+    except DatabaseError:
+        return None
+    total = _producto_explain(cols, filas)
+    if total is None:
+        return None
+    if tabla and tabla[0] is not None:
+        total = min(total, float(tabla[0]))
+    return int(total)
+
+
+class ConteoCacheadoPaginator(Paginator):
+    """
+    Paginator cuyo COUNT(*) se cachea por firma de filtros + versiones del
+    catálogo y de precios (cualquier alta/edición/baja de fichas, o un cambio
+    de recargos/TC con el filtro por precio, invalida todo).
+
+    Si el optimizador estima más de PANEL_CONTEO_APROX_UMBRAL filas, se usa la
+    estimación (marcada con .aproximado) en vez de bloquear el panel con un
+    conteo exacto sobre un resultado enorme.
+    """
+
+    def __init__(self, object_list, per_page, firma: str, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.firma = firma
+        self.aproximado = False
+
+    @cached_property
+    def count(self):
+        key = f"panel:conteo:{get_version()}:{get_version(PRECIOS)}:{self.firma}"
+        hit = cache.get(key)
+        if hit is not None:
+            total, self.aproximado = hit
+            return total
+
+        umbral = getattr(settings, "PANEL_CONTEO_APROX_UMBRAL", None)
+        if umbral:
+            estimado = estimar_conteo(self.object_list)
+            if estimado is not None and estimado >= umbral:
+                self.aproximado = True
+                cache.set(key, (estimado, True), getattr(settings, "PANEL_CONTEO_APROX_TTL", 60))
+                return estimado
+
+        total = Paginator.count.func(self)
+        cache.set(key, (total, False), getattr(settings, "PANEL_CONTEO_TTL", 600))
+        return total
@@ -6,9 +6,10 @@
 # -------------------------------------------------------------------------------
 
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Profile
+from .models import Profile, UsuarioEditorial
+from .autorizacion import invalidar_auth_context
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -28,5 +29,15 @@ def ensure_profile(sender, instance, created, **kwargs):
             Profile.objects.create(user=instance)
 
 
+# -------------------------------------------------------------------------------
+# Invalidación del contexto de autorización cacheado (roles/autorizacion.py)
+# cuando cambia el rol del usuario o sus editoriales asignadas.
+# (bulk_create no dispara señales: las vistas que lo usan invalidan a mano)
+# -------------------------------------------------------------------------------
 
-
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=UsuarioEditorial)
+@receiver(post_delete, sender=UsuarioEditorial)
+def invalidar_contexto(sender, instance, **kwargs):
+    invalidar_auth_context(instance.user_id)
@@ -1,3 +1,1007 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import QueryDict
+from django.urls import reverse
+from openpyxl import Workbook, load_workbook
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from catalogo.models import Idioma, LibroFicha, Moneda, Pais, TipoTapa
+from templates.reports.search_result import escribir_xlsx, lineas_csv
+
+from .autorizacion import get_auth_context
+from .carga_masiva import DUPLICADO, MODO_ACTUALIZAR, YA_EXISTE, TablasReferencia, importar
+from .consultas import build_queryset_for_user
+from .ingesta import respuesta_ingesta
+from .listas_precios import generar_listas
+from . import exportaciones
+from .importaciones import SimulacionNoDisponible, confirmar_simulacion, procesar, tomar_siguiente
+from .models import (
+    Editorial, FragmentoCarga, Profile, SesionCarga, TokenIntegracion, TrabajoImportacion, UsuarioEditorial,
+)
+from .paginacion import (
+    ConteoCacheadoPaginator, _producto_explain, crear_token, estimar_conteo, leer_token, paginar_keyset,
+    recorrer_por_lotes,
+)
+from .validacion import (
+    _decimal, _entero, primer_error, validar_columnas, validar_ean, validar_isbn, validar_lote,
+)
+
+
+def _usuario(nombre, rol=Profile.ROLE_CONSULTOR, editoriales=()):
+    usuario = get_user_model().objects.create_user(username=nombre, email=f"{nombre}@example.com", password="pw")
+    usuario.profile.role = rol
+    usuario.profile.save()
+    for editorial in editoriales:
+        UsuarioEditorial.objects.create(user=usuario, editorial=editorial)
+    return usuario
+
+
+def _fila(**kw) -> dict:
+    """Fila válida de la carga masiva (claves snake_case, como el JSON del cliente)."""
+    fila = {
+        "isbn": "9780306406157", "titulo": "Cien años de soledad", "editorial": "Editorial Pérez",
+        "tipo_tapa": "Rústica", "numero_paginas": 120, "idioma_original": "es", "numero_edicion": 1,
+        "fecha_edicion": "2020-01-01", "pais_edicion": "CL", "precio": "9990.5", "moneda": "CLP",
+        "descuento_distribuidor": "10", "autor": "García Márquez", "resumen_libro": "Resumen",
+    }
+    fila.update(kw)
+    return fila
+
+
+class _ConTablas(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ed1 = Editorial.objects.create(nombre="Editorial Pérez")
+        cls.ed2 = Editorial.objects.create(nombre="Ñandú Libros")
+        cls.tt = TipoTapa.objects.create(nombre="Rústica")
+        cls.idioma = Idioma.objects.create(code="es", nombre="Español")
+        cls.pais = Pais.objects.create(code="CL", nombre="Chile")
+        cls.clp = Moneda.objects.create(code="CLP", nombre="Peso")
+
+    def setUp(self):
+        cache.clear()  # contextos de autorización y conteos de otras pruebas
+        # Los requests del cliente de pruebas no lanzan el hilo del autocompletado
+        patcher = mock.patch("catalogo.autocompletar._lanzar")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @classmethod
+    def _ficha(cls, i, editorial=None, **kw) -> LibroFicha:
+        """Ficha válida sin guardar; el ISBN-13 sale de `i`."""
+        base = f"9781{i:08d}"
+        datos = {
+            "isbn": base + str((10 - sum(int(d) * (3 if k % 2 else 1) for k, d in enumerate(base)) % 10) % 10),
+            "editorial": editorial or cls.ed1, "titulo": f"Título {i:04d}", "autor": "García Márquez",
+            "tipo_tapa": cls.tt, "numero_paginas": 100, "idioma_original": cls.idioma, "numero_edicion": 1,
+            "fecha_edicion": date(2020, 1, 1), "pais_edicion": cls.pais, "precio": Decimal("1000"),
+            "moneda": cls.clp, "descuento_distribuidor": Decimal("10"), "resumen_libro": "Resumen",
+        }
+        datos.update(kw)
+        return LibroFicha(**datos)
+
+
+# ===========================
+# ISBN / EAN
+# ===========================
+
+class ValidarIsbnTests(SimpleTestCase):
+
+    def test_isbn13_con_guiones_y_espacios(self):
+        self.assertEqual(validar_isbn("978-0-306 40615-7"), "9780306406157")
+
+    def test_isbn10_valido(self):
+        self.assertEqual(validar_isbn("0-306-40615-2"), "0306406152")
+
+    def test_isbn10_con_x(self):
+        self.assertEqual(validar_isbn("0-8044-2957-x"), "080442957X")
+
+    def test_celda_numerica_de_excel(self):
+        self.assertEqual(validar_isbn(9780306406157.0), "9780306406157")
+
+    def test_digito_verificador_incorrecto(self):
+        with self.assertRaisesMessage(ValueError, "ISBN-13 inválido"):
+            validar_isbn("9780306406158")
+        with self.assertRaisesMessage(ValueError, "ISBN-10 inválido"):
+            validar_isbn("0306406153")
+
+    def test_largo_incorrecto(self):
+        for raw in ("", "12345", "97803064061570"):
+            with self.subTest(raw=raw), self.assertRaisesMessage(ValueError, "10 o 13 caracteres"):
+                validar_isbn(raw)
+
+
+class ValidarEanTests(SimpleTestCase):
+
+    def test_vacio(self):
+        self.assertIsNone(validar_ean(None))
+        self.assertIsNone(validar_ean(""))
+
+    def test_valido(self):
+        self.assertEqual(validar_ean("978-0-306-40615-7"), "9780306406157")
+        self.assertEqual(validar_ean(9780306406157.0), "9780306406157")
+
+    def test_invalido(self):
+        for raw in ("9780306406158", "0306406152", "97803064061X7"):
+            with self.subTest(raw=raw), self.assertRaisesMessage(ValueError, "EAN-13 inválido"):
+                validar_ean(raw)
+
+
+# ===========================
+# Conversores
+# ===========================
+
+class EnteroTests(SimpleTestCase):
+
+    def test_valores_validos(self):
+        convertir = _entero("numero_paginas", obligatorio=True, minimo=1)
+        self.assertEqual(convertir(120), 120)
+        self.assertEqual(convertir(120.0), 120)
+        self.assertEqual(convertir("120"), 120)
+        self.assertEqual(convertir(" 120 "), 120)
+
+    def test_valores_invalidos(self):
+        convertir = _entero("numero_paginas", obligatorio=True, minimo=1)
+        for v in (120.5, "120.5", "abc", 0, -3, "", "   ", None, [1]):
+            with self.subTest(v=v), self.assertRaisesMessage(ValueError, "numero_paginas inválido"):
+                convertir(v)
+
+    def test_opcional(self):
+        convertir = _entero("peso_gr")
+        self.assertIsNone(convertir(None))
+        self.assertIsNone(convertir("  "))
+        self.assertEqual(convertir(0), 0)
+
+
+class DecimalTests(SimpleTestCase):
+
+    def test_valores_validos(self):
+        convertir = _decimal("precio", obligatorio=True)
+        self.assertEqual(convertir("9990.5"), Decimal("9990.5"))
+        self.assertEqual(convertir(9990.5), Decimal("9990.5"))
+        self.assertEqual(convertir(" 10 "), Decimal("10"))
+
+    def test_valores_invalidos(self):
+        convertir = _decimal("precio", obligatorio=True)
+        for v in ("abc", "NaN", "Infinity", "1.234", "1" * 20, "", None):
+            with self.subTest(v=v), self.assertRaisesMessage(ValueError, "precio inválido"):
+                convertir(v)
+
+    def test_defecto_y_opcional(self):
+        self.assertEqual(_decimal("descuento_distribuidor", defecto=Decimal("0"))(""), Decimal("0"))
+        self.assertIsNone(_decimal("alto_cm")(None))
+
+
+# ===========================
+# Validación por columnas
+# ===========================
+
+class ValidarColumnasTests(_ConTablas):
+
+    def setUp(self):
+        super().setUp()
+        self.tablas = TablasReferencia()
+
+    def test_lote_valido(self):
+        datos, errores = validar_lote([_fila(), _fila(isbn="0-306-40615-2")], self.tablas)
+        self.assertEqual(errores, {})
+        self.assertEqual(datos[0]["editorial"], self.ed1)
+        self.assertEqual(datos[1]["isbn"], "0306406152")
+        self.assertEqual(datos[0]["precio"], Decimal("9990.5"))
+
+    def test_matriz_por_columna(self):
+        columnas = {
+            "isbn": ["9780306406157", "123", None],
+            "titulo": ["Uno", "Dos", "Tres"],
+            "editorial": ["Editorial Pérez", "No existe", "Editorial Pérez"],
+            "numero_paginas": [100, 100.5, 0],
+            "precio": ["10", "abc", "10"],
+            "ean": [None, "9780306406158", None],
+        }
+        _, matriz = validar_columnas(columnas, self.tablas)
+        self.assertEqual(matriz["isbn"], {1: "El ISBN debe tener 10 o 13 caracteres", 2: "isbn/titulo obligatorios"})
+        self.assertEqual(matriz["editorial"], {1: "Editorial no encontrada"})
+        self.assertEqual(matriz["numero_paginas"], {1: "numero_paginas inválido", 2: "numero_paginas inválido"})
+        self.assertEqual(matriz["precio"], {1: "precio inválido"})
+        self.assertEqual(matriz["ean"], {1: "EAN-13 inválido"})
+        self.assertNotIn("titulo", matriz)
+        # Columnas ausentes: todas sus filas faltan si son obligatorias
+        self.assertEqual(matriz["tipo_tapa"], {0: "Tipo tapa no encontrado", 1: "Tipo tapa no encontrado",
+                                               2: "Tipo tapa no encontrado"})
+        self.assertNotIn("subtitulo", matriz)
+        # Una fila con varios errores informa el de la primera columna
+        self.assertEqual(primer_error(matriz), {0: "Tipo tapa no encontrado",
+                                                1: "El ISBN debe tener 10 o 13 caracteres",
+                                                2: "isbn/titulo obligatorios"})
+
+    def test_valores_iguales_de_otro_tipo(self):
+        limpias, matriz = validar_columnas({"titulo": [1, True, 1.0], "precio": [1.5, "abc", Decimal("1.5")]},
+                                           self.tablas)
+        self.assertEqual(limpias["titulo"], ["1", "True", "1.0"])
+        self.assertEqual(matriz["precio"], {1: "precio inválido"})
+
+    def test_valor_no_hasheable(self):
+        _, matriz = validar_columnas({"titulo": [["lista"]]}, self.tablas)
+        self.assertEqual(matriz["titulo"], {0: "Valor inválido"})
+
+    def test_editorial_fuera_de_scope(self):
+        filas = [_fila(), _fila(isbn="0-306-40615-2", editorial="Ñandú Libros")]
+        _, errores = validar_lote(filas, self.tablas, editoriales={self.ed1.pk})
+        self.assertEqual(errores, {1: "Editorial no asignada al usuario"})
+
+
+# ===========================
+# importar()
+# ===========================
+
+class ImportarTests(_ConTablas):
+
+    def _importar(self, filas, **kw):
+        return importar(lambda: enumerate(filas, start=2), **kw)
+
+    def test_crea_fichas(self):
+        res = self._importar([_fila(), _fila(isbn="9788437604947", titulo="Rayuela")])
+        self.assertEqual((res["ok"], res["created"], res["updated"], res["unchanged"]), (True, 2, 0, 0))
+        ficha = LibroFicha.objects.get(isbn="9780306406157")
+        self.assertEqual(ficha.editorial, self.ed1)
+        self.assertEqual(ficha.isbn_normalizado, "9780306406157")
+        self.assertTrue(ficha.huella)
+
+    def test_un_error_no_escribe_nada(self):
+        res = self._importar([_fila(), _fila(isbn="9788437604947", precio="abc")])
+        self.assertFalse(res["ok"])
+        self.assertEqual(res["errors"], [{"row": 3, "error": "precio inválido"}])
+        self.assertFalse(LibroFicha.objects.exists())
+
+    def test_duplicado_y_existente_en_modo_crear(self):
+        self._importar([_fila()])
+        res = self._importar([_fila(isbn="0-306-40615-2"), _fila(isbn="9788437604947"),
+                              _fila(isbn="978-84-376-0494-7")])
+        self.assertEqual(res["errors"], [{"row": 2, "error": YA_EXISTE}, {"row": 4, "error": DUPLICADO}])
+        self.assertEqual(LibroFicha.objects.count(), 1)
+
+    def test_upsert_actualiza_y_crea(self):
+        self._importar([_fila()])
+        res = self._importar([_fila(isbn="0-306-40615-2", titulo="Cien años de soledad (2a)"),
+                              _fila(isbn="9788437604947", titulo="Rayuela")], modo=MODO_ACTUALIZAR)
+        self.assertEqual((res["ok"], res["created"], res["updated"], res["unchanged"]), (True, 1, 1, 0))
+        ficha = LibroFicha.objects.get(isbn_normalizado="9780306406157")
+        self.assertEqual(ficha.titulo, "Cien años de soledad (2a)")
+        self.assertEqual(ficha.isbn, "9780306406157")  # se conserva el ISBN guardado
+        self.assertEqual(ficha.huella, ficha.calcular_huella())
+
+    def test_upsert_sin_cambios_no_escribe(self):
+        self._importar([_fila()])
+        antes = LibroFicha.objects.get()
+        # Mismos datos con otra forma: entero como texto, precio como float, fecha de Excel
+        res = self._importar([_fila(numero_paginas="120", precio=9990.50, fecha_edicion=43831)],
+                             modo=MODO_ACTUALIZAR)
+        self.assertEqual((res["ok"], res["created"], res["updated"], res["unchanged"]), (True, 0, 0, 1))
+        self.assertEqual(LibroFicha.objects.get().huella, antes.huella)
+
+    def test_upsert_de_otra_editorial(self):
+        self._importar([_fila(editorial="Ñandú Libros")])
+        res = self._importar([_fila(titulo="Otro")], modo=MODO_ACTUALIZAR, editoriales={self.ed1.pk})
+        self.assertEqual(res["errors"], [{"row": 2, "error": "Ese ISBN pertenece a otra editorial"}])
+        self.assertEqual(LibroFicha.objects.get().titulo, "Cien años de soledad")
+
+    def test_modo_invalido(self):
+        with self.assertRaises(ValueError):
+            self._importar([_fila()], modo="otro")
+
+
+# ===========================
+# Conteo del panel
+# ===========================
+
+class _CursorFalso:
+    """Cursor de MySQL mínimo: EXPLAIN y luego TABLE_ROWS."""
+
+    def __init__(self, cols, filas, filas_tabla):
+        self.description = [(c,) for c in cols]
+        self._filas, self._filas_tabla = filas, filas_tabla
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self._filas
+
+    def fetchone(self):
+        return (self._filas_tabla,)
+
+
+# id, select_type, table, rows, filtered (búsqueda de un editor: trigramas + FULLTEXT)
+_EXPLAIN_COLS = ["id", "select_type", "table", "rows", "filtered"]
+_EXPLAIN = [
+    (1, "PRIMARY", "catalogo_libroficha", 20000, 10.0),
+    (1, "PRIMARY", "roles_editorial", 1, 100.0),
+    (2, "DEPENDENT SUBQUERY", "catalogo_trigrama", 5000, 100.0),
+    (3, "DEPENDENT UNION", "catalogo_libroficha", 300, 100.0),
+    (None, "UNION RESULT", "<union2,3>", None, None),
+]
+
+
+class EstimarConteoTests(SimpleTestCase):
+
+    def test_solo_select_exterior(self):
+        self.assertEqual(_producto_explain(_EXPLAIN_COLS, _EXPLAIN), 2000.0)
+
+    def test_simple(self):
+        self.assertEqual(_producto_explain(_EXPLAIN_COLS, [(1, "SIMPLE", "t", 500, 50.0)]), 250.0)
+
+    def test_sin_columna_rows(self):
+        self.assertIsNone(_producto_explain(["id"], [(1,)]))
+
+    def _estimar(self, filas_tabla):
+        conexion = mock.Mock(vendor="mysql")
+        conexion.cursor.return_value = _CursorFalso(_EXPLAIN_COLS, _EXPLAIN, filas_tabla)
+        with mock.patch("roles.paginacion.connection", conexion):
+            return estimar_conteo(LibroFicha.objects.all())
+
+    def test_estimar_conteo(self):
+        self.assertEqual(self._estimar(1_000_000), 2000)
+
+    def test_acotado_por_la_tabla(self):
+        self.assertEqual(self._estimar(800), 800)
+
+    def test_otros_motores(self):
+        self.assertIsNone(estimar_conteo(LibroFicha.objects.all()))
+
+
+class ConteoCacheadoTests(_ConTablas):
+
+    def setUp(self):
+        super().setUp()
+        LibroFicha.objects.bulk_create([self._ficha(i) for i in range(5)])
+
+    def _contar(self):
+        return ConteoCacheadoPaginator(LibroFicha.objects.order_by("id"), 2, firma="abc").count
+
+    def test_cachea_el_conteo(self):
+        self.assertEqual(self._contar(), 5)
+        with self.assertNumQueries(2):  # solo las versiones, sin COUNT(*)
+            self.assertEqual(self._contar(), 5)
+
+    def test_un_cambio_en_el_catalogo_invalida(self):
+        self.assertEqual(self._contar(), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._ficha(99).save()
+        self.assertEqual(self._contar(), 6)
+
+    def test_sin_cambios_no_se_invalida(self):
+        self.assertEqual(self._contar(), 5)
+        LibroFicha.objects.bulk_create([self._ficha(99)])  # sin señales ni bump
+        self.assertEqual(self._contar(), 5)
+
+
+# ===========================
+# Búsqueda por claves plegadas
+# ===========================
+
+class BusquedaEditorialTests(_ConTablas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ed3 = Editorial.objects.create(nombre="Editorial Sur")
+        cls.admin = _usuario("admin", Profile.ROLE_ADMIN)
+        _usuario("ana", Profile.ROLE_EDITOR, [cls.ed1, cls.ed3])
+        _usuario("beto", Profile.ROLE_EDITOR, [cls.ed2])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def test_panel_por_prefijo_de_editorial(self):
+        LibroFicha.objects.bulk_create([self._ficha(1), self._ficha(2, self.ed2)])
+        qs = build_queryset_for_user(self.admin, {"q": "ÑANDÚ"})
+        self.assertEqual([f.editorial for f in qs], [self.ed2])
+        self.assertFalse(build_queryset_for_user(self.admin, {"q": "libros"}).exists())
+
+    def test_mantenedor_de_editoriales(self):
+        r = self.client.get(reverse("roles:editoriales_mantenedor") + "?q_nombre=EDITORIAL P")
+        self.assertEqual([e.nombre for e in r.context["editoriales"]], ["Editorial Pérez"])
+
+    def test_usuarios_por_editorial_sin_repetidos(self):
+        r = self.client.get(reverse("roles:usuarios_mantenedor") + "?q_editorial=editorial")
+        self.assertEqual([u.username for u in r.context["usuarios"]], ["ana"])
+        r = self.client.get(reverse("roles:usuarios_mantenedor") + "?q_editorial=nandu")
+        self.assertEqual([u.username for u in r.context["usuarios"]], ["beto"])
+
+
+# ===========================
+# Carga por fragmentos
+# ===========================
+
+class CargaPorFragmentosTests(_ConTablas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.editor = _usuario("editor", Profile.ROLE_EDITOR, [cls.ed1])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.editor)
+        r = self.client.post(reverse("roles:carga_crear"), {"modo": "crear"}, content_type="application/json")
+        self.sesion = SesionCarga.objects.get(pk=r.json()["id"])
+
+    def _fragmento(self, numero, filas):
+        url = reverse("roles:carga_fragmento", args=[self.sesion.pk, numero])
+        return self.client.put(url, {"rows": filas}, content_type="application/json").json()
+
+    def _finalizar(self, total=None):
+        url = reverse("roles:carga_finalizar", args=[self.sesion.pk])
+        return self.client.post(url, {"total": total}, content_type="application/json")
+
+    def test_finalizar_encola_la_importacion(self):
+        self._fragmento(1, [_fila(isbn=self._ficha(1).isbn), _fila(isbn=self._ficha(2).isbn)])
+        self._fragmento(2, [_fila(isbn=self._ficha(3).isbn)])
+        r = self._finalizar(2)
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(r.json()["url_estado"], reverse("roles:importacion_estado", args=[r.json()["id"]]))
+        self.assertFalse(LibroFicha.objects.exists())  # nada se importa dentro del request
+        self.assertEqual(SesionCarga.objects.get(pk=self.sesion.pk).estado, SesionCarga.ESTADO_PROCESANDO)
+        self.assertEqual(self._finalizar(2).status_code, 409)
+
+        procesar(tomar_siguiente())
+        trabajo = TrabajoImportacion.objects.get(pk=r.json()["id"])
+        self.assertEqual((trabajo.estado, trabajo.total, trabajo.resultado["created"]), ("LISTO", 3, 3))
+        self.assertEqual(LibroFicha.objects.count(), 3)
+        self.assertEqual(SesionCarga.objects.get(pk=self.sesion.pk).estado, SesionCarga.ESTADO_FINALIZADA)
+        self.assertFalse(FragmentoCarga.objects.exists())
+
+    def test_errores_al_importar_reabren_la_sesion(self):
+        self._fragmento(1, [_fila()])
+        self._fragmento(2, [_fila(isbn="0-306-40615-2")])  # el mismo ISBN en otro fragmento
+        self.assertEqual(self._finalizar().status_code, 202)
+        procesar(tomar_siguiente())
+        sesion = SesionCarga.objects.get(pk=self.sesion.pk)
+        self.assertEqual(sesion.estado, SesionCarga.ESTADO_ABIERTA)
+        self.assertEqual(sesion.resultado["errors"], [{"row": 2, "error": DUPLICADO}])
+
+    def test_errores_con_la_fila_del_archivo(self):
+        self._fragmento(1, [_fila(isbn=self._ficha(1).isbn), _fila(isbn=self._ficha(2).isbn)])
+        # El 3 llega antes que el 2: aún no se sabe en qué fila del archivo empieza
+        r = self._fragmento(3, [_fila(isbn=self._ficha(4).isbn, moneda="ZZZ")])
+        self.assertEqual(r["errors"], [{"row": None, "fragmento": 3, "fila_fragmento": 1,
+                                        "error": "Moneda no encontrada"}])
+        r = self._fragmento(2, [_fila(isbn=self._ficha(3).isbn), _fila(precio="abc")])
+        self.assertEqual(r["errors"], [{"row": 4, "fragmento": 2, "fila_fragmento": 2,
+                                        "error": "precio inválido"}])
+        r = self._fragmento(3, [_fila(isbn=self._ficha(5).isbn, moneda="ZZZ")])  # reenviado, ya con el 2
+        self.assertEqual(r["errors"][0]["row"], 5)
+
+    def test_sesion_incompleta(self):
+        self._fragmento(2, [_fila()])
+        r = self._finalizar(2)
+        self.assertEqual(r.status_code, 409)
+        self.assertIn("Faltan fragmentos", r.json()["error"])
+        self.assertFalse(TrabajoImportacion.objects.exists())
+
+
+# ===========================
+# Simulación (dry-run) y token para confirmar
+# ===========================
+
+class _ConImportaciones(_ConTablas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.editor = _usuario("editor", Profile.ROLE_EDITOR, [cls.ed1])
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(IMPORT_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client.force_login(self.editor)
+
+    def _enviar(self, payload):
+        return self.client.post(reverse("roles:ficha_upload_json"), payload, content_type="application/json")
+
+
+class ImportacionSegundoPlanoTests(_ConImportaciones):
+
+    def _planilla(self, filas) -> SimpleUploadedFile:
+        wb = Workbook()
+        ws = wb.active
+        ws.append(list(_fila()))
+        for fila in filas:
+            ws.append(list(fila.values()))
+        contenido = io.BytesIO()
+        wb.save(contenido)
+        return SimpleUploadedFile("fichas.xlsx", contenido.getvalue())
+
+    def test_json_en_segundo_plano(self):
+        r = self._enviar({"rows": [_fila(isbn=self._ficha(i).isbn) for i in range(5)]})
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual((r.json()["estado"], r.json()["total"], r.json()["porcentaje"]), ("PENDIENTE", 5, 0))
+        self.assertFalse(LibroFicha.objects.exists())
+
+        avances = []
+
+        def en_lotes_de_2(leer, modo, editoriales, progreso):
+            def registrar(avance):
+                progreso(avance)  # el trabajo guarda el avance en la BD
+                avances.append(self.client.get(r.json()["url_estado"]).json()["porcentaje"])
+            return importar(leer, modo, editoriales, lote=2, progreso=registrar)
+
+        trabajo = tomar_siguiente()
+        self.assertIsNone(tomar_siguiente())  # ya lo tomó este worker
+        with mock.patch("roles.importaciones.importar", side_effect=en_lotes_de_2):
+            procesar(trabajo)
+        self.assertEqual(avances, [20, 40, 50, 70, 90, 99])  # 3 lotes al validar y 3 al escribir
+        estado = self.client.get(r.json()["url_estado"]).json()
+        self.assertEqual((estado["estado"], estado["porcentaje"], estado["insertadas"]), ("LISTO", 100, 5))
+        self.assertEqual(LibroFicha.objects.count(), 5)
+        self.assertFalse(list(Path(settings.IMPORT_DIR).iterdir()))  # el NDJSON se borra al terminar
+
+    def test_errores_por_fila(self):
+        r = self._enviar({"rows": [_fila(isbn=self._ficha(i).isbn) for i in range(3)] + [_fila(precio="abc")]})
+        procesar(tomar_siguiente())
+        estado = self.client.get(r.json()["url_estado"]).json()
+        self.assertEqual((estado["estado"], estado["fallidas"]), ("LISTO", 1))
+        self.assertEqual(estado["errors"], [{"row": 4, "error": "precio inválido"}])
+        self.assertFalse(LibroFicha.objects.exists())  # con errores no se escribe nada
+
+    def test_planilla_xlsx(self):
+        planilla = self._planilla([_fila(isbn=self._ficha(i).isbn) for i in range(2)])
+        r = self.client.post(reverse("roles:ficha_upload"), {"archivo": planilla, "modo": "crear"})
+        self.assertEqual(r.status_code, 202)
+        procesar(tomar_siguiente())
+        estado = self.client.get(r.json()["url_estado"]).json()
+        self.assertEqual((estado["estado"], estado["total"], estado["insertadas"]), ("LISTO", 2, 2))
+
+    def test_planilla_invalida(self):
+        archivo = SimpleUploadedFile("fichas.xlsx", b"no es una planilla")
+        r = self.client.post(reverse("roles:ficha_upload"), {"archivo": archivo})
+        procesar(tomar_siguiente())
+        estado = self.client.get(r.json()["url_estado"]).json()
+        self.assertEqual(estado["estado"], "ERROR")
+        self.assertIn("no es una planilla", estado["error"])
+
+    def test_estado_solo_para_su_dueno(self):
+        url = self._enviar({"rows": [_fila()]}).json()["url_estado"]
+        self.client.force_login(_usuario("otro", Profile.ROLE_EDITOR, [self.ed1]))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SimulacionTests(_ConImportaciones):
+
+    def _simular(self):
+        filas = [_fila(isbn=self._ficha(1).isbn), _fila(isbn=self._ficha(2).isbn),
+                 _fila(isbn=self._ficha(2).isbn), _fila(isbn=self._ficha(3).isbn, precio="abc")]
+        r = self._enviar({"rows": filas, "simular": True})
+        self.assertEqual(r.status_code, 202)
+        procesar(tomar_siguiente())
+        return self.client.get(r.json()["url_estado"]).json()
+
+    def test_simular_y_confirmar(self):
+        estado = self._simular()
+        self.assertEqual(estado["estado"], "LISTO")
+        self.assertEqual({k: estado["resultado"][k] for k in ("nuevas", "existentes", "duplicadas", "invalidas")},
+                         {"nuevas": 2, "existentes": 0, "duplicadas": 1, "invalidas": 1})
+        self.assertFalse(LibroFicha.objects.exists())  # la simulación no escribe
+
+        r = self._enviar({"token": estado["token"]})
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(r.json()["total"], 2)
+        procesar(tomar_siguiente())
+        self.assertEqual(sorted(LibroFicha.objects.values_list("isbn", flat=True)),
+                         [self._ficha(1).isbn, self._ficha(2).isbn])
+        self.assertIsNone(self.client.get(estado["url_estado"]).json()["token"])
+
+    def test_se_confirma_una_sola_vez(self):
+        token = self._simular()["token"]
+        self.assertEqual(self._enviar({"token": token}).status_code, 202)
+        r = self._enviar({"token": token})
+        self.assertEqual(r.status_code, 410)
+        self.assertIn("ya se confirmó", r.json()["error"])
+        self.assertEqual(TrabajoImportacion.objects.filter(formato="validado").count(), 1)
+
+    def test_token_alterado_vencido_o_ajeno(self):
+        token = self._simular()["token"]
+        with self.assertRaises(SimulacionNoDisponible):
+            confirmar_simulacion(self.editor, token[:-2] + "xx")
+        with mock.patch("time.time", return_value=time.time() + 3600), self.assertRaises(SimulacionNoDisponible):
+            confirmar_simulacion(self.editor, token)
+        with self.assertRaises(SimulacionNoDisponible):
+            confirmar_simulacion(_usuario("otro", Profile.ROLE_EDITOR, [self.ed1]), token)
+        confirmar_simulacion(self.editor, token)  # sigue disponible para su dueño
+
+
+# ===========================
+# Planilla de exportación
+# ===========================
+
+class EscribirXlsxTests(SimpleTestCase):
+
+    def test_columnas_y_formato(self):
+        destino = io.BytesIO()
+        escribir_xlsx(destino, ["id", "titulo", "precio", "fecha_edicion", "subtitulo"],
+                      iter([(1, "Rayuela", Decimal("1.50"), date(2020, 1, 31), "")]))
+        ws = load_workbook(destino).active
+        self.assertEqual([c.value for c in ws[1]], ["Titulo", "Precio", "Fecha Edicion", "Subtitulo"])
+        self.assertEqual([c.value for c in ws[2]], ["Rayuela", "1.50", "31-01-2020", "-"])
+        self.assertTrue(ws["A1"].font.bold)
+
+    def test_sin_filas(self):
+        destino = io.BytesIO()
+        escribir_xlsx(destino, ["id"], [])
+        self.assertEqual(load_workbook(destino).active["A1"].value, "Resultado")
+
+
+# ===========================
+# Paginación por cursor
+# ===========================
+
+class PaginacionKeysetTests(_ConTablas):
+
+    def setUp(self):
+        super().setUp()
+        # Títulos repetidos (empates por id) y alto_cm nulo en algunas
+        LibroFicha.objects.bulk_create([
+            self._ficha(i, titulo=f"Título {i % 4}", alto_cm=None if i % 3 == 0 else Decimal(i))
+            for i in range(19)
+        ])
+        self.qs = LibroFicha.objects.all()
+
+    def _todas(self, sort_field, por_pagina=5):
+        vistas, after, paginas = [], None, 0
+        while True:
+            pagina = paginar_keyset(self.qs, sort_field, after, por_pagina)
+            vistas.extend(f.pk for f in pagina)
+            paginas += 1
+            self.assertEqual(pagina.has_previous(), paginas > 1)
+            if not pagina.has_next():
+                self.assertIsNone(pagina.next_token)
+                return vistas, paginas
+            after = pagina.next_token
+
+    def test_recorre_todo_sin_repetir(self):
+        for sort_field in ("titulo", "fecha_edicion", "alto_cm"):  # fecha_edicion: todas iguales
+            with self.subTest(sort_field=sort_field):
+                vistas, paginas = self._todas(sort_field)
+                esperadas = list(self.qs.order_by(sort_field, "id").values_list("pk", flat=True))
+                self.assertEqual(vistas, esperadas)
+                self.assertEqual(paginas, 4)
+
+    def test_token_invalido_o_de_otro_orden(self):
+        primera = [f.pk for f in paginar_keyset(self.qs, "titulo", None, 5)]
+        token = crear_token("fecha_edicion", self.qs.first())
+        for after in (token, token[:-2] + "xx", "basura"):
+            with self.subTest(after=after):
+                pagina = paginar_keyset(self.qs, "titulo", after, 5)
+                self.assertEqual([f.pk for f in pagina], primera)
+                self.assertFalse(pagina.has_previous())
+        self.assertIsNone(leer_token(token, "titulo"))
+        self.assertEqual(leer_token(token, "fecha_edicion")[1], self.qs.first().pk)
+
+    def test_recorrer_por_lotes(self):
+        filas = list(recorrer_por_lotes(self.qs, "alto_cm", ["id", "titulo"], lote=4))
+        self.assertEqual(filas, list(self.qs.order_by("alto_cm", "id").values_list("id", "titulo")))
+
+    def test_panel_en_modo_cursor(self):
+        self.client.force_login(_usuario("admin", Profile.ROLE_ADMIN))
+        r = self.client.get(reverse("roles:panel"), {"paginacion": "cursor"})
+        pagina = r.context["page_obj"]
+        self.assertTrue(r.context["keyset"])
+        self.assertIsNone(r.context["paginator"])
+        self.assertEqual(len(pagina), 8)
+        r = self.client.get(reverse("roles:panel"), {"after": pagina.next_token})
+        segunda = r.context["page_obj"]
+        self.assertEqual(len(segunda), 8)
+        self.assertTrue(segunda.has_previous())
+        self.assertFalse({f.pk for f in pagina} & {f.pk for f in segunda})
+
+
+# ===========================
+# Contexto de autorización
+# ===========================
+
+class AuthContextTests(_ConTablas):
+
+    def _contexto(self, usuario):
+        # Un objeto user nuevo: sin el memo del request, solo la caché compartida
+        return get_auth_context(get_user_model().objects.get(pk=usuario.pk))
+
+    def test_una_consulta_y_luego_cache(self):
+        usuario = _usuario("ana", Profile.ROLE_EDITOR, [self.ed1, self.ed2])
+        with self.assertNumQueries(1):
+            ctx = get_auth_context(usuario)
+        self.assertTrue(ctx.is_editor)
+        self.assertEqual(ctx.editorial_ids, {self.ed1.pk, self.ed2.pk})
+        with self.assertNumQueries(1):  # solo la carga del user
+            self.assertEqual(self._contexto(usuario), ctx)
+
+    def test_cambio_de_editoriales_invalida(self):
+        usuario = _usuario("ana", Profile.ROLE_EDITOR, [self.ed1])
+        self.assertEqual(self._contexto(usuario).editorial_ids, {self.ed1.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            UsuarioEditorial.objects.create(user=usuario, editorial=self.ed2)
+        self.assertEqual(self._contexto(usuario).editorial_ids, {self.ed1.pk, self.ed2.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            UsuarioEditorial.objects.filter(user=usuario, editorial=self.ed1).delete()
+        self.assertEqual(self._contexto(usuario).editorial_ids, {self.ed2.pk})
+
+    def test_cambio_de_rol_invalida(self):
+        usuario = _usuario("ana", Profile.ROLE_EDITOR)
+        self.assertTrue(self._contexto(usuario).is_editor)
+        with self.captureOnCommitCallbacks(execute=True):
+            usuario.profile.role = Profile.ROLE_ADMIN
+            usuario.profile.save()
+        ctx = self._contexto(usuario)
+        self.assertTrue(ctx.is_admin)
+        self.assertTrue(ctx.flags["can_download"])
+
+    def test_sin_commit_no_se_invalida(self):
+        usuario = _usuario("ana", Profile.ROLE_EDITOR)
+        self.assertTrue(self._contexto(usuario).is_editor)
+        usuario.profile.role = Profile.ROLE_ADMIN
+        usuario.profile.save()  # la transacción sigue abierta: el borrado espera al commit
+        self.assertTrue(self._contexto(usuario).is_editor)
+
+    def test_anonimo(self):
+        self.assertIsNone(get_auth_context(AnonymousUser()).role)
+        self.assertIsNone(get_auth_context(None).user_id)
+
+
+# ===========================
+# Exportaciones del panel
+# ===========================
+
+class _ConExportaciones(_ConTablas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.consultor = _usuario("consultor")
+        LibroFicha.objects.bulk_create([cls._ficha(i) for i in range(7)])
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(EXPORT_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client.force_login(self.consultor)
+
+    def _exportar(self, formato="csv", headers=None, **params):
+        return self.client.get(reverse("roles:panel"), {"export": formato, **params}, headers=headers)
+
+
+class ExportacionSegundoPlanoTests(_ConExportaciones):
+
+    def test_encolar_procesar_y_descargar(self):
+        r = self._exportar(segundo_plano="1", sort="titulo")
+        self.assertEqual(r.status_code, 202)
+        self.assertIsNone(r.json()["url_descarga"])
+        self.assertEqual(self._exportar(segundo_plano="1", sort="titulo", page="3").json()["id"],
+                         r.json()["id"])  # mismo contenido -> mismo trabajo
+
+        exportaciones.procesar(exportaciones.tomar_siguiente())
+        estado = self.client.get(r.json()["url_estado"]).json()
+        self.assertEqual((estado["estado"], estado["total"]), ("LISTO", 7))
+        descarga = self.client.get(estado["url_descarga"])
+        lineas = b"".join(descarga.streaming_content).decode("utf-8-sig").splitlines()
+        self.assertEqual(len(lineas), 8)
+        self.assertIn("Título 0000", lineas[1])
+
+    def test_token_alterado_vencido_o_ajeno(self):
+        self._exportar(segundo_plano="1")
+        trabajo = exportaciones.tomar_siguiente()
+        exportaciones.procesar(trabajo)
+        url = exportaciones.estado_json(trabajo)["url_descarga"]
+        token = exportaciones.token_descarga(trabajo)
+
+        self.assertEqual(exportaciones.leer_token_descarga(token), trabajo.pk)
+        self.assertIsNone(exportaciones.leer_token_descarga(token[:-2] + "xx"))
+        self.assertEqual(self.client.get(url.replace(token, token[:-2] + "xx")).status_code, 410)
+        with mock.patch("time.time", return_value=time.time() + 7200):
+            self.assertEqual(self.client.get(url).status_code, 410)
+
+        self.client.force_login(_usuario("otro"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_archivo_borrado(self):
+        self._exportar(segundo_plano="1")
+        trabajo = exportaciones.tomar_siguiente()
+        exportaciones.procesar(trabajo)
+        (exportaciones.export_dir() / trabajo.archivo).unlink()
+        self.assertEqual(self.client.get(exportaciones.estado_json(trabajo)["url_descarga"]).status_code, 404)
+        self.assertNotEqual(self._exportar(segundo_plano="1").json()["id"], trabajo.pk)  # se vuelve a generar
+
+
+class ExportacionCsvTests(_ConExportaciones):
+
+    def test_csv_en_streaming(self):
+        def por_lotes_de_3(qs, sort_field, campos):
+            return recorrer_por_lotes(qs, sort_field, campos, lote=3)
+
+        with mock.patch("roles.views.recorrer_por_lotes", side_effect=por_lotes_de_3):
+            r = self._exportar(sort="isbn", cols="titulo,precio")
+            self.assertTrue(r.streaming)
+            with self.assertNumQueries(3):  # 7 filas en lotes de 3, leídas mientras se envía
+                contenido = b"".join(r.streaming_content).decode("utf-8")
+        self.assertEqual(r["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(contenido.splitlines(),
+                         ["\ufeffTitulo;Precio"] + [f"Título {i:04d};1000.00" for i in range(7)])
+
+    def test_lineas_csv_es_perezoso(self):
+        def filas():
+            yield ("Rayuela; 1963",)
+            raise AssertionError("no debió pedir más filas")
+
+        lineas = lineas_csv(["titulo"], filas())
+        next(lineas)  # encabezado
+        self.assertEqual(next(lineas), '"Rayuela; 1963"\r\n')
+
+
+class ExportacionCacheTests(_ConExportaciones):
+
+    def _contenido(self, r):
+        return b"".join(r.streaming_content)
+
+    def test_repetida_sale_del_disco(self):
+        primera = self._exportar(cols="titulo")
+        contenido = self._contenido(primera)
+        with mock.patch("roles.views.recorrer_por_lotes") as recorrer:
+            segunda = self._exportar(cols="titulo", page="2")  # 'page' no cambia el archivo
+            self.assertEqual(self._contenido(segunda), contenido)
+        recorrer.assert_not_called()
+        self.assertEqual(segunda["ETag"], primera["ETag"])
+
+        r = self._exportar(cols="titulo", headers={"If-None-Match": primera["ETag"]})
+        self.assertEqual(r.status_code, 304)
+        self.assertNotEqual(self._exportar(cols="titulo,autor")["ETag"], primera["ETag"])
+
+    def test_un_cambio_en_el_catalogo_invalida(self):
+        etag = self._exportar(cols="titulo")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self._ficha(99, titulo="Rayuela").save()
+        r = self._exportar(cols="titulo", headers={"If-None-Match": etag})
+        self.assertEqual(r.status_code, 200)
+        self.assertIn("Rayuela", self._contenido(r).decode("utf-8"))
+
+    def test_envio_cortado_no_queda_en_cache(self):
+        r = self._exportar(cols="titulo")
+        next(iter(r.streaming_content))
+        r.close()  # el cliente cortó la descarga
+        self.assertFalse(list(exportaciones.cache_dir().iterdir()))
+
+    def test_el_alcance_es_parte_de_la_clave(self):
+        params = QueryDict("cols=titulo&q_titulo=Pérez")
+        firma = exportaciones.firma_exportacion
+        ana = _usuario("ana", Profile.ROLE_EDITOR, [self.ed1])
+        beto = _usuario("beto", Profile.ROLE_EDITOR, [self.ed2])
+        self.assertNotEqual(firma(ana, "csv", params), firma(beto, "csv", params))
+        self.assertNotEqual(firma(ana, "csv", params), firma(ana, "xlsx", params))
+        self.assertEqual(firma(ana, "csv", params), firma(ana, "csv", QueryDict("cols=titulo&q_titulo=perez")))
+        self.assertNotEqual(firma(self.consultor, "csv", params),
+                            firma(_usuario("admin", Profile.ROLE_ADMIN), "csv", params))
+
+
+class ListasPreciosTests(_ConExportaciones):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        LibroFicha.objects.bulk_create([cls._ficha(100 + i, cls.ed2) for i in range(2)])
+        Editorial.objects.create(nombre="Sin libros")
+
+    def test_un_archivo_por_editorial(self):
+        destino = exportaciones.export_dir() / "listas.zip"
+        resumen = generar_listas(destino, "csv", procesos=1)  # el pool no ve la BD de pruebas
+        self.assertEqual([(r["editorial"], r["filas"]) for r in resumen],
+                         [("Editorial Pérez", 7), ("Ñandú Libros", 2)])
+        with zipfile.ZipFile(destino) as zf:
+            self.assertEqual(sorted(zf.namelist()), sorted(r["archivo"] for r in resumen))
+            lineas = zf.read(resumen[1]["archivo"]).decode("utf-8-sig").splitlines()
+        self.assertEqual(lineas[0].split(";")[:5], ["Isbn", "Titulo", "Autor", "Precio", "Precio Sugerido"])
+        self.assertEqual([l.split(";")[4] for l in lineas[1:]], ["1000.00", "1000.00"])
+        self.assertEqual(len(list(exportaciones.export_dir().iterdir())), 1)  # sin temporales
+
+    def test_vista_encola_y_luego_descarga(self):
+        self.client.force_login(_usuario("admin", Profile.ROLE_ADMIN))
+        url = reverse("roles:listas_precios")
+        self.assertEqual(self.client.get(url, {"formato": "pdf"}).status_code, 400)
+        r = self.client.get(url, {"formato": "csv"})
+        self.assertEqual(r.status_code, 202)
+        with override_settings(LISTAS_PRECIOS_PROCESOS=1):
+            exportaciones.procesar(exportaciones.tomar_siguiente())
+        estado = self.client.get(r.json()["url_estado"]).json()
+        self.assertEqual((estado["estado"], estado["procesadas"]), ("LISTO", 9))
+        r = self.client.get(url, {"formato": "csv"})
+        self.assertEqual(r.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b"".join(r.streaming_content))) as zf:
+            self.assertEqual(len(zf.namelist()), 2)
+
+    def test_solo_admin(self):
+        self.assertEqual(self.client.get(reverse("roles:listas_precios")).status_code, 403)
+
+
+# ===========================
+# API de ingesta NDJSON
+# ===========================
+
+class IngestaTests(_ConTablas):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.editor = _usuario("editor", Profile.ROLE_EDITOR, [cls.ed1])
+        cls.credencial, cls.token = TokenIntegracion.emitir(cls.editor, "ERP")
+
+    def _enviar(self, cuerpo: bytes, token=None, modo="crear", **headers):
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        return self.client.post(f"{reverse('roles:ingesta_fichas')}?modo={modo}", cuerpo,
+                                content_type="application/x-ndjson", headers=headers)
+
+    def _respuesta(self, r):
+        return [json.loads(l) for l in b"".join(r.streaming_content).decode("utf-8").splitlines()]
+
+    def _ndjson(self, *filas) -> bytes:
+        return "".join(json.dumps(f, ensure_ascii=False) + "\n" for f in filas).encode("utf-8")
+
+    def test_sin_token_valido(self):
+        cuerpo = self._ndjson(_fila())
+        for token in (None, "", "lib_otro", self.token + "x"):
+            with self.subTest(token=token):
+                r = self._enviar(cuerpo, token)
+                self.assertEqual(r.status_code, 401)
+                self.assertEqual(r["WWW-Authenticate"], "Bearer")
+        TokenIntegracion.objects.filter(pk=self.credencial.pk).update(activo=False)
+        self.assertEqual(self._enviar(cuerpo, self.token).status_code, 401)
+        self.assertFalse(LibroFicha.objects.exists())
+
+    def test_solo_editores(self):
+        _, token = TokenIntegracion.emitir(_usuario("consultor"), "Lector")
+        self.assertEqual(self._enviar(self._ndjson(_fila()), token).status_code, 403)
+
+    def test_ingesta_por_lotes(self):
+        cuerpo = self._ndjson(*(_fila(isbn=self._ficha(i).isbn) for i in range(3)))
+        cuerpo += b"{no es json\n" + self._ndjson(_fila(isbn=self._ficha(9).isbn, editorial="Ñandú Libros"))
+        with mock.patch("roles.views.respuesta_ingesta",
+                        side_effect=lambda flujo, modo, eds: respuesta_ingesta(flujo, modo, eds, lote=2)):
+            r = self._enviar(cuerpo, self.token)
+        self.assertEqual(r["Content-Type"], "application/x-ndjson; charset=utf-8")
+        *lotes, fin = self._respuesta(r)
+        self.assertEqual(len(lotes), 3)
+        self.assertEqual((fin["fin"], fin["ok"], fin["lineas"], fin["created"], fin["failed"]),
+                         (True, False, 5, 3, 2))
+        self.assertEqual(LibroFicha.objects.count(), 3)
+        self.assertIsNotNone(TokenIntegracion.objects.get(pk=self.credencial.pk).ultimo_uso)
+
+    def test_gzip(self):
+        cuerpo = gzip.compress(self._ndjson(_fila()))
+        fin = self._respuesta(self._enviar(cuerpo, self.token, **{"Content-Encoding": "gzip"}))[-1]
+        self.assertEqual((fin["fin"], fin["created"]), (True, 1))
+        fin = self._respuesta(self._enviar(cuerpo[:-12], self.token, **{"Content-Encoding": "gzip"}))[-1]
+        self.assertFalse(fin["fin"])  # gzip cortado: se informa y lo ya escrito queda
@@ -20,7 +20,16 @@ from .views import (
     ToggleEditorialEstadoView,
     ficha_upload,
     upload_fichas_json,
-    descargar_plantilla_excel
+    descargar_plantilla_excel,
+    exportacion_estado,
+    exportacion_descargar,
+    importacion_estado,
+    ingesta_fichas,
+    listas_precios,
+    carga_crear,
+    carga_estado,
+    carga_fragmento,
+    carga_finalizar,
 )
 
 app_name = "roles"
@@ -28,11 +37,26 @@ app_name = "roles"
 urlpatterns = [
     path("", PanelView.as_view(), name="panel"),
 
+    # Exportaciones en segundo plano (estado + descarga con link firmado)
+    path("exportaciones/<int:pk>/estado/", exportacion_estado, name="exportacion_estado"),
+    path("exportaciones/descargar/<str:token>/", exportacion_descargar, name="exportacion_descargar"),
+
     # Wizard de creación (EDITOR)
     path("editor/fichas/nueva/",      LibroCreateWizardView.as_view(), name="ficha_new"),
     path("editor/fichas/cargar/", ficha_upload, name="ficha_upload"),
     path("editor/fichas/upload-json/", upload_fichas_json, name="ficha_upload_json"),
+    path("editor/fichas/importaciones/<int:pk>/estado/", importacion_estado, name="importacion_estado"),
     path('descargar/descargar_plantilla_excel/', descargar_plantilla_excel, name='descargar_plantilla_excel'),
+
+    # Carga masiva por fragmentos (reanudable); antes de <isbn> para que "cargas" no se lea como ISBN
+    path("editor/fichas/cargas/", carga_crear, name="carga_crear"),
+    path("editor/fichas/cargas/<int:pk>/", carga_estado, name="carga_estado"),
+    path("editor/fichas/cargas/<int:pk>/fragmentos/<int:numero>/", carga_fragmento, name="carga_fragmento"),
+    path("editor/fichas/cargas/<int:pk>/finalizar/", carga_finalizar, name="carga_finalizar"),
+
+    # API de ingesta NDJSON para integradores (token en el header Authorization)
+    path("api/fichas/ingesta/", ingesta_fichas, name="ingesta_fichas"),
+
     path("editor/fichas/<str:isbn>/", LibroEditView.as_view(),         name="ficha_edit"),
     path("editor/fichas/<str:isbn>/eliminar/", LibroDeleteView.as_view(), name="ficha_eliminar"),
 
@@ -46,5 +70,6 @@ urlpatterns = [
     path("admin/editoriales/", EditorialesListarView.as_view(), name="editoriales_mantenedor"),
     path("admin/editoriales/<int:editorial_id>/editar/", EditarEditorialView.as_view(), name="editoriales_editar"),
     path("admin/editoriales/<int:editorial_id>/toggle/", ToggleEditorialEstadoView.as_view(), name="editoriales_toggle"),
+    path("admin/editoriales/listas-precios/", listas_precios, name="listas_precios"),
 ]
 
@@ -0,0 +1,330 @@
+"""
+Validación de fichas compartida por los forms del wizard y la carga masiva.
+
+Las reglas (dígito verificador de ISBN/EAN, rango del descuento, largos y
+mínimos de LibroFicha) están una sola vez aquí:
+
+- Los forms (roles/forms.py, roles/forms_edit.py) las aplican campo a campo.
+- La carga masiva valida un lote entero por columnas con validar_columnas():
+  cada columna se convierte de una pasada y cada valor distinto se resuelve
+  una sola vez (las FKs, fechas, precios y enteros se repiten mucho entre
+  filas). Devuelve las columnas limpias y una matriz dispersa de errores
+  {columna: {índice de fila: mensaje}}.
+"""
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+
+from catalogo.models import LibroFicha
+
+_ISBN10_RE = re.compile(r"^\d{9}[\dX]$")   # 9 dígitos + dígito o X
+_DIGITS_RE = re.compile(r"^\d+$")
+
+
+# ===========================
+# ISBN / EAN
+# ===========================
+
+def normalizar_codigo(raw) -> str:
+    """Quita guiones/espacios y pasa a mayúsculas."""
+    return re.sub(r"[\s-]+", "", str(raw or "")).upper()
+
+
+def isbn10_valido(code: str) -> bool:
+    """
+    ISBN-10 con dígito verificador (módulo 11). 'X' equivale a 10.
+    Regla: sum(d_i * w_i) % 11 == 0 con w_i = 10..1
+    """
+    if not _ISBN10_RE.match(code):
+        return False
+    total = 0
+    for i, ch in enumerate(code):           # i = 0..9 -> peso = 10..1
+        weight = 10 - i
+        val = 10 if ch == "X" else int(ch)
+        total += val * weight
+    return total % 11 == 0
+
+
+def ean13_valido(code: str) -> bool:
+    """
+    EAN-13 / ISBN-13 (módulo 10). Último dígito es verificador.
+    """
+    if len(code) != 13 or not _DIGITS_RE.match(code):
+        return False
+    digits = [int(c) for c in code]
+    checksum = sum(d if (i % 2 == 0) else d * 3 for i, d in enumerate(digits[:-1]))
+    check = (10 - (checksum % 10)) % 10
+    return check == digits[-1]
+
+
+def validar_isbn(raw) -> str:
+    """ISBN-10 o ISBN-13 normalizado; ValueError con el mensaje para el usuario."""
+    if isinstance(raw, float) and raw.is_integer():
+        raw = int(raw)  # celda numérica de Excel: 9789561234567.0
+    code = normalizar_codigo(raw)
+    if len(code) == 10:
+        if not isbn10_valido(code):
+            raise ValueError("ISBN-10 inválido")
+    elif len(code) == 13:
+        if not ean13_valido(code):
+            raise ValueError("ISBN-13 inválido")
+    else:
+        raise ValueError("El ISBN debe tener 10 o 13 caracteres")
+    return code  # se guarda normalizado
+
+
+def validar_ean(raw) -> str | None:
+    """EAN-13 normalizado (None si viene vacío); ValueError si el dígito verificador no cuadra."""
+    if raw in (None, ""):
+        return None
+    if isinstance(raw, float) and raw.is_integer():
+        raw = int(raw)
+    code = normalizar_codigo(raw)
+    if not ean13_valido(code):
+        raise ValueError("EAN-13 inválido")
+    return code
+
+
+def validar_descuento(val):
+    if val is None or not (0 <= float(val) <= 99.9):
+        raise ValueError("El descuento debe estar entre 0.0 y 99.9%.")
+    return val
+
+
+# ===========================
+# Conversores por valor
+# ===========================
+
+def excel_date_to_date(n):
+    # Excel serial (1900-based) -> date; handle ints/floats
+    try:
+        base = datetime(1899, 12, 30)
+        return (base + timedelta(days=float(n))).date()
+    except Exception:
+        return None
+
+
+def _fecha(fecha_val):
+    if isinstance(fecha_val, (int, float)):
+        return excel_date_to_date(fecha_val)
+    if isinstance(fecha_val, str):
+        try:
+            return datetime.fromisoformat(fecha_val).date()
+        except Exception:
+            # try common formats
+            try:
+                return datetime.strptime(fecha_val, '%Y-%m-%d').date()
+            except Exception:
+                return None
+    if hasattr(fecha_val, 'year'):
+        return date(fecha_val.year, fecha_val.month, fecha_val.day)
+    return None
+
+
+def _vacio(v) -> bool:
+    return v is None or (isinstance(v, str) and not v.strip())
+
+
+def _texto(campo, obligatorio=False, mensaje=None):
+    maximo = LibroFicha._meta.get_field(campo).max_length
+
+    def convertir(v):
+        if _vacio(v):
+            if obligatorio:
+                raise ValueError(mensaje or f"{campo} obligatorio")
+            return None
+        texto = str(v).strip()
+        if maximo and len(texto) > maximo:
+            raise ValueError(f"{campo} supera los {maximo} caracteres")
+        return texto
+    return convertir
+
+
+def _entero(campo, obligatorio=False, minimo=0):
+    mensaje = f"{campo} inválido"
+
+    def convertir(v):
+        if _vacio(v):
+            if obligatorio:
+                raise ValueError(mensaje)
+            return None
+        try:
+            n = int(v)
+        except (TypeError, ValueError):
+            raise ValueError(mensaje)
+        if n != v and not isinstance(v, str):  # 120.5 no es un entero
+            raise ValueError(mensaje)
+        if n < minimo:
+            raise ValueError(mensaje)
+        return n
+    return convertir
+
+
+def _decimal(campo, obligatorio=False, defecto=None):
+    modelo = LibroFicha._meta.get_field(campo)
+    digitos = DecimalValidator(modelo.max_digits, modelo.decimal_places)
+    mensaje = f"{campo} inválido"
+
+    def convertir(v):
+        if _vacio(v):
+            if defecto is not None:
+                return defecto
+            if obligatorio:
+                raise ValueError(mensaje)
+            return None
+        try:
+            d = Decimal(str(v).strip())
+            digitos(d)  # también rechaza NaN / Infinity
+        except (InvalidOperation, ValidationError):
+            raise ValueError(mensaje)
+        return d
+    return convertir
+
+
+def _fecha_obligatoria(v):
+    fecha = _fecha(v)
+    if not fecha:
+        raise ValueError("fecha_edicion inválida")
+    return fecha
+
+
+def _referencia(tablas, tabla, mensaje, permitidos=None):
+    """FK resuelta con `tablas`; si se da `permitidos`, su pk debe estar ahí."""
+    def convertir(v):
+        obj = getattr(tablas, tabla)(v)
+        if not obj:
+            raise ValueError(mensaje)
+        if permitidos is not None and obj.pk not in permitidos:
+            raise ValueError("Editorial no asignada al usuario")
+        return obj
+    return convertir
+
+
+_decimal_descuento = _decimal("descuento_distribuidor", defecto=Decimal("0"))
+
+
+def _descuento(v):
+    return validar_descuento(_decimal_descuento(v))
+
+
+def _isbn_obligatorio(v):
+    if _vacio(v):
+        raise ValueError("isbn/titulo obligatorios")
+    return validar_isbn(v)
+
+
+def _conversores(tablas, editoriales=None) -> list:
+    """
+    (columna, conversor) en el orden en que se informan los errores: una fila
+    con varios problemas muestra el del primero de esta lista. `editoriales`
+    (ids, None = todas) limita la columna editorial a las del usuario.
+    """
+    return [
+        ("isbn", _isbn_obligatorio),
+        ("titulo", _texto("titulo", obligatorio=True, mensaje="isbn/titulo obligatorios")),
+        ("editorial", _referencia(tablas, "editorial", "Editorial no encontrada", editoriales)),
+        ("tipo_tapa", _referencia(tablas, "tipo_tapa", "Tipo tapa no encontrado")),
+        ("numero_paginas", _entero("numero_paginas", obligatorio=True, minimo=1)),
+        ("idioma_original", _referencia(tablas, "idioma", "Idioma original no encontrado")),
+        ("numero_edicion", _entero("numero_edicion", obligatorio=True, minimo=1)),
+        ("fecha_edicion", _fecha_obligatoria),
+        ("pais_edicion", _referencia(tablas, "pais", "Pais edición no encontrado")),
+        ("precio", _decimal("precio", obligatorio=True)),
+        ("moneda", _referencia(tablas, "moneda", "Moneda no encontrada")),
+        ("descuento_distribuidor", _descuento),
+        ("ean", validar_ean),
+        ("autor", _texto("autor", obligatorio=True)),
+        ("resumen_libro", _texto("resumen_libro", obligatorio=True)),
+        ("subtitulo", _texto("subtitulo")),
+        ("autor_prologo", _texto("autor_prologo")),
+        ("traductor", _texto("traductor")),
+        ("ilustrador", _texto("ilustrador")),
+        ("alto_cm", _decimal("alto_cm")),
+        ("ancho_cm", _decimal("ancho_cm")),
+        ("grosor_cm", _decimal("grosor_cm")),
+        ("peso_gr", _entero("peso_gr")),
+        ("numero_impresion", _entero("numero_impresion")),
+        ("tematica", _texto("tematica")),
+        ("codigo_imagen", _texto("codigo_imagen")),
+        ("rango_etario", _texto("rango_etario")),
+    ]
+
+
+# Columnas que entiende la carga masiva (las tablas solo se usan al convertir)
+COLUMNAS = [col for col, _ in _conversores(None)]
+
+
+# ===========================
+# Validación por columnas (carga masiva)
+# ===========================
+
+def _convertir_columna(valores, convertir):
+    """
+    (valores limpios, {índice: mensaje}); cada valor distinto se convierte una
+    vez. La clave lleva el tipo: 1, 1.0 y True son iguales para un dict pero
+    no para los conversores (p. ej. str(True) != str(1)).
+    """
+    memo = {}
+    limpios, errores = [], {}
+    for i, v in enumerate(valores):
+        clave = (type(v), v)
+        try:
+            ok, res = memo[clave]
+        except KeyError:
+            try:
+                ok, res = True, convertir(v)
+            except ValueError as e:
+                ok, res = False, str(e)
+            memo[clave] = ok, res
+        except TypeError:  # valor no hasheable (lista/dict en el JSON)
+            ok, res = False, "Valor inválido"
+        if ok:
+            limpios.append(res)
+        else:
+            limpios.append(None)
+            errores[i] = res
+    return limpios, errores
+
+
+def filas_a_columnas(filas) -> dict[str, list]:
+    """Traspone las filas (dicts con claves snake_case) a {columna: valores}."""
+    return {col: [row.get(col) for row in filas] for col in COLUMNAS}
+
+
+def validar_columnas(columnas: dict[str, list], tablas,
+                     editoriales=None) -> tuple[dict[str, list], dict[str, dict[int, str]]]:
+    """
+    Valida un lote dado como {columna: valores}. `tablas` resuelve las FKs
+    (roles/carga_masiva.TablasReferencia) y `editoriales` (ids, None = todas)
+    son las que puede cargar el usuario. Devuelve las columnas limpias (None
+    donde hubo error) y la matriz dispersa de errores {columna: {fila: mensaje}}.
+    Los ISBN repetidos o ya existentes los revisa quien llama.
+    """
+    n = len(next(iter(columnas.values()), []))
+    limpias, matriz = {}, {}
+    for col, convertir in _conversores(tablas, editoriales):
+        limpios, errores = _convertir_columna(columnas.get(col) or [None] * n, convertir)
+        limpias[col] = limpios
+        if errores:
+            matriz[col] = errores
+    return limpias, matriz
+
+
+def primer_error(matriz: dict[str, dict[int, str]]) -> dict[int, str]:
+    """{fila: mensaje} con el primer error de cada fila según el orden de las columnas."""
+    por_fila = {}
+    for col in COLUMNAS:
+        for i, mensaje in matriz.get(col, {}).items():
+            por_fila.setdefault(i, mensaje)
+    return por_fila
+
+
+def validar_lote(filas, tablas, editoriales=None) -> tuple[list[dict], dict[int, str]]:
+    """validar_columnas() sobre una lista de filas: (datos limpios por fila, primer error por fila)."""
+    limpias, matriz = validar_columnas(filas_a_columnas(filas), tablas, editoriales)
+    datos = [dict(zip(limpias, valores)) for valores in zip(*limpias.values())]
+    return datos, primer_error(matriz)
+
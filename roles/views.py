@@ -1,16 +1,19 @@
 from __future__ import annotations
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import HttpResponse, HttpRequest, JsonResponse, Http404
+from django.http import HttpResponse, HttpRequest, JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.contrib import messages
 
-from .models import Profile, UsuarioEditorial, Editorial
+from .models import Profile, UsuarioEditorial, Editorial, TrabajoExportacion, SesionCarga, TrabajoImportacion
 from catalogo.models import LibroFicha, TipoTapa, Idioma, Pais, Moneda
+from catalogo.normalizacion import plegar_texto
+from catalogo.precios import RECARGOS, recalcular_precios
 
-from templates.reports.search_result import exportar_excel
-from django.db.models import ForeignKey
+from templates.reports.search_result import escribir_xlsx, lineas_csv, respuesta_csv
+from django.utils.cache import get_conditional_response
 from datetime import datetime, date, datetime as dt
 from django.urls import reverse
 from .forms import LibroIdentForm, LibroTecnicaForm, LibroComercialForm, EditarEditorialForm
@@ -20,6 +23,27 @@ from django import forms
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from urllib.parse import urlencode
 from .forms import EditarUsuarioForm
+from .paginacion import paginar_keyset, recorrer_por_lotes, ConteoCacheadoPaginator
+from .consultas import (
+    ALLOWED_SORTS, EXPORT_COLUMNAS, ORDEN_POR_DEFECTO, PANEL_COLUMNAS, build_queryset_for_user, columnas_export,
+    firma_filtros, normalizar_filtros,
+)
+from .autorizacion import get_auth_context, invalidar_auth_context
+from .carga_masiva import (
+    MAX_FILAS_FRAGMENTO, MODO_CREAR, MODOS, CargaIncompleta, errores_fragmento, estado_sesion,
+    guardar_fragmento, purgar_sesiones,
+)
+from .ingesta import autenticar, flujo_entrada, respuesta_ingesta
+from .importaciones import (
+    SimulacionNoDisponible, confirmar_simulacion, encolar_filas, encolar_sesion, encolar_xlsx,
+    estado_json as estado_importacion,
+)
+from .listas_precios import FORMATOS as LISTAS_FORMATOS, firma_listas
+from .exportaciones import (
+    archivo_disponible, archivo_parcial, buscar_en_cache, copiar_en_cache, encolar_exportacion, encolar_listas,
+    estado_json, firma_exportacion, guardar_en_cache, leer_token_descarga, respuesta_archivo, respuesta_listas,
+    respuesta_trabajo,
+)
 
 #PARA EDITAR
 from .forms_edit import LibroEditForm
@@ -46,7 +70,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 # ----------------------------
 def _role(user):
     """Devuelve el rol del usuario o None si no tiene profile."""
-    return getattr(getattr(user, "profile", None), "role", None)
+    return get_auth_context(user).role
 
 
 def role_required(expected_role):
@@ -63,109 +87,18 @@ def role_required(expected_role):
 
 def _panel_flags(user):
     """
-    Banderas de UI / capacidades por rol para el template unificado.
+    Banderas de UI / capacidades por rol para el template unificado
+    (se leen del contexto de autorización del request).
     """
-    role = _role(user)
-    is_admin = role == Profile.ROLE_ADMIN
-    is_editor = role == Profile.ROLE_EDITOR
-    is_consultor = role == Profile.ROLE_CONSULTOR
-
-    if is_admin:
-        role_label = "ADMIN"
-        role_badge_class = "bg-danger"
-    elif is_editor:
-        role_label = "EDITOR"
-        role_badge_class = "bg-secondary"
-    else:
-        role_label = "CONSULTOR"
-        role_badge_class = "bg-secondary"
-
-    return {
-        "is_admin": is_admin,
-        "is_editor": is_editor,
-        "is_consultor": is_consultor,
-        "role_label": role_label,
-        "role_badge_class": role_badge_class,
-
-        # Capacidades por rol (alineadas a tus 3 plantillas originales)
-        "can_download": is_admin or is_consultor,   # Admin/Consultor tenían "Descargar"
-        "can_create": is_editor,                    # Editor tenía "Crear"
-        "can_edit": is_editor,                      # Editor tenía "Editar"
-        "show_detail": is_admin or is_consultor,    # Admin/Consultor mostraban "Detalle"
-        "detail_disabled": "disabled",
-
-        # Nombres de URL (ajusta si tus names cambian)
-        "create_url_name": "roles:ficha_new" if is_editor else None,
-        "edit_url_name": "roles:ficha_edit" if is_editor else None,
-    }
+    return dict(get_auth_context(user).flags)
 
 
-# ----------------------------
-# Utils de filtrado/ordenación
-# ----------------------------
-ALLOWED_SORTS = {
-    "isbn": "isbn",
-    "titulo": "titulo",
-    "autor": "autor",
-    "editorial": "editorial__nombre",
-    "fecha": "fecha_edicion",
-}
-
-def _parse_date(s: str | None):
-    if not s:
-        return None
-    # <input type="date"> entrega 'YYYY-MM-DD'
-    try:
-        return datetime.strptime(s, "%Y-%m-%d").date()
-    except ValueError:
-        return None
-
-
-def build_queryset_for_user(user, params):
-    """
-    Construye un queryset de LibroFicha respetando:
-    - Para ADMIN/CONSULTOR: búsqueda SOLO por EDITORIAL (q)
-    - Para EDITOR: búsqueda por campo TITULO (q_titulo) e ISBN (q_isbn)
-    - Rango de fechas (date_from, date_to)
-    - Límite por rol (editor ve solo sus editoriales)
-    - Ordenamiento (?sort=)
-    """
-    qs = LibroFicha.objects.select_related("editorial")
-
-    role = getattr(getattr(user, "profile", None), "role", None)
-
-    # --- filtros por texto según rol ---
-    if role == Profile.ROLE_EDITOR:
-        q_titulo = (params.get("q_titulo") or "").strip()
-        q_isbn   = (params.get("q_isbn") or "").strip()
-        if q_titulo:
-            qs = qs.filter(titulo__icontains=q_titulo) # busca títulos que contengan el texto (sin distinguir mayúsc/minúsc)
-        if q_isbn:
-            qs = qs.filter(isbn__icontains=q_isbn)   # busca ISBN que contengan la cadena de caracteres
-    else:
-        q = (params.get("q") or "").strip()
-        if q:
-            qs = qs.filter(editorial__nombre__icontains=q)
-
-    # --- fechas ---
-    date_from = _parse_date(params.get("date_from"))  # obtiene y convierte la fecha inicial desde los parámetros
-    date_to   = _parse_date(params.get("date_to")) # obtiene y convierte la fecha final desde los parámetros
-    if date_from:
-        qs = qs.filter(fecha_edicion__gte=date_from)  # filtra registros con fecha_edicion mayor o igual a date_from
-    if date_to:
-        qs = qs.filter(fecha_edicion__lte=date_to) # filtra registros con fecha_edicion menor o igual a date_to
-
-    # --- restricción por rol (EDITOR: solo sus editoriales) ---
-    if role == Profile.ROLE_EDITOR:
-        ed_ids = UsuarioEditorial.objects.filter(user=user).values_list("editorial_id", flat=True)
-        qs = qs.filter(editorial_id__in=list(ed_ids))
-
-    # --- orden ---
-    sort_key = params.get("sort") or ""
-    if sort_key in ALLOWED_SORTS:
-        qs = qs.order_by(ALLOWED_SORTS[sort_key])
-
-    return qs
+def _ficha_por_isbn(isbn):
+    """Resuelve la ficha por isbn_normalizado (una búsqueda por igualdad en el índice)."""
+    obj = LibroFicha.objects.por_isbn(isbn).order_by("id").first()
+    if obj is None:
+        raise Http404("Ficha no encontrada")
+    return obj
 
 
 # -----------------------------------------------
@@ -176,33 +109,53 @@ class BasePanelView(LoginRequiredMixin, View):
     template_name = "roles/panel.html"
     role_required = None
     paginate_by = 8  # registros por página
+    keyset_default_sort = ORDEN_POR_DEFECTO
+    columnas = PANEL_COLUMNAS
+
+    def _usar_keyset(self, request: HttpRequest) -> bool:
+        """Modo cursor: sin COUNT(*) ni OFFSET, para catálogos grandes."""
+        return request.GET.get("paginacion") == "cursor" or bool(request.GET.get("after"))
 
     def get(self, request: HttpRequest):
-        # Exportación CSV
-        if request.GET.get("export") == "csv":
-            role = getattr(getattr(request.user, "profile", None), "role", None)
+        # Exportación: CSV en streaming o planilla Excel
+        formato = request.GET.get("export")
+        if formato in ("csv", "xlsx"):
+            role = _role(request.user)
             if self.role_required and role != self.role_required:
                 return redirect("home-root")
             flags = _panel_flags(request.user)
             if not flags.get("can_download"):
                 return HttpResponse("No autorizado", status=403)
-            return self.export_csv(request)
-
-        qs = build_queryset_for_user(request.user, request.GET)
-
-        # Paginación
-        page = request.GET.get("page", 1)
-        paginator = Paginator(qs, self.paginate_by)
-        try:
-            rows = paginator.page(page)
-        except PageNotAnInteger:
-            rows = paginator.page(1)
-        except EmptyPage:
-            rows = paginator.page(paginator.num_pages)
+            if request.GET.get("segundo_plano") == "1":
+                # Se encola y el panel consulta el avance (ver roles/exportaciones.py)
+                trabajo = encolar_exportacion(request.user, formato, request.GET)
+                return JsonResponse(estado_json(trabajo), status=202)
+            return self.export(request, formato)
+
+        filtros = normalizar_filtros(request.user, request.GET)
+        qs = build_queryset_for_user(request.user, request.GET, filtros=filtros).only(*self.columnas)
+
+        # Paginación: por cursor (?paginacion=cursor o ?after=) o por número de página
+        keyset = self._usar_keyset(request)
+        if keyset:
+            sort_field = ALLOWED_SORTS.get(request.GET.get("sort") or "", self.keyset_default_sort)
+            rows = paginar_keyset(qs, sort_field, request.GET.get("after"), self.paginate_by)
+            paginator = None
+        else:
+            page = request.GET.get("page", 1)
+            # El COUNT(*) se cachea por firma de filtros + versión del catálogo
+            paginator = ConteoCacheadoPaginator(qs, self.paginate_by, firma=firma_filtros(filtros))
+            try:
+                rows = paginator.page(page)
+            except PageNotAnInteger:
+                rows = paginator.page(1)
+            except EmptyPage:
+                rows = paginator.page(paginator.num_pages)
 
-        # >>> NUEVO: querystring base sin 'page'
+        # >>> NUEVO: querystring base sin 'page' ni cursor
         params = request.GET.copy()
         params.pop('page', None)
+        params.pop('after', None)
         base_qs = params.urlencode()
         # <<<
 
@@ -210,18 +163,22 @@ class BasePanelView(LoginRequiredMixin, View):
             "rows": rows,
             "paginator": paginator,
             "page_obj": rows,
+            "keyset": keyset,
             "is_paginated": rows.has_other_pages(),
             "q": request.GET.get("q", ""),
             "q_titulo": request.GET.get("q_titulo", ""),
             "q_isbn": request.GET.get("q_isbn", ""),
             "date_from": request.GET.get("date_from", ""),
             "date_to": request.GET.get("date_to", ""),
+            "precio_min": request.GET.get("precio_min", ""),
+            "precio_max": request.GET.get("precio_max", ""),
             "sort": request.GET.get("sort", ""),
             "ALLOWED_SORTS": ALLOWED_SORTS,
             "base_qs": base_qs,   # >>> añade esto
+            "export_columnas": [(k, label) for k, (_, label) in EXPORT_COLUMNAS.items()],
         }
 
-        role = getattr(getattr(request.user, "profile", None), "role", None)
+        role = _role(request.user)
         if self.role_required and role != self.role_required:
             return redirect("home-root")
 
@@ -229,28 +186,85 @@ class BasePanelView(LoginRequiredMixin, View):
         return render(request, self.template_name, ctx)
 
 
-    def export_csv(self, request: HttpRequest) -> HttpResponse:
+    def _export_params(self, request: HttpRequest):
         params = request.GET.copy()
         params.pop('page', None)
         params.pop('limit', None)
+        params.pop('after', None)
+        return params
+
+    def export(self, request: HttpRequest, formato: str) -> HttpResponse:
+        """
+        Descarga directa. Los archivos quedan en la caché de exportaciones
+        con la firma de la exportación como clave y ETag: una descarga repetida
+        se sirve del disco o con 304 si el navegador ya la tiene.
+        """
+        params = self._export_params(request)
+        clave = firma_exportacion(request.user, formato, params)
+        etag = f'"{clave}"'
+
+        no_modificado = get_conditional_response(request, etag=etag)
+        if no_modificado is not None:
+            return no_modificado
+
+        en_cache = buscar_en_cache(clave, formato)
+        if en_cache is not None:
+            response = respuesta_archivo(en_cache, formato)
+        elif formato == "csv":
+            response = self.export_csv(request, params, clave)
+        else:
+            response = self.export_xlsx(request, params, clave)
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
+    def _filas_export(self, request: HttpRequest, params):
+        cols = columnas_export(params)
+        rutas = [EXPORT_COLUMNAS[c][0] for c in cols]
         qs = build_queryset_for_user(request.user, params)
-        rows = []
-        for obj in qs:
-            rec = {}
-            for field in obj._meta.fields:
-                name = field.name
-                val = getattr(obj, name)
-                if isinstance(field, ForeignKey):
-                    if val is None:
-                        rec[name] = None
-                    else:
-                        rec[name] = getattr(val, 'nombre', None) or getattr(val, 'code', None) or str(val)
-                else:
-                    rec[name] = val
-            rows.append(rec)
-
-        return exportar_excel(rows)
+        sort_field = ALLOWED_SORTS.get(params.get("sort") or "", self.keyset_default_sort)
+        return cols, recorrer_por_lotes(qs, sort_field, rutas)
+
+    def export_csv(self, request: HttpRequest, params, clave: str) -> StreamingHttpResponse:
+        """
+        CSV en streaming: las filas se leen por lotes keyset sobre el orden
+        pedido (?sort=) y se escriben a medida que llegan; memoria constante.
+        Lo enviado se copia a la caché al mismo tiempo.
+        """
+        cols, filas = self._filas_export(request, params)
+        return respuesta_csv(copiar_en_cache(lineas_csv(cols, filas), clave))
+
+    def export_xlsx(self, request: HttpRequest, params, clave: str) -> FileResponse:
+        """Planilla write-only alimentada por los mismos lotes que el CSV."""
+        cols, filas = self._filas_export(request, params)
+        parcial = archivo_parcial(clave, "xlsx")
+        try:
+            escribir_xlsx(parcial, cols, filas)
+        except BaseException:
+            parcial.unlink(missing_ok=True)
+            raise
+        return respuesta_archivo(guardar_en_cache(parcial, clave, "xlsx"), "xlsx")
+
+
+@login_required
+def exportacion_estado(request, pk):
+    """Avance de una exportación en segundo plano (lo consulta el panel)."""
+    trabajo = get_object_or_404(TrabajoExportacion, pk=pk, usuario=request.user)
+    return JsonResponse(estado_json(trabajo))
+
+
+@login_required
+def exportacion_descargar(request, token):
+    """Descarga del archivo generado; el token vence a los EXPORT_DESCARGA_TTL segundos."""
+    pk = leer_token_descarga(token)
+    if pk is None:
+        return HttpResponse("El link de descarga venció o no es válido.", status=410)
+    trabajo = get_object_or_404(TrabajoExportacion, pk=pk, usuario=request.user,
+                                estado=TrabajoExportacion.ESTADO_LISTO)
+    if not archivo_disponible(trabajo):
+        raise Http404("El archivo ya no está disponible")
+    return respuesta_trabajo(trabajo)
 
 
 class PanelView(BasePanelView):
@@ -283,7 +297,7 @@ class LibroCreateWizardView(LoginRequiredMixin, View):
     # ---- Helpers de sesión / rol ----
     def _ensure_editor(self, request):
         # Me aseguro que solo un usuario con rol EDITOR pueda entrar a este flujo
-        role = getattr(getattr(request.user, "profile", None), "role", None)
+        role = _role(request.user)
         if role != Profile.ROLE_EDITOR:
             return redirect("roles:panel")  # también podría devolver un 403
 
@@ -475,18 +489,18 @@ class LibroEditView(LoginRequiredMixin, View):
 
     def dispatch(self, request, *args, **kwargs):
         # asegura que solo EDITOR puede entrar (igual que en el wizard)
-        role = getattr(getattr(request.user, "profile", None), "role", None)
+        role = _role(request.user)
         if role != Profile.ROLE_EDITOR:
             return redirect("roles:panel")
         return super().dispatch(request, *args, **kwargs)
 
     def get(self, request, isbn):
-        obj = get_object_or_404(LibroFicha, isbn=isbn)
+        obj = _ficha_por_isbn(isbn)
         form = LibroEditForm(instance=obj, request_user=request.user, allow_change_isbn=False)
         return render(request, self.template_name, {"form": form, "ficha": obj})
 
     def post(self, request, isbn):
-        obj = get_object_or_404(LibroFicha, isbn=isbn)
+        obj = _ficha_por_isbn(isbn)
         form = LibroEditForm(request.POST, instance=obj, request_user=request.user, allow_change_isbn=False)
         if form.is_valid():
             form.save()
@@ -504,11 +518,11 @@ class LibroEditView(LoginRequiredMixin, View):
 class LibroDeleteView(LoginRequiredMixin, View):
     def post(self, request, isbn):
         # Validar permisos: solo EDITOR puede borrar
-        role = getattr(getattr(request.user, "profile", None), "role", None)
+        role = _role(request.user)
         if role != Profile.ROLE_EDITOR:
             return redirect("roles:panel")
 
-        obj = get_object_or_404(LibroFicha, isbn=isbn)
+        obj = _ficha_por_isbn(isbn)
         titulo = obj.titulo
         obj.delete()
 
@@ -518,13 +532,56 @@ class LibroDeleteView(LoginRequiredMixin, View):
 # -----------------------------------------------------------    
 
 # -----------------------------------------------------------
-# SOLO PROVISIONAL para BOTON CARGA MASIVA
+# CARGA MASIVA DESDE LA PLANTILLA EXCEL
 # -----------------------------------------------------------
 
+def _confirmar(request, token):
+    """Encola la escritura de una simulación ya validada (token de estado_importacion)."""
+    try:
+        trabajo = confirmar_simulacion(request.user, token)
+    except SimulacionNoDisponible as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=410)
+    return JsonResponse(estado_importacion(trabajo), status=202)
+
+
+def _es_verdadero(valor) -> bool:
+    return valor is True or str(valor).lower() in ('1', 'true', 'on', 'si', 'sí')
+
+
 @login_required
 def ficha_upload(request):
-    # Por ahora no procesamos nada: si llegó archivo, perfecto; si no, igual volvemos.
-    return redirect(f"{reverse('roles:ficha_new')}?step={request.POST.get('step','ident')}")
+    """
+    POST multipart con 'archivo' = plantilla .xlsx (descargar_plantilla_excel).
+    Solo guarda el archivo y encola un TrabajoImportacion (roles/importaciones):
+    responde 202 con la URL de estado, que el modal consulta mientras
+    `manage.py procesar_importaciones` valida e inserta.
+    Con 'simular' solo valida y deja un token; POST con 'token' confirma esa simulación.
+    """
+    if request.method != 'POST':
+        return redirect(f"{reverse('roles:ficha_new')}?step={request.GET.get('step','ident')}")
+
+    if _role(request.user) != Profile.ROLE_EDITOR:
+        return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
+
+    if request.POST.get('token'):
+        return _confirmar(request, request.POST['token'])
+
+    archivo = request.FILES.get('archivo')
+    if not archivo or not archivo.name.lower().endswith('.xlsx'):
+        return JsonResponse({'ok': False, 'error': 'Suba la plantilla en formato .xlsx'}, status=400)
+    modo = request.POST.get('modo') or MODO_CREAR
+    if modo not in MODOS:
+        return JsonResponse({'ok': False, 'error': 'Modo de carga inválido'}, status=400)
+
+    trabajo = encolar_xlsx(request.user, modo, archivo, simulacion=_es_verdadero(request.POST.get('simular')))
+    return JsonResponse(estado_importacion(trabajo), status=202)
+
+
+@login_required
+def importacion_estado(request, pk):
+    """Avance de una carga masiva en segundo plano (lo consulta el modal)."""
+    trabajo = get_object_or_404(TrabajoImportacion, pk=pk, usuario=request.user)
+    return JsonResponse(estado_importacion(trabajo))
 
 
 # -----------------------------------------------------------
@@ -539,8 +596,7 @@ class UsuariosListarView(LoginRequiredMixin, UserPassesTestMixin, ListView):
     paginate_by = 10
 
     def test_func(self):
-        p = getattr(self.request.user, "profile", None)
-        return getattr(p, "role", None) == Profile.ROLE_ADMIN
+        return _role(self.request.user) == Profile.ROLE_ADMIN
 
     def get_queryset(self):
         q_usuario   = (self.request.GET.get("q_usuario") or "").strip()
@@ -564,7 +620,9 @@ class UsuariosListarView(LoginRequiredMixin, UserPassesTestMixin, ListView):
             )
 
         if q_editorial:
-            qs = qs.filter(usuarioeditorial__editorial__nombre__icontains=q_editorial).distinct()
+            # Subconsulta por prefijo de la clave plegada: sin JOIN ni DISTINCT sobre usuarios
+            editoriales = Editorial.objects.filter(nombre_busqueda__startswith=plegar_texto(q_editorial)).values("id")
+            qs = qs.filter(pk__in=UsuarioEditorial.objects.filter(editorial_id__in=editoriales).values("user_id"))
 
         # último admin (si hay uno solo)
         admins = list(Profile.objects.filter(role=Profile.ROLE_ADMIN).values_list("user_id", flat=True))
@@ -585,8 +643,7 @@ class UsuariosListarView(LoginRequiredMixin, UserPassesTestMixin, ListView):
 class EditarUsuarioView(LoginRequiredMixin, UserPassesTestMixin, View):
    
     def test_func(self):
-        p = getattr(self.request.user, "profile", None)
-        return getattr(p, "role", None) == Profile.ROLE_ADMIN
+        return _role(self.request.user) == Profile.ROLE_ADMIN
 
     def post(self, request, user_id):
         usuario = get_object_or_404(User.objects.select_related("profile"), pk=user_id)
@@ -643,6 +700,8 @@ class EditarUsuarioView(LoginRequiredMixin, UserPassesTestMixin, View):
                     [UsuarioEditorial(user=usuario, editorial_id=eid) for eid in agregar],
                     ignore_conflicts=True
                 )
+                # bulk_create no dispara señales: invalido el contexto a mano
+                invalidar_auth_context(usuario.pk)
         else:
             # no-Editor no tiene asignaciones
             UsuarioEditorial.objects.filter(user=usuario).delete()
@@ -657,8 +716,7 @@ class EditarUsuarioView(LoginRequiredMixin, UserPassesTestMixin, View):
 class ToggleUsuarioActivoView(LoginRequiredMixin, UserPassesTestMixin, View):
 
     def test_func(self):
-        p = getattr(self.request.user, "profile", None)
-        return getattr(p, "role", None) == Profile.ROLE_ADMIN
+        return _role(self.request.user) == Profile.ROLE_ADMIN
 
     def post(self, request, user_id):
         usuario = get_object_or_404(User.objects.select_related("profile"), pk=user_id)
@@ -740,8 +798,7 @@ class InvitarUsuarioView(LoginRequiredMixin, UserPassesTestMixin, View):
 
     def test_func(self):
         # Verifico que el usuario que hace la petición sea ADMIN
-        p = getattr(self.request.user, "profile", None)
-        return getattr(p, "role", None) == Profile.ROLE_ADMIN
+        return _role(self.request.user) == Profile.ROLE_ADMIN
 
     def post(self, request):
         try:
@@ -811,6 +868,7 @@ class InvitarUsuarioView(LoginRequiredMixin, UserPassesTestMixin, View):
                         [UsuarioEditorial(user=user, editorial=ed) for ed in editoriales],
                         ignore_conflicts=True
                     )
+                    invalidar_auth_context(user.pk)
 
             # Envío el correo de invitación con la contraseña temporal
             _enviar_correo_invitacion(email=correo, nombre=nombre, password_temp=password_temp)
@@ -860,239 +918,200 @@ def descargar_plantilla_excel(request):
 
 @login_required
 def upload_fichas_json(request):
-    print(">>> upload_fichas_json called")
     """
-    Endpoint que acepta POST JSON { rows: [ {..fila..}, ... ] }
-    Valida mínimamente y crea LibroFicha por fila. Devuelve JSON con resumen.
+    Endpoint que acepta POST JSON { rows: [ {..fila..}, ... ], modo: "crear" | "actualizar" }
+    Encola las filas como TrabajoImportacion y responde 202 con la URL de estado;
+    el worker crea LibroFicha por fila (con modo "actualizar" también actualiza las
+    existentes por ISBN, saltando las que no cambiaron) y deja el resumen en el trabajo.
+    - { rows, modo, simular: true }: solo valida; el estado trae el resumen
+      (nuevas / existentes / duplicadas / inválidas) y un token de corta duración.
+    - { token }: inserta las filas ya validadas de esa simulación, sin revalidar.
     Reglas simplificadas:
     - Debe ser usuario con role EDITOR
-    - Resuelve FKs buscando por 'nombre' (editorial, tipo_tapa) o por code (idioma, pais, moneda)
+    - Resuelve FKs en memoria (roles/carga_masiva.TablasReferencia) por 'nombre' (editorial, tipo_tapa) o por code (idioma, pais, moneda)
     - Retorna detalles de filas fallidas
     """
     if request.method != 'POST':
         return JsonResponse({'ok': False, 'error': 'POST required'}, status=405)
 
     # rol
-    role = getattr(getattr(request.user, 'profile', None), 'role', None)
+    role = _role(request.user)
     if role != Profile.ROLE_EDITOR:
         return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
 
     import json
-    from decimal import Decimal
-    from datetime import datetime, timedelta, date
 
     try:
         payload = json.loads(request.body.decode('utf-8'))
     except Exception:
         return JsonResponse({'ok': False, 'error': 'JSON inválido'}, status=400)
 
+    if payload.get('token'):
+        return _confirmar(request, str(payload['token']))
+
     rows = payload.get('rows') or []
-    created = 0
-    failed = []
-    logger = logging.getLogger(__name__)
+    modo = payload.get('modo') or MODO_CREAR
+    if modo not in MODOS:
+        return JsonResponse({'ok': False, 'error': 'Modo de carga inválido'}, status=400)
 
-    # Helpers
-    def excel_date_to_date(n):
-        # Excel serial (1900-based) -> date; handle ints/floats
-        try:
-            base = datetime(1899, 12, 30)
-            return (base + timedelta(days=float(n))).date()
-        except Exception:
-            return None
-
-    def resolve_editorial(val):
-        if val is None:
-            return None
-        v = str(val).strip()
-        if v.isdigit():
-            try:
-                return Editorial.objects.get(pk=int(v))
-            except Editorial.DoesNotExist:
-                return None
-        return Editorial.objects.filter(nombre__iexact=v).first()
-
-    def resolve_tipo_tapa(val):
-        if val is None: return None
-        v = str(val).strip()
-        return TipoTapa.objects.filter(nombre__iexact=v).first()
-
-    def resolve_idioma(val):
-        if val is None: return None
-        v = str(val).strip()
-        return Idioma.objects.filter(code__iexact=v).first() or Idioma.objects.filter(nombre__iexact=v).first()
-
-    def resolve_pais(val):
-        if val is None: return None
-        v = str(val).strip()
-        return Pais.objects.filter(code__iexact=v).first() or Pais.objects.filter(nombre__iexact=v).first()
-
-    def resolve_moneda(val):
-        if val is None: return None
-        v = str(val).strip()
-        return Moneda.objects.filter(code__iexact=v).first() or Moneda.objects.filter(nombre__iexact=v).first()
-
-    # --- 1) VALIDAR TODO SIN INSERTAR ---
-    validated = []
-    input_isbns = []
-    for idx, row in enumerate(rows, start=1):
-        isbn = str(row.get('isbn') or '').strip()
-        input_isbns.append(isbn)
-
-    # chequear duplicados dentro del archivo
-    from collections import Counter
-    counts = Counter(input_isbns)
-    duplicates_in_file = {k for k, v in counts.items() if k and v > 1}
-
-    # chequear existentes en DB
-    existing_isbns = set(LibroFicha.objects.filter(isbn__in=[i for i in input_isbns if i]).values_list('isbn', flat=True))
-
-    for idx, row in enumerate(rows, start=1):
-        try:
-            # simple checks
-            isbn = str(row.get('isbn') or '').strip()
-            titulo = str(row.get('titulo') or '').strip()
-            if not isbn or not titulo:
-                raise ValueError('isbn/titulo obligatorios')
-            if isbn in duplicates_in_file:
-                raise ValueError('ISBN duplicado dentro del archivo')
-            if isbn in existing_isbns:
-                raise ValueError('ISBN ya existe en la base de datos')
-
-            editorial = resolve_editorial(row.get('editorial'))
-            if not editorial:
-                raise ValueError('Editorial no encontrada')
-
-            tipo_tapa = resolve_tipo_tapa(row.get('tipo_tapa'))
-            if not tipo_tapa:
-                raise ValueError('Tipo tapa no encontrado')
-
-            # ints
-            try:
-                numero_paginas = int(row.get('numero_paginas'))
-            except Exception:
-                raise ValueError('numero_paginas inválido')
+    if not isinstance(rows, list):
+        return JsonResponse({'ok': False, 'error': 'rows debe ser una lista'}, status=400)
 
-            idioma = resolve_idioma(row.get('idioma_original'))
-            if not idioma:
-                raise ValueError('Idioma original no encontrado')
+    # Validación y escritura en segundo plano (roles/importaciones); aquí solo se encola
+    trabajo = encolar_filas(request.user, modo, rows, simulacion=_es_verdadero(payload.get('simular')))
+    return JsonResponse(estado_importacion(trabajo), status=202)
 
-            try:
-                numero_edicion = int(row.get('numero_edicion'))
-            except Exception:
-                raise ValueError('numero_edicion inválido')
-
-            # fecha
-            fecha_val = row.get('fecha_edicion')
-            fecha = None
-            if isinstance(fecha_val, (int, float)):
-                fecha = excel_date_to_date(fecha_val)
-            elif isinstance(fecha_val, str):
-                try:
-                    fecha = datetime.fromisoformat(fecha_val).date()
-                except Exception:
-                    # try common formats
-                    try:
-                        fecha = datetime.strptime(fecha_val, '%Y-%m-%d').date()
-                    except Exception:
-                        fecha = None
-            elif hasattr(fecha_val, 'year'):
-                fecha = date(fecha_val.year, fecha_val.month, fecha_val.day)
-
-            if not fecha:
-                raise ValueError('fecha_edicion inválida')
-
-            pais = resolve_pais(row.get('pais_edicion'))
-            if not pais:
-                raise ValueError('Pais edición no encontrado')
-
-            # comerciales
-            try:
-                precio = Decimal(str(row.get('precio')))
-            except Exception:
-                raise ValueError('precio inválido')
 
-            moneda = resolve_moneda(row.get('moneda'))
-            if not moneda:
-                raise ValueError('Moneda no encontrada')
+# -----------------------------------------------------------
+# API DE INGESTA NDJSON (integradores, autenticados con TokenIntegracion)
+# -----------------------------------------------------------
 
-            try:
-                descuento = Decimal(str(row.get('descuento_distribuidor') or '0'))
-            except Exception:
-                raise ValueError('descuento_distribuidor inválido')
-
-            # preparar datos limpios para crear
-            clean = {
-                'isbn': isbn,
-                'titulo': titulo,
-                'ean': row.get('ean') or None,
-                'editorial': editorial,
-                'autor': row.get('autor') or '',
-                'autor_prologo': row.get('autor_prologo') or None,
-                'traductor': row.get('traductor') or None,
-                'ilustrador': row.get('ilustrador') or None,
-                'tipo_tapa': tipo_tapa,
-                'numero_paginas': numero_paginas,
-                'alto_cm': row.get('alto_cm') or None,
-                'ancho_cm': row.get('ancho_cm') or None,
-                'grosor_cm': row.get('grosor_cm') or None,
-                'peso_gr': row.get('peso_gr') or None,
-                'idioma_original': idioma,
-                'numero_edicion': numero_edicion,
-                'fecha_edicion': fecha,
-                'pais_edicion': pais,
-                'numero_impresion': row.get('numero_impresion') or None,
-                'tematica': row.get('tematica') or None,
-                'precio': precio,
-                'moneda': moneda,
-                'descuento_distribuidor': descuento,
-                'resumen_libro': row.get('resumen_libro') or '',
-                'codigo_imagen': row.get('codigo_imagen') or None,
-                'rango_etario': row.get('rango_etario') or None,
-                'subtitulo': row.get('subtitulo') or None,
-            }
-
-            validated.append((idx, clean, row))
+@csrf_exempt  # no usa la sesión ni cookies: se autentica con el header Authorization
+def ingesta_fichas(request):
+    """
+    POST de fichas en NDJSON (opcionalmente gzip) desde sistemas externos.
+    Valida y escribe de a lotes mientras lee el cuerpo y responde en NDJSON
+    un resultado por lote (ver roles/ingesta.py). ?modo=crear|actualizar.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'error': 'POST required'}, status=405)
 
-        except Exception as e:
-            # Map some internal messages to user-friendly messages
-            raw_msg = str(e)
-            if 'ISBN ya existe' in raw_msg:
-                client_msg = 'Ese ISBN ya existe'
-            else:
-                client_msg = raw_msg
+    user = autenticar(request)
+    if user is None:
+        resp = JsonResponse({'ok': False, 'error': 'Token de integración inválido'}, status=401)
+        resp['WWW-Authenticate'] = 'Bearer'
+        return resp
+    auth = get_auth_context(user)
+    if not auth.is_editor:
+        return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
 
-            # Log full details server-side (stack/row) but don't expose row_data to the client
-            try:
-                logger.error("Carga masiva - fila %s: %s ; datos: %s", idx, raw_msg, row)
-            except Exception:
-                # fallback to simple print if logging misconfigured
-                print(f"Carga masiva - fila {idx}: {raw_msg} ; datos: {row}")
+    modo = request.GET.get('modo') or MODO_CREAR
+    if modo not in MODOS:
+        return JsonResponse({'ok': False, 'error': 'Modo de carga inválido'}, status=400)
 
-            failed.append({'row': idx, 'error': client_msg})
+    resp = StreamingHttpResponse(
+        respuesta_ingesta(flujo_entrada(request), modo, auth.editorial_ids),
+        content_type='application/x-ndjson; charset=utf-8',
+    )
+    resp['Cache-Control'] = 'no-cache'
+    resp['X-Accel-Buffering'] = 'no'  # que nginx no junte los lotes
+    return resp
 
-    # Si hubo fallos en validación, retornamos sin insertar nada
-    if failed:
-        return JsonResponse({'ok': False, 'created': 0, 'failed': len(failed), 'errors': failed}, status=400)
 
-    # --- 2) CREAR todos los registros en bloque dentro de una transacción ---
-    from django.db import transaction
-    instances = []
-    for idx, clean, orig_row in validated:
-        instances.append(LibroFicha(**clean))
+# -----------------------------------------------------------
+# CARGA MASIVA POR FRAGMENTOS (sesión -> fragmentos -> finalizar)
+# -----------------------------------------------------------
 
+def _json_body(request):
+    import json
     try:
-        with transaction.atomic():
-            LibroFicha.objects.bulk_create(instances)
-        created = len(instances)
-    except Exception as e:
-        # error inesperado al insertar: loggear detalles y retornar mensaje genérico al cliente
-        try:
-            logger.exception("Error al insertar cargas masivas: %s", e)
-        except Exception:
-            print("Error al insertar cargas masivas:", e)
-        return JsonResponse({'ok': False, 'created': 0, 'failed': len(instances), 'errors': [{'row': None, 'error': 'Error interno al crear registros. Contacte al administrador.'}]}, status=500)
+        return json.loads(request.body.decode('utf-8') or '{}')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
 
-    return JsonResponse({'ok': True, 'created': created, 'failed': len(failed), 'errors': failed})
+def _solo_editor(view):
+    def wrapper(request, *args, **kwargs):
+        if _role(request.user) != Profile.ROLE_EDITOR:
+            return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
+        return view(request, *args, **kwargs)
+    return login_required(wrapper)
+
+
+@_solo_editor
+def carga_crear(request):
+    """POST { modo } -> 201 con la sesión nueva."""
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'error': 'POST required'}, status=405)
+    payload = _json_body(request)
+    if payload is None:
+        return JsonResponse({'ok': False, 'error': 'JSON inválido'}, status=400)
+    modo = payload.get('modo') or MODO_CREAR
+    if modo not in MODOS:
+        return JsonResponse({'ok': False, 'error': 'Modo de carga inválido'}, status=400)
+
+    purgar_sesiones()
+    sesion = SesionCarga.objects.create(usuario=request.user, modo=modo)
+    return JsonResponse(estado_sesion(sesion), status=201)
+
+
+@_solo_editor
+def carga_estado(request, pk):
+    """GET: fragmentos recibidos y último confirmado (para retomar)."""
+    sesion = get_object_or_404(SesionCarga, pk=pk, usuario=request.user)
+    return JsonResponse(estado_sesion(sesion))
+
+
+@_solo_editor
+def carga_fragmento(request, pk, numero):
+    """PUT/POST { rows: [...] } -> estado de validación del fragmento."""
+    if request.method not in ('PUT', 'POST'):
+        return JsonResponse({'ok': False, 'error': 'PUT required'}, status=405)
+    sesion = get_object_or_404(SesionCarga, pk=pk, usuario=request.user)
+    if sesion.estado != SesionCarga.ESTADO_ABIERTA:
+        return JsonResponse({'ok': False, 'error': 'La carga ya no admite fragmentos'}, status=409)
+    payload = _json_body(request)
+    rows = payload.get('rows') if isinstance(payload, dict) else None
+    if not isinstance(rows, list) or not numero:
+        return JsonResponse({'ok': False, 'error': 'JSON inválido'}, status=400)
+    if len(rows) > MAX_FILAS_FRAGMENTO:
+        return JsonResponse({'ok': False, 'error': f'Máximo {MAX_FILAS_FRAGMENTO} filas por fragmento'}, status=413)
+
+    fragmento = guardar_fragmento(sesion, numero, rows, get_auth_context(request.user).editorial_ids)
+    return JsonResponse({
+        'ok': fragmento.valido,
+        'numero': fragmento.numero,
+        'filas': fragmento.n_filas,
+        'valido': fragmento.valido,
+        'errors': errores_fragmento(fragmento),
+    })
+
+
+@_solo_editor
+def carga_finalizar(request, pk):
+    """
+    POST { total } -> 202 con el trabajo que importa la sesión en segundo
+    plano (mismo estado que upload_fichas_json; se consulta en url_estado).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'error': 'POST required'}, status=405)
+    sesion = get_object_or_404(SesionCarga, pk=pk, usuario=request.user)
+    payload = _json_body(request) or {}
+    try:
+        total = int(payload.get('total') or 0) or None
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'total inválido'}, status=400)
+
+    try:
+        trabajo = encolar_sesion(request.user, sesion, total)
+    except CargaIncompleta as e:
+        return JsonResponse({'ok': False, 'error': str(e), **estado_sesion(sesion)}, status=409)
+    return JsonResponse(estado_importacion(trabajo), status=202)
+
+
+# -----------------------------------------------------------
+# LISTAS DE PRECIOS POR EDITORIAL (ADMIN)
+# -----------------------------------------------------------
+
+@login_required
+def listas_precios(request):
+    """
+    .zip con una lista de precios por editorial (ver roles/listas_precios.py).
+    Si ya está en la caché de exportaciones (sigue vigente hasta que cambien
+    fichas o precios) se descarga; si no, se encola un TrabajoExportacion de
+    tipo LISTAS para `manage.py procesar_exportaciones` y se responde 202 con
+    la URL de estado (static/js/listas_precios.js la consulta).
+    """
+    if _role(request.user) != Profile.ROLE_ADMIN:
+        return HttpResponse("No autorizado", status=403)
+    formato = request.GET.get("formato", "xlsx")
+    if formato not in LISTAS_FORMATOS:
+        return HttpResponse("Formato no soportado", status=400)
+
+    ruta = buscar_en_cache(firma_listas(formato), "zip")
+    if ruta is not None:
+        return respuesta_listas(ruta, formato)
+    return JsonResponse(estado_json(encolar_listas(request.user, formato)), status=202)
 
 
 # -----------------------------------------------------------
@@ -1105,8 +1124,7 @@ class EditorialesListarView(LoginRequiredMixin, UserPassesTestMixin, ListView):
     paginate_by = 10
 
     def test_func(self):
-        perfil = getattr(self.request.user, "profile", None)
-        return getattr(perfil, "role", None) == Profile.ROLE_ADMIN
+        return _role(self.request.user) == Profile.ROLE_ADMIN
 
     def get_queryset(self):
         q_nombre   = (self.request.GET.get("q_nombre")   or "").strip()
@@ -1124,7 +1142,7 @@ class EditorialesListarView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         qs = Editorial.objects.prefetch_related(prefetch_usuarios_activos).order_by("nombre")
 
         if q_nombre:
-            qs = qs.filter(nombre__icontains=q_nombre)
+            qs = qs.filter(nombre_busqueda__startswith=plegar_texto(q_nombre))  # prefijo: usa el índice
         if q_idfiscal:
             qs = qs.filter(id_fiscal__icontains=q_idfiscal)
 
@@ -1161,8 +1179,7 @@ class EditarEditorialView(LoginRequiredMixin, UserPassesTestMixin, View):
     """
 
     def test_func(self):
-        perfil = getattr(self.request.user, "profile", None)
-        return getattr(perfil, "role", None) == Profile.ROLE_ADMIN
+        return _role(self.request.user) == Profile.ROLE_ADMIN
 
     def post(self, request, editorial_id: int):
         editorial = get_object_or_404(Editorial, pk=editorial_id)
@@ -1190,7 +1207,13 @@ class EditarEditorialView(LoginRequiredMixin, UserPassesTestMixin, View):
         if not form.is_valid():
             return JsonResponse({"ok": False, "errors": form.errors}, status=400)
 
-        form.save()
+        # Junto con el recálculo: la versión "precios" (post_save de Editorial)
+        # se incrementa al confirmar, ya con los precios nuevos
+        with transaction.atomic():
+            form.save()
+            if set(form.changed_data) & set(RECARGOS):
+                # Solo las fichas de esta editorial, en un UPDATE por conjuntos
+                recalcular_precios(LibroFicha.objects.filter(editorial=editorial))
         return JsonResponse({"ok": True})
     
 
@@ -1206,9 +1229,8 @@ class ToggleEditorialEstadoView(LoginRequiredMixin, UserPassesTestMixin, View):
     Respuesta: { ok: True, nuevo_estado: bool }
     """
     def test_func(self):
-        perfil = getattr(self.request.user, "profile", None)
         # Ajusta si tu app usa otro método para validar admin
-        return getattr(perfil, "role", None) == Profile.ROLE_ADMIN
+        return _role(self.request.user) == Profile.ROLE_ADMIN
 
     def post(self, request, editorial_id: int):
         ed = get_object_or_404(Editorial, pk=editorial_id)
@@ -0,0 +1,52 @@
+// Autocompletado de los buscadores del panel.
+// Cada <input data-autocompletar-url="..." data-autocompletar-tipos="titulo,autor">
+// recibe un <datalist> que se llena con las sugerencias del endpoint
+// catalogo:autocompletar mientras el usuario escribe.
+document.addEventListener('DOMContentLoaded', function () {
+  const ESPERA_MS = 150;   // debounce entre teclas
+  const MIN_CHARS = 2;
+
+  document.querySelectorAll('input[data-autocompletar-url]').forEach((input, n) => {
+    const url   = input.dataset.autocompletarUrl;
+    const tipos = input.dataset.autocompletarTipos || '';
+
+    const lista = document.createElement('datalist');
+    lista.id = `autocompletar-${input.name || n}`;
+    input.after(lista);
+    input.setAttribute('list', lista.id);
+    input.setAttribute('autocomplete', 'off');
+
+    let timer = null;
+    let ultimo = '';
+    let ctrl = null;  // AbortController de la petición en curso
+
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      const q = input.value.trim();
+      if (q.length < MIN_CHARS || q === ultimo) return;
+
+      timer = setTimeout(async () => {
+        ultimo = q;
+        if (ctrl) ctrl.abort();
+        ctrl = new AbortController();
+        try {
+          const params = new URLSearchParams({ q, tipos });
+          const resp = await fetch(`${url}?${params}`, {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' },
+            signal: ctrl.signal,
+          });
+          if (!resp.ok) return;
+          const data = await resp.json();
+          lista.replaceChildren(...data.resultados.map(r => {
+            const opt = document.createElement('option');
+            opt.value = r.valor;
+            opt.label = r.tipo;
+            return opt;
+          }));
+        } catch (e) {
+          if (e.name !== 'AbortError') console.warn('Autocompletar:', e);
+        }
+      }, ESPERA_MS);
+    });
+  });
+});
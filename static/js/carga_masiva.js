@@ -5,8 +5,11 @@ document.addEventListener('DOMContentLoaded', function () {
   const btnEnviar = $('#btnEnviarCarga');
   const filenameEl = $('#cargaMasivaFilename');
   const erroresEl = $('#cargaMasivaErrors');
+  const actualizarEl = $('#cargaMasivaActualizar');
 
-  let parsedRows = null; // array of objects
+  let archivo = null; // plantilla .xlsx seleccionada (se procesa en el servidor)
+  let token = null;   // simulación validada a la espera de confirmación
+  const textoEnviar = btnEnviar ? btnEnviar.textContent : 'Enviar';
 
   if (!fileInput || !btnCargar || !btnEnviar) return;
 
@@ -29,150 +32,169 @@ document.addEventListener('DOMContentLoaded', function () {
     fileInput.click();
   });
 
-  fileInput.addEventListener('change', async (ev) => {
+  function olvidarSimulacion() {
+    token = null;
+    btnEnviar.textContent = textoEnviar;
+  }
+
+  fileInput.addEventListener('change', (ev) => {
     erroresEl.textContent = '';
-    parsedRows = null;
+    archivo = null;
+    olvidarSimulacion();
     btnEnviar.disabled = true;
     const f = ev.target.files && ev.target.files[0];
     if (!f) return;
     filenameEl.textContent = `Archivo: ${f.name}`;
 
-    try {
-      const data = await f.arrayBuffer();
-      const workbook = XLSX.read(data, { type: 'array' });
-      const sheetName = workbook.SheetNames[0];
-      const ws = workbook.Sheets[sheetName];
-      const rawRows = XLSX.utils.sheet_to_json(ws, { defval: null });
-
-      // Excel header examples (mayúsculas/espacios) -> claves internas en snake_case minúsculas
-      const headerMap = {
-        'isbn': 'isbn', 'ean': 'ean', 'editorial': 'editorial', 'titulo': 'titulo', 'subtitulo': 'subtitulo', 'autor': 'autor', 'autor prologo': 'autor_prologo', 'autor_prologo': 'autor_prologo', 'traductor': 'traductor', 'ilustrador': 'ilustrador', 'tipo tapa': 'tipo_tapa', 'tipo_tapa': 'tipo_tapa', 'numero paginas': 'numero_paginas', 'numero_paginas': 'numero_paginas', 'alto cm': 'alto_cm', 'alto_cm': 'alto_cm', 'ancho cm': 'ancho_cm', 'ancho_cm': 'ancho_cm', 'grosor cm': 'grosor_cm', 'grosor_cm': 'grosor_cm', 'peso gr': 'peso_gr', 'peso_gr': 'peso_gr', 'idioma original': 'idioma_original', 'idioma_original': 'idioma_original', 'numero edicion': 'numero_edicion', 'numero_edicion': 'numero_edicion', 'fecha edicion': 'fecha_edicion', 'fecha_edicion': 'fecha_edicion', 'pais edicion': 'pais_edicion', 'pais_edicion': 'pais_edicion', 'numero impresion': 'numero_impresion', 'numero_impresion': 'numero_impresion', 'tematica': 'tematica', 'precio': 'precio', 'moneda': 'moneda', 'descuento distribuidor': 'descuento_distribuidor', 'descuento_distribuidor': 'descuento_distribuidor', 'resumen libro': 'resumen_libro', 'resumen_libro': 'resumen_libro', 'rango etario': 'rango_etario', 'rango_etario': 'rango_etario'
-      };
-
-      if (!rawRows || !rawRows.length) {
-        erroresEl.classList.remove('text-success');
-        erroresEl.classList.add('text-danger');
-        erroresEl.textContent = 'La hoja seleccionada está vacía.';
-        try { fileInput.value = ''; } catch (e) { fileInput.value = null; }
-        return;
-      }
+    // El archivo se lee y valida en el servidor (en streaming), no en el navegador
+    if (!/\.xlsx$/i.test(f.name)) {
+      erroresEl.classList.remove('text-success');
+      erroresEl.classList.add('text-danger');
+      erroresEl.textContent = 'Suba la plantilla en formato .xlsx';
+      try { fileInput.value = ''; } catch (e) { fileInput.value = null; }
+      return;
+    }
 
-      // Construir filas normalizadas
-      const normRows = rawRows.map((r, idx) => {
-        const out = {};
-        Object.entries(r).forEach(([k, v]) => {
-          const key = (k || '').toString().trim().toLowerCase();
-          const mapped = headerMap[key] || key.replace(/\s+/g, '_');
-          out[mapped] = v;
-        });
-        out._row = idx + 2; // header in row 1
-        return out;
-      });
+    archivo = f;
+    erroresEl.classList.remove('text-danger');
+    erroresEl.classList.add('text-success');
+    erroresEl.textContent = 'Archivo listo. Presione Enviar para validarlo (todavía no se guarda nada).';
+    btnEnviar.disabled = false;
+  });
 
-      // Validación por fila usando validadores reutilizables
-      const clientValidator = window.LibroValidators && window.LibroValidators.validateRow;
-      const errors = [];
-      for (const row of normRows) {
-        if (clientValidator) {
-          const res = clientValidator(row);
-          if (!res.ok) {
-            errors.push(`Fila ${row._row}: ${Object.entries(res.errors).map(([k,v])=>`${k}: ${v}`).join('; ')}`);
-          }
-        } else {
-          // fallback básico
-          if (!row.isbn) errors.push(`Fila ${row._row}: ISBN vacío`);
-          if (!row.titulo) errors.push(`Fila ${row._row}: titulo vacío`);
-        }
-      }
+  const ESPERA_MS = 1000;  // entre consultas del estado de la importación
+
+  function marcar(ok) {
+    erroresEl.classList.remove(ok ? 'text-danger' : 'text-success');
+    erroresEl.classList.add(ok ? 'text-success' : 'text-danger');
+  }
+
+  function listarErrores(errors) {
+    if (!errors || !Array.isArray(errors)) return '';
+    return errors.map(e => `Fila ${e.row || '?'}: ${e.error || 'Error'}`).join('\n');
+  }
+
+  function mostrarError(data, status) {
+    // Mostrar solo mensajes amigables al usuario (no exponer datos internos)
+    marcar(false);
+    if (data && data.errors && Array.isArray(data.errors) && data.errors.length) {
+      erroresEl.textContent = listarErrores(data.errors);
+    } else if (data && data.error) {
+      erroresEl.textContent = data.error;
+    } else {
+      erroresEl.textContent = `Error: ${status}`;
+    }
+  }
 
-      if (errors.length) {
-        erroresEl.classList.remove('text-success');
-        erroresEl.classList.add('text-danger');
-        erroresEl.textContent = errors.join('\n');
-        try { fileInput.value = ''; } catch (e) { fileInput.value = null; }
+  function mostrarAvance(estado) {
+    erroresEl.classList.remove('text-danger', 'text-success');
+    if (estado.estado === 'PENDIENTE') {
+      if (estado.sin_worker) {
+        // Nadie la ha tomado en IMPORT_SIN_WORKER_SEGUNDOS: se sigue consultando por si arranca
+        marcar(false);
+        erroresEl.textContent = 'La carga sigue en cola y ningún procesador la ha tomado. ' +
+          'Avise al administrador (manage.py procesar_importaciones no está corriendo); ' +
+          'se procesará apenas arranque.';
         return;
       }
+      erroresEl.textContent = 'Carga en cola, esperando al procesador...';
+      return;
+    }
+    const total = estado.total != null ? ` de ${estado.total}` : '';
+    let txt = `Procesando (${estado.porcentaje}%). Validadas: ${estado.validadas}${total}. ` +
+              `Insertadas: ${estado.insertadas}. Fallidas: ${estado.fallidas}.`;
+    const errores = listarErrores(estado.errors);
+    if (errores) txt += `\n${errores}`;
+    erroresEl.textContent = txt;
+  }
+
+  function mostrarResultado(data) {
+    if (!data.ok) {
+      mostrarError(data, 400);
+      btnEnviar.disabled = false;
+      return;
+    }
+    marcar(true);
+    let resumen = `Carga finalizada. Registros creados: ${data.created || 0}.`;
+    if (data.updated || data.unchanged) {
+      resumen += ` Actualizados: ${data.updated || 0}. Sin cambios: ${data.unchanged || 0}.`;
+    }
+    erroresEl.textContent = resumen;
+    setTimeout(() => window.location.reload(), 900);
+  }
 
-  parsedRows = normRows;
-  erroresEl.classList.remove('text-danger');
-  erroresEl.classList.add('text-success');
-  erroresEl.textContent = `Validación OK: ${parsedRows.length} filas detectadas. Puede presionar Enviar.`;
-  btnEnviar.disabled = false;
-  // Limpiamos el input para permitir re-seleccionar el mismo archivo si el usuario lo desea
-  try { fileInput.value = ''; } catch (e) { fileInput.value = null; }
+  function mostrarSimulacion(estado) {
+    const r = estado.resultado || {};
+    let txt = `Validación lista. Nuevas: ${r.nuevas || 0}. Existentes: ${r.existentes || 0}. ` +
+              `Duplicadas: ${r.duplicadas || 0}. Inválidas: ${r.invalidas || 0}.`;
+    const errores = listarErrores(r.errors);
+    if (errores) txt += `\n${errores}`;
+    if (estado.token) {
+      token = estado.token;
+      txt += r.failed
+        ? '\nPuede corregir el archivo y volver a cargarlo, o confirmar solo las filas válidas.'
+        : '\nPresione Confirmar carga para guardar las fichas.';
+      btnEnviar.textContent = 'Confirmar carga';
+    }
+    btnEnviar.disabled = false;
+    marcar(!r.failed);
+    erroresEl.textContent = txt;
+  }
 
-    } catch (e) {
-      erroresEl.textContent = `Error al leer archivo: ${e.message || e}`;
+  async function seguirImportacion(estado) {
+    while (estado.estado === 'PENDIENTE' || estado.estado === 'PROCESANDO') {
+      mostrarAvance(estado);
+      await new Promise(r => setTimeout(r, ESPERA_MS));
+      const resp = await fetch(estado.url_estado, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+      if (!resp.ok) throw new Error(`estado ${resp.status}`);
+      estado = await resp.json();
     }
-  });
+    if (estado.estado === 'ERROR') {
+      mostrarError(estado, 500);
+      btnEnviar.disabled = false;
+      return;
+    }
+    if (estado.simulacion) {
+      mostrarSimulacion(estado);
+      return;
+    }
+    mostrarResultado(estado.resultado || {});
+  }
+
+  if (actualizarEl) actualizarEl.addEventListener('change', olvidarSimulacion);
 
   btnEnviar.addEventListener('click', async () => {
-    if (!parsedRows) return;
+    if (!archivo) return;
     btnEnviar.disabled = true;
-    erroresEl.textContent = 'Enviando...';
+    erroresEl.classList.remove('text-danger', 'text-success');
+    erroresEl.textContent = token ? 'Confirmando carga...' : 'Enviando archivo...';
     try {
-  const url = (window.UPLOAD_JSON_URL || '/panel/editor/fichas/upload-json/');
-  console.log(">>> upload_fichas_json called");
+      const url = (window.UPLOAD_XLSX_URL || '/panel/editor/fichas/cargar/');
+      const body = new FormData();
+      if (token) {
+        // Confirmar: el servidor inserta lo ya validado, sin volver a subir el archivo
+        body.append('token', token);
+        olvidarSimulacion();
+      } else {
+        body.append('archivo', archivo);
+        body.append('modo', actualizarEl && actualizarEl.checked ? 'actualizar' : 'crear');
+        body.append('simular', '1');
+      }
       const resp = await fetch(url, {
         method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-CSRFToken': getCSRF(),
-        },
-        body: JSON.stringify({ rows: parsedRows.map(r => {
-          // eliminar clave interna
-          const copy = { ...r };
-          delete copy._row;
-          return copy;
-        }) })
+        headers: { 'X-CSRFToken': getCSRF() },
+        body,
       });
 
       const data = await resp.json();
       if (!resp.ok) {
-        // Mostrar solo mensajes amigables al usuario (no exponer datos internos)
-        if (data && data.errors && Array.isArray(data.errors)) {
-          erroresEl.classList.remove('text-success');
-          erroresEl.classList.add('text-danger');
-          erroresEl.textContent = data.errors.map(e => `Fila ${e.row || '?'}: ${e.error || 'Error'}`).join('\n');
-        } else if (data && data.error) {
-          erroresEl.classList.remove('text-success');
-          erroresEl.classList.add('text-danger');
-          erroresEl.textContent = data.error;
-        } else {
-          erroresEl.classList.remove('text-success');
-          erroresEl.classList.add('text-danger');
-          erroresEl.textContent = `Error: ${resp.status}`;
-        }
-        btnEnviar.disabled = false;
-        return;
-      }
-
-      if (!data.ok) {
-        erroresEl.textContent = data.errors ? JSON.stringify(data.errors, null, 2) : 'Error desconocido';
+        mostrarError(data, resp.status);
         btnEnviar.disabled = false;
         return;
       }
 
-      // Mostrar resumen y errores detallados (si los hay)
-      const created = data.created || 0;
-      const failed = data.failed || 0;
-      if (failed > 0) {
-        erroresEl.classList.remove('text-success');
-        erroresEl.classList.add('text-danger');
-        let txt = `Carga parcial. Creados: ${created}. Fallidos: ${failed}\n`;
-        if (data.errors && Array.isArray(data.errors)) {
-          txt += data.errors.map(e => `Fila ${e.row || '?'}: ${e.error || 'Error'}`).join('\n');
-        }
-        erroresEl.textContent = txt;
-        btnEnviar.disabled = false;
-        return; // no recargar
-      }
-
-      // Todo OK
-      erroresEl.classList.remove('text-danger');
-      erroresEl.classList.add('text-success');
-      erroresEl.textContent = `Carga finalizada. Registros creados: ${created}.`;
-      setTimeout(() => window.location.reload(), 900);
+      // 202: la carga quedó encolada; se consulta el avance hasta que termine
+      await seguirImportacion(data);
     } catch (e) {
       erroresEl.textContent = `Error de red: ${e}`;
       btnEnviar.disabled = false;
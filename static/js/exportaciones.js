@@ -0,0 +1,63 @@
+// Exportación en segundo plano desde el panel.
+// Si en el menú de descarga se marca "Generar en segundo plano", el formulario
+// #form-export no navega: se encola el trabajo, se consulta su estado cada
+// pocos segundos y al terminar se muestra el link de descarga.
+document.addEventListener('DOMContentLoaded', function () {
+  const form   = document.getElementById('form-export');
+  const estado = document.getElementById('export-estado');
+  const check  = document.getElementById('export-segundo-plano');
+  if (!form || !estado || !check) return;
+
+  const INTERVALO_MS = 2000;
+
+  function mostrar (html) {
+    estado.innerHTML = html;
+    estado.classList.remove('d-none');
+  }
+
+  function pintar (data) {
+    if (data.estado === 'LISTO') {
+      mostrar(`Tu exportación está lista. <a class="fw-semibold" href="${data.url_descarga}">Descargar archivo</a>
+               <span class="text-muted">(el link vence en un rato)</span>`);
+      return true;
+    }
+    if (data.estado === 'ERROR') {
+      mostrar(`<span class="text-danger">La exportación falló${data.error ? ': ' + data.error : ''}.</span>`);
+      return true;
+    }
+    const total = data.total ? ` de ${data.total}` : '';
+    mostrar(`Generando exportación… ${data.procesadas}${total} filas
+      <div class="progress mt-2" style="height:6px;">
+        <div class="progress-bar" role="progressbar" style="width:${data.porcentaje}%"></div>
+      </div>`);
+    return false;
+  }
+
+  async function consultar (url) {
+    try {
+      const resp = await fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+      if (!resp.ok) throw new Error(resp.status);
+      if (!pintar(await resp.json())) setTimeout(() => consultar(url), INTERVALO_MS);
+    } catch (e) {
+      mostrar('<span class="text-danger">No se pudo consultar el estado de la exportación.</span>');
+    }
+  }
+
+  form.addEventListener('submit', async (ev) => {
+    if (!check.checked) return;  // descarga directa de siempre
+    ev.preventDefault();
+
+    const params = new URLSearchParams(new FormData(form, ev.submitter));
+    mostrar('Encolando exportación…');
+    try {
+      const resp = await fetch(`${form.getAttribute('action') || window.location.pathname}?${params}`, {
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+      });
+      if (!resp.ok) throw new Error(resp.status);
+      const data = await resp.json();
+      if (!pintar(data)) setTimeout(() => consultar(data.url_estado), INTERVALO_MS);
+    } catch (e) {
+      mostrar('<span class="text-danger">No se pudo encolar la exportación.</span>');
+    }
+  });
+});
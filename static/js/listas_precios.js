@@ -0,0 +1,66 @@
+// Listas de precios por editorial (mantenedor de editoriales, ADMIN).
+// Si el .zip ya está en la caché la vista lo entrega al tiro; si no, encola
+// su generación (202 con la URL de estado), se consulta el estado cada pocos
+// segundos y al terminar se descarga con el link firmado.
+document.addEventListener('DOMContentLoaded', function () {
+  const estado = document.getElementById('listas-estado');
+  const links  = document.querySelectorAll('a[data-listas-precios]');
+  if (!estado || !links.length) return;
+
+  const INTERVALO_MS = 2000;
+
+  function mostrar (html) {
+    estado.innerHTML = html;
+    estado.classList.remove('d-none');
+  }
+
+  function pintar (data) {
+    if (data.estado === 'LISTO') {
+      mostrar('Listas de precios generadas; descargando…');
+      window.location.href = data.url_descarga;
+      return true;
+    }
+    if (data.estado === 'ERROR') {
+      mostrar(`<span class="text-danger">No se pudieron generar las listas${data.error ? ': ' + data.error : ''}.</span>`);
+      return true;
+    }
+    mostrar('Generando listas de precios… <span class="spinner-border spinner-border-sm" role="status"></span>');
+    return false;
+  }
+
+  async function consultar (url) {
+    try {
+      const resp = await fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+      if (!resp.ok) throw new Error(resp.status);
+      if (!pintar(await resp.json())) setTimeout(() => consultar(url), INTERVALO_MS);
+    } catch (e) {
+      mostrar('<span class="text-danger">No se pudo consultar el estado de las listas.</span>');
+    }
+  }
+
+  links.forEach((link) => link.addEventListener('click', async (ev) => {
+    ev.preventDefault();
+    mostrar('Solicitando listas de precios…');
+    try {
+      const resp = await fetch(link.href, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+      if (resp.status === 202) {
+        const data = await resp.json();
+        if (!pintar(data)) setTimeout(() => consultar(data.url_estado), INTERVALO_MS);
+        return;
+      }
+      if (!resp.ok) throw new Error(resp.status);
+      // Ya estaba en la caché: la respuesta es el .zip
+      const url = URL.createObjectURL(await resp.blob());
+      const a = document.createElement('a');
+      a.href = url;
+      a.download = link.dataset.listasPrecios;
+      document.body.appendChild(a);
+      a.click();
+      a.remove();
+      URL.revokeObjectURL(url);
+      estado.classList.add('d-none');
+    } catch (e) {
+      mostrar('<span class="text-danger">No se pudieron solicitar las listas de precios.</span>');
+    }
+  }));
+});
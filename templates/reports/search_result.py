@@ -1,7 +1,11 @@
 # views.py
-from django.http import HttpResponse
+import csv
+import itertools
+
+from django.http import StreamingHttpResponse
 from openpyxl import Workbook
-from openpyxl.styles import Border, Side, PatternFill, Font, Alignment
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Border, Side, PatternFill, Font, Alignment, NamedStyle
 from datetime import date, datetime
 from decimal import Decimal
 from openpyxl.utils import get_column_letter
@@ -10,6 +14,13 @@ from openpyxl.utils import get_column_letter
 # Excluir campos internos del export (p. ej. id, nombre de fichero de imagen)
 EXCLUDE_KEYS = {"id", "codigo_imagen"}
 
+# Filas que se miran para estimar el ancho de columnas en la planilla
+MUESTRA_ANCHOS = 500
+ANCHO_MAX = 50
+
+ESTILO_ENCABEZADO = "encabezado"
+ESTILO_CELDA = "celda"
+
 
 def _format_value(v):
     if v is None:
@@ -31,82 +42,104 @@ def _format_value(v):
     return v
 
 
-def exportar_excel(data):
-    # data: lista de dicts (por ejemplo resultado de queryset.values())
-    # Si no hay datos, devolvemos un excel vacío con encabezado genérico
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Resultado de la búsqueda"
+def _encabezado(k):
+    # Prettify header names: replace __ or . with space and title-case
+    return k.replace("__", " ").replace('.', ' ').replace('_', ' ').title()
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, value):
+        return value
 
-    # Determinar keys/headers dinámicamente a partir del primer registro
-    if data and isinstance(data, (list, tuple)) and len(data) > 0 and isinstance(data[0], dict):
-        keys = [k for k in list(data[0].keys()) if k not in EXCLUDE_KEYS]
-        # Prettify header names: replace __ or . with space and title-case
-        headers = [k.replace("__", " ").replace('.', ' ').replace('_', ' ').title() for k in keys]
-    else:
-        # si no hay dicts, exportamos en una sola columna textual
-        keys = None
-        headers = ["Resultado"]
 
-    # Nombres de columnas
-    ws.append(headers)
+def lineas_csv(keys, filas):
+    """
+    Genera el CSV línea a línea: keys son las columnas y filas un iterable
+    de tuplas en ese orden (p. ej. un generador sobre la BD).
+    Mismos encabezados y formato de valores que la planilla.
+    """
+    posiciones = [i for i, k in enumerate(keys) if k not in EXCLUDE_KEYS]
+    # Separador ';' y BOM: así Excel con configuración regional es-CL lo abre en columnas
+    writer = csv.writer(_Eco(), delimiter=";")
+    yield "\ufeff" + writer.writerow([_encabezado(keys[i]) for i in posiciones])
+    for fila in filas:
+        yield writer.writerow([_format_value(fila[i]) for i in posiciones])
+
+
+def escribir_csv(ruta, keys, filas) -> None:
+    """Mismo CSV que lineas_csv, pero a un archivo (exportaciones en segundo plano)."""
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        f.writelines(lineas_csv(keys, filas))
+
+
+def respuesta_csv(lineas, filename="resultado_busqueda.csv"):
+    """Envía un iterable de líneas CSV (p. ej. lineas_csv) en streaming."""
+    response = StreamingHttpResponse(lineas, content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
 
-    # Estilos
+def escribir_xlsx(destino, keys, filas) -> None:
+    """
+    Planilla en modo write-only: cada fila se escribe una vez y no queda en
+    memoria. keys son las columnas y filas un iterable de tuplas en ese orden;
+    destino es una ruta o un archivo binario abierto.
+
+    El ancho de columnas se debe fijar antes de la primera fila, así que se
+    estima con las primeras MUESTRA_ANCHOS filas (que se guardan un momento y
+    luego se escriben).
+    """
+    posiciones = [i for i, k in enumerate(keys) if k not in EXCLUDE_KEYS]
+    headers = [_encabezado(keys[i]) for i in posiciones] if posiciones else ["Resultado"]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Resultado de la búsqueda")
+
+    # Estilos como NamedStyle: asignarlos por nombre evita que openpyxl
+    # vuelva a hashear Border/Fill/Font en cada celda (era la mayor parte del tiempo)
     thin_side = Side(border_style="thin", color="000000")
     thin_border = Border(left=thin_side, right=thin_side, top=thin_side, bottom=thin_side)
-    header_fill = PatternFill(start_color="7b1e2d", end_color="7b1e2d", fill_type="solid")
-    header_font = Font(color="FFFFFFFF", bold=True)
-    center_align = Alignment(horizontal="center", vertical="center")
-
-    # Filas
-    if keys is None:
-        for item in data:
-            ws.append([_format_value(item)])
-    else:
-        for item in data:
-            row = []
-            for k in keys:
-                # item is a dict; get the value for this key
-                v = item.get(k)
-                row.append(_format_value(v))
-            ws.append(row)
-    # Aplicar estilos: bordes a todas las celdas con información y estilo a encabezados
-    max_row = ws.max_row
-    max_col = ws.max_column
-
-    # Estilizar encabezados (fila 1)
-    for col in range(1, max_col + 1):
-        cell = ws.cell(row=1, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = center_align
-        cell.border = thin_border
-
-    # Aplicar borde negro a celdas que contienen datos (desde fila 2)
-    for row in range(2, max_row + 1):
-        for col in range(1, max_col + 1):
-            cell = ws.cell(row=row, column=col)
+    wb.add_named_style(NamedStyle(
+        name=ESTILO_ENCABEZADO,
+        fill=PatternFill(start_color="7b1e2d", end_color="7b1e2d", fill_type="solid"),
+        font=Font(color="FFFFFFFF", bold=True),
+        alignment=Alignment(horizontal="center", vertical="center"),
+        border=thin_border,
+    ))
+    wb.add_named_style(NamedStyle(name=ESTILO_CELDA, border=thin_border))
+
+    filas = iter(filas)
+    muestra = [[_format_value(fila[i]) for i in posiciones] for fila in itertools.islice(filas, MUESTRA_ANCHOS)]
+
+    # Ancho según el contenido (incluye encabezado), con un límite razonable
+    for col, header in enumerate(headers, start=1):
+        largo = max([len(header)] + [len(str(r[col - 1])) for r in muestra if col - 1 < len(r)])
+        ws.column_dimensions[get_column_letter(col)].width = min(largo + 2, ANCHO_MAX)
+
+    fila_header = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.style = ESTILO_ENCABEZADO
+        fila_header.append(cell)
+    ws.append(fila_header)
+
+    def escribir(valores):
+        fila = []
+        for v in valores:
+            cell = WriteOnlyCell(ws, value=v)
             # solo aplicar borde si hay valor (no vacío)
-            if cell.value not in (None, ""):
-                cell.border = thin_border
-    # Ajustar ancho de columnas según el contenido (incluye encabezado)
-    for col in range(1, max_col + 1):
-        max_length = 0
-        col_letter = get_column_letter(col)
-        for row in range(1, max_row + 1):
-            cell = ws.cell(row=row, column=col)
-            if cell.value is None:
-                continue
-            # contar longitud del texto tal como aparecerá
-            length = len(str(cell.value))
-            if length > max_length:
-                max_length = length
-        # corrección para que no quede muy ajustado y límite máximo razonable
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[col_letter].width = adjusted_width
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = 'attachment; filename="resultado_busqueda.xlsx"'
-    wb.save(response)
-    return response
+            if v not in (None, ""):
+                cell.style = ESTILO_CELDA
+            fila.append(cell)
+        ws.append(fila)
+
+    for valores in muestra:
+        escribir(valores)
+    del muestra
+    for fila in filas:
+        escribir([_format_value(fila[i]) for i in posiciones])
+
+    wb.save(destino)
+